@@ -0,0 +1,41 @@
+"""
+This file is the gunicorn configuration of the multi-process serving mode:
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+The master starts the ingest process (static/py/ingest_owner.py) before the workers, starts it again if it exits and
+stops it on exit. The number of workers and threads comes from the 'serving' settings, see
+config/DASHBOARD_CFG_README.md.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import os
+
+from static.py.ingest_rpc import IngestSupervisor
+from static.py.settings import get_setting
+
+os.environ['DASHBOARD_BACKEND'] = 'remote'
+
+bind = '0.0.0.0:5000'
+certfile = 'certs/cert.pem'
+keyfile = 'certs/key.pem'
+
+# Threaded workers, every open /stream holds a thread.
+worker_class = 'gthread'
+workers = get_setting('serving', 'workers')
+threads = get_setting('serving', 'threads')
+# The app must be imported after the fork: each worker starts its own ring mirror thread.
+preload_app = False
+
+
+def on_starting(server):
+    server.ingest_supervisor = IngestSupervisor().start()
+
+
+def on_exit(server):
+    supervisor = getattr(server, 'ingest_supervisor', None)
+    if supervisor is not None:
+        supervisor.stop()
@@ -7,21 +7,36 @@ Running this file will enable you to interact with the MQTT broker and send down
 """
 Importing the required libraries.
 """
-from flask import Flask, jsonify, request, render_template, send_file, Response, redirect, url_for,session
-import json, os, subprocess, threading, time, signal
+# The startup phases are timed from here, see the end of this file.
+from static.py.log_utils import StartupTimer
+startup_timer = StartupTimer()
+
+from flask import Flask, jsonify, request, render_template, send_file, Response, redirect, url_for,session, stream_with_context
+import json, os, sys, threading, time, signal, atexit, itertools, base64
 import logging
-from paho.mqtt import client as mqtt
 from datetime import datetime
 
-from static.py.mqtt_utils import mqtt_client, on_connect, on_message, message_buffer, send_downlink, sensor_list
+from static.py.settings import get_settings, get_setting
+from static.py.auth_cache import AuthCache
+from static.py.gateway_api import GatewayAPI, GatewayAPIError, GatewayAPIPool
+from static.py.message_export import FORMATS as EXPORT_FORMATS, export_messages, parse_time, select_messages
+from static.py import log_utils
+from static.py.log_utils import configure_logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from static.py.backend import LOCAL, REMOTE, create_backend
+from static.py.ingest_rpc import BackendError, IngestSupervisor
+from static.py.mqtt_utils import message_buffer, message_hub
+
+startup_timer.mark('imports')
 
 """
 Creating the Flask app and setting the template and static directories.
 """
 app = Flask(__name__, template_folder='templates', static_folder='static')
 
-logging.basicConfig(level=logging.INFO)
+configure_logging(get_settings()['logging'])
 logger = logging.getLogger(__name__)
+startup_timer.mark('logging')
 
 """
 instantiate the MQTTHandler class to store the MQTT client and broker IP
@@ -32,11 +47,36 @@ class MQTTHandler:
     def __init__(self):
         self.client = None
         self.broker_ip = None
-        self.upload_buffer = []
 
 
 mqtt_handler = MQTTHandler()
 
+# The MQTT ingest, downlinks and history: in this process, or in the ingest process when served by gunicorn
+# (DASHBOARD_BACKEND=remote, see wsgi.py) or with the 'serving' ingest_process setting.
+backend = create_backend(os.environ.get('DASHBOARD_BACKEND') or
+                         (REMOTE if get_setting('serving', 'ingest_process') else LOCAL))
+
+
+@app.before_request
+def sync_messages():
+    """
+    Copy the messages the ingest process stored since the last request into the message buffer of this
+    process (remote backend only), before the request reads it.
+    """
+    if request.endpoint != 'static':
+        backend.sync()
+
+
+# Keep-alive clients of the local gateway API and of the login hosts.
+gateway_api = GatewayAPI(get_setting('gateway_api', 'host'), get_setting('gateway_api', 'port'),
+                         scheme=get_setting('gateway_api', 'scheme'),
+                         timeout=get_setting('gateway_api', 'timeout'),
+                         pool_size=get_setting('gateway_api', 'pool_size'))
+login_api = GatewayAPIPool(scheme=get_setting('gateway_api', 'login_scheme'),
+                           timeout=get_setting('gateway_api', 'timeout'),
+                           pool_size=get_setting('gateway_api', 'pool_size'))
+
+
 @app.route('/animation_load_page')
 def animation_load_page():
     if 'username' in session:
@@ -48,50 +88,14 @@ def animation_load_page():
 ####################################################################################
 # BT - Function to get the deveui to populate the select - charts and animation.
 ####################################################################################
-def getDevEui():
-
-    ###########################
-    # BT - Get all the deveui.
-    ###########################
-    list_of_deveuis = []
-    excluded_events = {'reset', 'supervisory', 'device_info', 'contact','downlink_ack','link_quality'}
+EXCLUDED_EVENTS = {'reset', 'supervisory', 'device_info', 'contact','downlink_ack','link_quality'}
 
-    for _ in range(message_buffer.qsize()):
-
-        # Get an item from the queue without removing it
-        m = message_buffer.queue[_]  # Accessing the item by index
-        
-        # Check if the necessary keys exist in the expected structure
-        if 'data' in m and 'deveui' in m['data'] and 'data_decoded' in m['data']:
-            event = m['data']['data_decoded'].get('event')
-            
-            # Skip if the event is in the excluded list
-            if event in excluded_events:
-                continue
-            
-            # Append deveui and event if it passes the filter
-            deveui = m['data']['deveui']
-            list_of_deveuis.append({
-                'deveui': f"{deveui} - {event if event else 'No Event'}",  # Format deveui - event
-            })
-
-    # Create a set to track unique 'deveui' values
-    seen_deveuis = set()
-
-    # Create a new list to store unique entries
-    unique_bt_list = []
-
-    # Loop through the original list and filter out duplicates
-    for item in list_of_deveuis:
-        deveui = item['deveui']
-        if deveui not in seen_deveuis:
-            unique_bt_list.append(item)
-            seen_deveuis.add(deveui)
-
-    print('BT - list of deveui: {}'.format(unique_bt_list))
-
-    return unique_bt_list
 
+def getDevEui():
+    """
+    Return the unique 'deveui - event' options of the sensor drop-downs from the device registry.
+    """
+    return backend.device_event_options(EXCLUDED_EVENTS)
 
 
 @app.route('/animations')
@@ -152,29 +156,9 @@ def connect():
 
     if 'username' in session:
 
-        global mqtt_client, broker_ip
         data = request.json
-        broker_ip = data['broker']
-        port = int(data['port'])
-        topic = data['topic']
-        print(f"Setting broker_ip to: {broker_ip}")
-
-        if mqtt_client is not None:
-            mqtt_client.disconnect()
-
-        mqtt_client = mqtt.Client(userdata={'topic': topic})
-        mqtt_client.on_connect = on_connect
-        mqtt_client.on_message = on_message
-
-
-        try:
-            mqtt_client.connect(broker_ip, port, 60)
-            mqtt_client.loop_start()
-            return jsonify({"message": "Connected to MQTT broker"}), 200
-        except Exception as e:
-            # Log the error message
-            print(f"Error connecting to MQTT broker: {e}")
-            return jsonify({"error": f"Could not connect to MQTT broker: {str(e)}"}), 500
+        response, status_code = backend.connect(data['broker'], int(data['port']), data['topic'])
+        return jsonify(response), status_code
     else:
         return redirect(url_for('login'))  
     
@@ -182,74 +166,212 @@ def connect():
 Following used for receiving messages from the MQTT broker, storing them in the message buffer and displaying them.
 """
 
+def parse_filter(filter_type):
+    """
+    Split a lowercase filter into (deveui_filter, event_filter).
+    The event filter is only set when the filter uses the 'deveui - event' format.
+    """
+    if ' - ' in filter_type:
+        deveui_filter, event_filter = map(str.strip, filter_type.split(' - ', 1))
+    else:
+        deveui_filter = filter_type
+        event_filter = None
+    return deveui_filter, event_filter
+
+
+def message_matches(m, filter_type, deveui_filter, event_filter):
+    """
+    Return True if the buffered MessageRecord m matches the lowercase filter.
+    Used for single messages, MessageStore.search() answers the same query from its index.
+    """
+    # hh:mm of the receive time, '' when the message has none
+    formatted_time = m.hhmm
+    # An uplink stored undecoded is decoded before its decoded values are matched.
+    m.decode()
+
+    deveui = m.deveui.lower() if m.type == 'json' and m.deveui is not None else None
+    decoded_values = m.decoded_values if m.type == 'json' else None
+
+    # Check if deveui and event match the filter when 'deveui - event' format is used
+    deveui_match = deveui is not None and deveui_filter == deveui
+    event_match = (
+        decoded_values is not None and
+        m.event is not None and
+        event_filter and event_filter == m.event.lower()
+    )
+
+    # General matching for topic, type, deveui, data_decoded, or time
+    general_deveui_match = deveui is not None and deveui_filter in deveui
+    data_decoded_match = (
+        decoded_values is not None and
+        any(deveui_filter in str(value).lower() for value in decoded_values)
+    )
+    time_match = deveui_filter in formatted_time
+
+    return bool((deveui_match and event_match) or  # Matches 'deveui - event' format
+                filter_type in m.topic.lower() or
+                filter_type in m.type.lower() or
+                general_deveui_match or
+                data_decoded_match or
+                time_match)
+
+
+# Most messages read from the history for one page, so a rare filter cannot scan the whole history.
+HISTORY_SCAN_LIMIT = 5000
+
+
+def history_page(filter_type, deveui_filter, event_filter, before, limit):
+    """
+    Return (messages, next_before, more): up to limit messages matching the filter with a sequence number
+    lower than before, oldest first. The buffered messages are used first, then the on-disk history.
+    """
+    buffered = [m for m in message_buffer.snapshot() if m.seq < before]
+    page = [m for m in buffered if message_matches(m, filter_type, deveui_filter, event_filter)]
+    cursor = buffered[0].seq if buffered else before
+    more = False
+
+    history = backend.history
+    if history is not None:
+        scanned = 0
+        while len(page) < limit:
+            if scanned >= HISTORY_SCAN_LIMIT:
+                more = True
+                break
+            chunk = history.read_before(cursor, 200)
+            if not chunk:
+                break
+            scanned += len(chunk)
+            page = [m for m in chunk if message_matches(m, filter_type, deveui_filter, event_filter)] + page
+            cursor = chunk[0].seq
+
+    if len(page) > limit:
+        page = page[-limit:]
+        cursor = page[0].seq
+        more = True
+    return page, cursor, more
+
+
 @app.route('/messages', methods=['GET'])
 def get_messages():
+    """
+    Return the buffered messages matching the filter.
+
+    With ?since=<seq> only the messages stored after that sequence number are returned.
+    'head' is the newest sequence number and 'tail' the oldest one still buffered, so a client
+    can use 'head' as its next cursor and drop anything older than 'tail'. 'reset' tells the client
+    its cursor is no longer valid (e.g. the server restarted) and it must clear what it displays.
+
+    With ?before=<seq>&limit=<n> the page of older messages before that sequence number is returned
+    instead, read from the on-disk history once past the buffer. 'before' is the cursor of the next
+    page and 'more' tells whether there may be older messages.
+    """
     if 'username' in session:
         filter_type = request.args.get('filter', '').lower()
-        filtered_messages = []
+        since = request.args.get('since', default=0, type=int)
+        before = request.args.get('before', type=int)
+        deveui_filter, event_filter = parse_filter(filter_type)
 
-        # Check if the filter matches the format 'deveui - event'
-        if ' - ' in filter_type:
-            deveui_filter, event_filter = map(str.strip, filter_type.split(' - '))
+        if before is not None:
+            limit = max(1, min(request.args.get('limit', default=50, type=int), 500))
+            messages, next_before, more = history_page(filter_type, deveui_filter, event_filter, before, limit)
         else:
-            deveui_filter = filter_type
-            event_filter = None
-
-        for _ in range(message_buffer.qsize()):
-            m = message_buffer.queue[_]
-
-            # Initialize formatted_time to an empty string to avoid the UnboundLocalError
-            formatted_time = ''
-
-            # Extract time portion if current_time is available and format it as hh:mm
-            if 'current_time' in m['data']:
-                message_time = m['data']['current_time']
-                formatted_time = message_time[11:16]  # Extract the hh:mm portion
-
-            # Check if deveui and event match the filter when 'deveui - event' format is used
-            deveui_match = (
-                m['type'] == 'json' and
-                'deveui' in m['data'] and
-                deveui_filter == m['data']['deveui'].lower()
-            )
-            event_match = (
-                m['type'] == 'json' and
-                'data_decoded' in m['data'] and
-                'event' in m['data']['data_decoded'] and
-                event_filter and event_filter == m['data']['data_decoded']['event'].lower()
-            )
-
-            # General matching for topic, type, deveui, data_decoded, or time
-            general_deveui_match = (
-                m['type'] == 'json' and
-                'deveui' in m['data'] and
-                deveui_filter in m['data']['deveui'].lower()
-            )
-            data_decoded_match = (
-                m['type'] == 'json' and
-                'data_decoded' in m['data'] and
-                any(deveui_filter in str(value).lower() for key, value in m['data']['data_decoded'].items())
-            )
-            time_match = deveui_filter in formatted_time
-
-            # Append to filtered messages based on the matching criteria
-            if ((deveui_match and event_match) or  # Matches 'deveui - event' format
-                filter_type in m['topic'].lower() or
-                filter_type in m['type'].lower() or
-                general_deveui_match or
-                data_decoded_match or
-                time_match):
-                filtered_messages.append({
-                    'topic': m['topic'],
-                    'type': m['type'],
-                    'data': m['data']
-                })
-
-        return jsonify(messages=filtered_messages)
+            messages, head, tail = message_buffer.search(filter_type, deveui_filter, since)
+            reset = since > head
+            if reset:
+                messages, head, tail = message_buffer.search(filter_type, deveui_filter)
+
+        filtered_messages = [m.to_dict() for m in messages]
+
+        if before is not None:
+            return jsonify(messages=filtered_messages, before=next_before, more=more)
+        return jsonify(messages=filtered_messages, head=head, tail=tail, reset=reset)
     else:
         return redirect(url_for('login'))
 
 
+"""
+Following is used to push the live messages to the browser with Server-Sent Events.
+"""
+
+STREAM_KEEPALIVE_SECONDS = 15
+
+
+def stream_event(m, tail):
+    """
+    Format one buffered message as a Server-Sent Event. The id is the sequence number so a
+    reconnecting EventSource resumes from it with the Last-Event-ID header.
+    """
+    message = m.to_dict()
+    message['tail'] = tail
+    payload = json.dumps(message)
+    return f"id: {m.seq}\ndata: {payload}\n\n"
+
+
+@app.route('/stream', methods=['GET'])
+def stream():
+    """
+    Stream the messages matching the filter as they arrive.
+
+    Accepts the same free text ?filter= as /messages and/or exact ?deveui= and ?event= filters.
+    The buffered messages after ?since= (or the Last-Event-ID header) are sent first, then the live ones.
+    A 'reset' event tells the client its cursor is no longer valid and it must clear what it displays.
+    """
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    filter_type = request.args.get('filter', '').lower()
+    deveui = request.args.get('deveui', '').strip().lower()
+    event = request.args.get('event', '').strip().lower()
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', default=0, type=int)
+    deveui_filter, event_filter = parse_filter(filter_type)
+
+    def wanted(m):
+        if deveui and (m.deveui or '').lower() != deveui:
+            return False
+        if event:
+            m.decode()
+            if (m.event or '').lower() != event:
+                return False
+        return not filter_type or message_matches(m, filter_type, deveui_filter, event_filter)
+
+    client = message_hub.subscribe()
+    if client is None:
+        return jsonify({"error": "Too many live streams open"}), 503
+
+    def generate(last_seq):
+        try:
+            # Subscribed first, so nothing published while reading the backlog is lost.
+            backlog, head, tail = message_buffer.window(last_seq)
+            if last_seq > head:
+                yield "event: reset\ndata: {}\n\n"
+                backlog, head, tail = message_buffer.window(0)
+            while True:
+                for m in backlog:
+                    if m.seq > last_seq:
+                        last_seq = m.seq
+                        if wanted(m):
+                            yield stream_event(m, tail)
+
+                live, overflowed = client.wait(STREAM_KEEPALIVE_SECONDS)
+                if overflowed:
+                    # Too slow to keep up, catch up from the store in one go.
+                    backlog, head, tail = message_buffer.window(last_seq)
+                elif live:
+                    backlog, tail = live, message_buffer.first_seq
+                else:
+                    backlog = ()
+                    yield ": keepalive\n\n"
+        finally:
+            message_hub.unsubscribe(client)
+
+    response = Response(stream_with_context(generate(since)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 """
 Following is used to dump the messages in the message buffer to a JSON file and import messages from a JSON file.
 """
@@ -257,11 +379,58 @@ Following is used to dump the messages in the message buffer to a JSON file and
 
 @app.route('/dump_messages')
 def dump_messages():
+    """
+    Download the messages as a stream.
+
+    ?format=json (default, a JSON array with one message per line, as read by /import_messages) or ndjson.
+    ?gzip=1 compresses the download on the fly.
+    ?deveui=, ?event=, ?start= and ?end= (epoch seconds or ISO 8601) select the messages.
+    ?source=buffer only exports the buffered messages, by default the on-disk history is exported too.
+    ?after=<seq> resumes an interrupted download after the last message received and ?until=<seq> ends
+    it where the first download ended (its X-Export-Until header).
+    """
     if 'username' in session:
-        data_json = json.dumps(list(message_buffer.queue), indent=4)
-        response = Response(data_json, content_type='application/json; charset=utf-8')
-        filename_json = f'mqttmessages{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.json'
-        response.headers['Content-Disposition'] = 'attachment; filename=' + filename_json
+        fmt = request.args.get('format', 'json').lower()
+        compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+        after_seq = request.args.get('after', default=0, type=int)
+        until_seq = request.args.get('until', type=int)
+        deveui = request.args.get('deveui', '').strip()
+        event = request.args.get('event', '').strip()
+        try:
+            start_ts = parse_time(request.args.get('start'))
+            end_ts = parse_time(request.args.get('end'))
+        except ValueError:
+            return jsonify({"error": "start and end must be epoch seconds or ISO 8601"}), 400
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+
+        # Everything is read up to the newest message at the time of the request.
+        snapshot = message_buffer.snapshot()
+        if until_seq is None:
+            until_seq = message_buffer.last_seq
+
+        history = backend.history
+        if history is not None and request.args.get('source') != 'buffer':
+            # The history first, then the buffered messages it has not written yet.
+            written = history.last_seq
+            messages = itertools.chain(
+                history.read_range(after_seq, start_ts, end_ts, until_seq=min(written, until_seq)),
+                (m for m in snapshot if m.seq > written))
+        else:
+            messages = snapshot
+
+        selected = select_messages(messages, deveui, event, start_ts, end_ts, after_seq, until_seq)
+
+        extension = 'ndjson' if fmt == 'ndjson' else 'json'
+        filename = f'mqttmessages{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.{extension}'
+        if compress:
+            filename += '.gz'
+        response = Response(stream_with_context(export_messages(selected, fmt, compress)),
+                            content_type='application/gzip' if compress else
+                            'application/x-ndjson; charset=utf-8' if fmt == 'ndjson' else
+                            'application/json; charset=utf-8')
+        response.headers['Content-Disposition'] = 'attachment; filename=' + filename
+        response.headers['X-Export-Until'] = str(until_seq)
         return response
     else:
         return redirect(url_for('login')) 
@@ -277,7 +446,7 @@ def import_messages():
 
     if 'username' in session:
 
-        print('BT - User submit the upload button...')
+        logger.debug('User submit the upload button...')
         if 'file' not in request.files:
             return render_template('error.html', message='No file part')
         file = request.files['file']
@@ -285,14 +454,10 @@ def import_messages():
             return render_template('error.html', message='No selected file')
         if file:
             try:
-                imported_data = json.load(file)
-                if not isinstance(imported_data, list):
-                    return render_template('error.html', message='Invalid JSON file')
-
-                mqtt_handler.upload_buffer = imported_data
-                
+                backend.uploads.load(file.stream, file.filename)
                 return redirect(url_for('upload_messages'))
-            except json.JSONDecodeError:
+            except ValueError as e:
+                logger.info("Invalid capture %s: %s", file.filename, e)
                 return render_template('error.html', message='Invalid JSON file')
     else:
         return redirect(url_for('login')) 
@@ -305,27 +470,66 @@ Following routes is used to upload messages from JSON files to the message buffe
 
 @app.route('/upload', methods=['GET'])
 def upload():
+    """
+    Return one page of the imported capture, newest first.
 
+    ?filter= selects a data_decoded message_type, ?deveui=, ?event=, ?start= and ?end= select further.
+    ?offset= and ?limit= select the page, 'next_offset' is the offset of the next page or null after the last one.
+    """
     if 'username' in session:
-        filter_type = request.args.get('filter', '')
-        filtered_messages = []
-        for m in mqtt_handler.upload_buffer:
-            if not filter_type or (
-                    m['type'] == 'json' and
-                    isinstance(m['data'], dict) and
-                    'data_decoded' in m['data'] and
-                    isinstance(m['data']['data_decoded'], dict) and
-                    m['data']['data_decoded'].get('message_type') == filter_type):
-                filtered_messages.append({
-                    'topic': m['topic'],
-                    'type': m['type'],
-                    'data': m['data']
-                })
-        return jsonify(messages=filtered_messages)
+        offset = max(request.args.get('offset', default=0, type=int), 0)
+        limit = max(1, min(request.args.get('limit', default=200, type=int), 1000))
+        try:
+            start_ts = parse_time(request.args.get('start'))
+            end_ts = parse_time(request.args.get('end'))
+        except ValueError:
+            return jsonify({"error": "start and end must be epoch seconds or ISO 8601"}), 400
+
+        page = backend.uploads.page(message_type=request.args.get('filter', ''),
+                                    deveui=request.args.get('deveui', '').strip(),
+                                    event=request.args.get('event', '').strip(),
+                                    start_ts=start_ts, end_ts=end_ts,
+                                    offset=offset, limit=limit)
+        if page is None:
+            return jsonify(messages=[], total=0, offset=0, next_offset=None)
+        messages, total, capture_stats = page
+        next_offset = offset + len(messages) if offset + len(messages) < total else None
+        return jsonify(messages=messages, total=total, offset=offset, next_offset=next_offset, **capture_stats)
     else:
        return redirect(url_for('login')) 
 
 
+"""
+Following is used to replay the uploaded capture through the live ingest pipeline.
+"""
+
+
+@app.route('/replay', methods=['GET', 'POST', 'DELETE'])
+def replay():
+    """
+    GET returns the state of the replay and its report once finished, DELETE stops it.
+    POST {"speed": N} replays the uploaded capture at N times its recorded pace, 0 as fast as possible.
+    """
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    uploads = backend.uploads
+    if request.method == 'GET':
+        return jsonify(uploads.replay_status())
+    if request.method == 'DELETE':
+        return jsonify(uploads.stop_replay())
+
+    try:
+        speed = float((request.get_json(silent=True) or {}).get('speed', 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "speed must be a number"}), 400
+    if speed < 0:
+        return jsonify({"error": "speed must be 0 or more"}), 400
+
+    response, status_code = uploads.start_replay(speed)
+    return jsonify(response), status_code
+
+
 """
 Following is used to send downlink messages to the MQTT broker.
 """
@@ -333,16 +537,89 @@ Following is used to send downlink messages to the MQTT broker.
 def send_downlink_route():
 
     if 'username' in session:
-        global broker_ip
-        print(f"Using broker_ip in send_downlink_route: {broker_ip}")
         data = request.json
-        print("Received downlink request:", data)
+        logger.debug("Received downlink request: %s", data)
 
-        response, status_code = send_downlink(data, broker_ip)
-        print("Send downlink response:", response, "Status code:", status_code)
+        response, status_code = backend.send_downlink(data)
+        logger.info("Send downlink response: %s Status code: %s", response, status_code)
         return jsonify(response), status_code
     else:
         return redirect(url_for('login')) 
+"""
+Following is used to send the same downlink to many sensors and follow the acknowledgements.
+"""
+
+
+def campaign_deveuis(data):
+    """
+    Return the deveuis of a campaign request: its 'deveuis' list, or the known sensors matching its 'filter'
+    ({"device_type": ..., "event": ...}, {} for every sensor). None when the request has neither.
+    """
+    if data.get('deveuis') is not None:
+        return data['deveuis'] if isinstance(data['deveuis'], list) else [data['deveuis']]
+    device_filter = data.get('filter')
+    if not isinstance(device_filter, dict):
+        return None
+    return [device['deveui'] for device in backend.devices()
+            if device_filter.get('device_type') in (None, device['device_type'])
+            and device_filter.get('event') in (None, *device['events'])]
+
+
+@app.route('/campaigns', methods=['GET', 'POST'])
+def campaigns():
+    """
+    GET lists the campaigns. POST starts one:
+    {"data": base64 payload or "hex": payload, "port": 2, "deveuis": [...] or "filter": {...}, "name": ...,
+     "rate": ..., "concurrency": ..., "device_interval": ..., "ack_timeout": ..., "retries": ..., "qos": ...}
+    The missing settings come from the 'campaign' and 'downlink' settings.
+    """
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    campaign_scheduler = backend.campaigns
+    if request.method == 'GET':
+        return jsonify({'campaigns': campaign_scheduler.campaigns()})
+
+    if backend.broker()[0] is None:
+        return jsonify({"error": "Connect to the MQTT broker first"}), 400
+    data = request.get_json(silent=True) or {}
+    payload = data.get('data')
+    if payload is None and data.get('hex') is not None:
+        try:
+            payload = base64.b64encode(bytes.fromhex(data['hex'])).decode()
+        except (TypeError, ValueError):
+            return jsonify({"error": "hex must be the payload in hexadecimal"}), 400
+    deveuis = campaign_deveuis(data)
+    if payload is None or deveuis is None:
+        return jsonify({"error": "Missing required keys: 'data' or 'hex', and 'deveuis' or 'filter'"}), 400
+
+    try:
+        campaign = campaign_scheduler.create(payload, deveuis, port=data.get('port', 2), name=data.get('name'),
+                                             qos=data.get('qos'),
+                                             **{key: data.get(key) for key in campaign_scheduler.defaults})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(campaign), 201
+
+
+@app.route('/campaigns/<int:campaign_id>', methods=['GET', 'DELETE'])
+def campaign(campaign_id):
+    """
+    GET returns the progress of a campaign and the state of every sensor, DELETE cancels it.
+    """
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    campaign_scheduler = backend.campaigns
+    if request.method == 'DELETE':
+        summary = campaign_scheduler.cancel(campaign_id)
+    else:
+        summary = campaign_scheduler.get(campaign_id)
+    if summary is None:
+        return jsonify({"error": "Unknown campaign"}), 404
+    return jsonify(summary)
+
+
 """
 Following is used to get the list of sensors.
 """
@@ -352,15 +629,74 @@ Following is used to get the list of sensors.
 def get_sensors():
 
     if 'username' in session:
-        global sensor_list
-        print(f"Sensor list: {sensor_list}")
-        return jsonify({'sensors': sensor_list})
+        return jsonify({'sensors': backend.devices()})
     
     else:
         return redirect(url_for('login'))
 ""
 
 
+"""
+Following is used to get the runtime statistics of the message ingest.
+"""
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+
+    if 'username' in session:
+        return jsonify({
+            **backend.stats(),
+            'buffer': {
+                **message_buffer.stats(),
+                **message_buffer.memory_usage(),
+            },
+            'stream': message_hub.stats(),
+            'auth_cache': auth_cache.stats(),
+            'startup': startup_timer.stats(),
+        })
+    else:
+        return redirect(url_for('login'))
+
+
+"""
+Following is used to read the recent log records kept in memory and to change the log levels at runtime.
+"""
+
+
+@app.route('/logs', methods=['GET'])
+def logs():
+
+    if 'username' in session:
+        if log_utils.recent_records is None:
+            return jsonify({'records': [], 'error': 'In-memory log records are disabled'})
+        try:
+            level = log_utils.parse_level(request.args.get('level', 'NOTSET'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        records = log_utils.recent_records.records(level=level,
+                                                   limit=request.args.get('limit', type=int),
+                                                   name=request.args.get('logger'))
+        return jsonify({'records': records, 'suppressed': log_utils.rate_limit_filter.stats()})
+    else:
+        return redirect(url_for('login'))
+
+
+@app.route('/log_level', methods=['GET', 'POST'])
+def log_level():
+
+    if 'username' in session:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            try:
+                log_utils.set_level(data.get('logger', ''), data.get('level', 'INFO'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        return jsonify({'levels': log_utils.get_levels()})
+    else:
+        return redirect(url_for('login'))
+
+
 ########################################################################
 # BT - Authentication
 ########################################################################
@@ -377,7 +713,7 @@ def login():
         ipaddress = data.get('ip')
         
         # BT - Authenticate the user - comment out for testing 
-        auth_result = authenticate_user(username, password,ipaddress)
+        auth_result = auth_cache.authenticate(username, password,ipaddress)
 
         # BT - This is for testing. Uncomment for testing
         # auth_result = 'success'
@@ -407,34 +743,22 @@ def index():
 
 def authenticate_user(username, password,ip):
     try:
-        command = [
-            'curl',
-            '-k', 
-            '-X', 'POST',  
-            '-H', 'Content-Type: application/json',
-            f'https://{ip}/api/login',
-            '-d', f'{{"username": "{username}", "password": "{password}"}}'
-        ]
-        result = subprocess.run(command, capture_output=True, text=True)
-
-        # Check if the command succeeded
-        if result.returncode == 0:
-            try:
-                response_data = json.loads(result.stdout)
-                
-                # Extract the "status" field
-                # Default to 'Unknown status' if 'status' is not found
-                status = response_data.get('status', 'Unknown status') 
-                print(f"Status: {status}")
-                return status
-                
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse JSON: {e}")
-        else:
-            print(f"Command failed with return code {result.returncode}")
-
-    except Exception as e:
-        return {'status': 'failed', 'error': str(e)}
+        response = login_api.get(ip).post('login', {"username": username, "password": password})
+        response_data = response.json()
+    except GatewayAPIError as e:
+        logger.error("Login request to %s failed: %s", ip, e)
+        return 'failed'
+
+    # Extract the "status" field
+    # Default to 'Unknown status' if 'status' is not found
+    status = response_data.get('status', 'Unknown status') if isinstance(response_data, dict) else 'Unknown status'
+    logger.info("Login status: %s", status)
+    return status
+
+# Logins accepted by the gateway are remembered for a while, see static/py/auth_cache.py.
+auth_cache = AuthCache(authenticate_user,
+                       ttl=get_setting('auth_cache', 'ttl'),
+                       max_entries=get_setting('auth_cache', 'max_entries'))
 
 # Route to logout
 @app.route('/logout')
@@ -489,21 +813,24 @@ def setTime():
                 
                 # Get the process ID (PID) of the current server process (this process)
                 current_pid = os.getpid()
-                print(f"BT - Current PID: {current_pid}")
+                logger.info("Current PID: %s", current_pid)
+
+                # Write the queued messages to the history before the restart kills us.
+                backend.close()
                 
                 try:
                     os.system('./Start restart')
 
                 except Exception as e:
-                    print(f"BT - Failed to restart app: {e}")
+                    logger.error("Failed to restart app: %s", e)
                 
                 # Find the existing process by the server.py file or by name
                 # Kill the current process gracefully
                 try:
                     os.kill(current_pid, signal.SIGTERM)  # Send SIGTERM to terminate gracefully
-                    print(f"Terminating process with PID {current_pid}")
+                    logger.info("Terminating process with PID %s", current_pid)
                 except Exception as e:
-                    print(f"Failed to terminate process: {e}")
+                    logger.error("Failed to terminate process: %s", e)
                 
 
             ########################################################################################
@@ -529,99 +856,124 @@ def setTime():
 def page_not_found(e):
     return redirect(url_for('login'))
 
+
+# The ingest process of the multi-process serving mode is down or restarting.
+@app.errorhandler(BackendError)
+def backend_unavailable(e):
+    logger.error("Ingest process unavailable: %s", e)
+    return jsonify({"error": str(e)}), 503
+
     
 # BT - Send command line
 
 def do_command_line(method,endpoint, data='',save_apply=''):
-    
+    """
+    Call the local gateway API and return its JSON response, {'status': 'failed', 'error': ...} when the call failed.
+    save_apply='save_apply' calls the command/<endpoint> API without a body.
+    """
+    if save_apply == 'save_apply':
+        endpoint = f'command/{endpoint}'
+        data = ''
+
     try:
+        return gateway_api.request(method, endpoint, data if method != 'GET' else None).json()
+    except GatewayAPIError as e:
+        logger.error("Gateway API %s %s failed: %s", method, endpoint, e)
+        return {'status': 'failed', 'error': str(e)}
+    
 
-        if method == 'GET':
-        
-            command = [
-                'curl', 
-                '-X', f'{method}',  # Change to POST request
-                '-H', 'Content-Type: application/json',  # Ensure content type is JSON
-                '-d', '',  # Data to send in the POST request
-                f'http://127.0.0.1/api/{endpoint}'
-            ]
-
-        elif save_apply == 'save_apply':
-
-            command = [
-                'curl', 
-                '-X', f'{method}',  # Change to POST request
-                '-H', 'Content-Type: application/json',  # Ensure content type is JSON
-                '-d', '',  # Data to send in the POST request
-                f'http://127.0.0.1/api/command/{endpoint}'
-            ]
-        else:
+"""
+Following is used to find the addresses the app listens at and write them to status.json for the app-manager.
+"""
 
-            command = [
-                'curl', 
-                '-X', f'{method}',  # Change to POST request
-                '-H', 'Content-Type: application/json',  # Ensure content type is JSON
-                '-d', data,  # Data to send in the POST request
-                f'http://127.0.0.1/api/{endpoint}'
-            ]
+# Interface numbers of the gateway API.
+INTERFACES = (('eth0', 0), ('br0', 6), ('ppp0', 3))
 
+STATUS_FILE = 'status.json'
 
 
-        result = subprocess.run(command, capture_output=True, text=True)
+def discover_interfaces(timeout):
+    """
+    Look up the IPv4 address of every interface at once and return {interface: ip}, '' for the interfaces
+    without an address and for those not answered within timeout seconds.
+    """
+    pool = ThreadPoolExecutor(max_workers=len(INTERFACES), thread_name_prefix='discovery')
+    futures = {name: pool.submit(do_command_line, 'GET', f'ni/nis/{number}') for name, number in INTERFACES}
+    wait(futures.values(), timeout)
+    # Do not wait for the lookups still running.
+    pool.shutdown(wait=False)
 
-        # Check if the command succeeded
-        if result.returncode == 0:
+    addresses = {}
+    for name, future in futures.items():
+        ip = ''
+        if future.done() and future.exception() is None:
             try:
-                response_data = json.loads(result.stdout)
-                return response_data
-                
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse JSON: {e}")
+                ip = future.result()['result']['ipv4']['ip']
+            except (KeyError, TypeError):
+                pass
         else:
-            print(f"Command failed with return code {result.returncode}")
+            logger.warning("No address for %s within %s s", name, timeout)
+        addresses[name] = ip or ''
+    return addresses
+
+
+def write_status(addresses):
+    """
+    Write the pid and the addresses the app listens at to status.json.
+    """
+    messages = []
+    if addresses['eth0'] != "":
+        # BT - eth0 is setup.
+        messages.append("https://" + addresses['eth0'] + ":5000")
+    elif addresses['br0'] != "":
+        messages.append("https://" + addresses['br0'] + ":5000")
+    if addresses['ppp0'] != "":
+        messages.append("https://" + addresses['ppp0'] + ":5000")
+
+    status = {'pid': os.getpid(), 'AppInfo': "Listenning at: " + ", ".join(messages)}
+
+    # Write to the status.json with the message, replaced at once so it is never read half written.
+    with open(STATUS_FILE + '.tmp', 'w') as file:
+        json.dump(status, file, indent=2)
+    os.replace(STATUS_FILE + '.tmp', STATUS_FILE)
+
+
+def publish_status():
+    """
+    Discover the interfaces and write status.json, on a background thread while the app starts listening.
+    """
+    started = time.perf_counter()
+    addresses = discover_interfaces(get_setting('startup', 'discovery_timeout'))
+    try:
+        write_status(addresses)
+    except OSError as e:
+        logger.error("Error writing %s: %s", STATUS_FILE, e)
+    startup_timer.add('status', time.perf_counter() - started)
+    logger.info("Interfaces %s written to %s in %.1f ms", addresses, STATUS_FILE,
+                (time.perf_counter() - started) * 1000)
 
-    except Exception as e:
-        return {'status': 'failed', 'error': str(e)}
-    
 
 """
 Following used to run the Flask app.
 
 """
 if __name__ == '__main__':
-    
-    messages = []
-    
-    get_eth0_ip = do_command_line('GET',"/ni/nis/0")
-    get_br0_ip = do_command_line('GET','/ni/nis/6')
-    get_ppp0_ip = do_command_line('GET','/ni/nis/3')
-    
-    if get_eth0_ip['result']['ipv4']['ip'] != "":
-        # BT - eth0 is setup.
-        eth0_ip = get_eth0_ip['result']['ipv4']['ip']
-        messages.append("https://" + eth0_ip + ":5000")
-    else:
-        br0_ip = get_br0_ip['result']['ipv4']['ip']
-        messages.append("https://" + br0_ip + ":5000")
 
-    if get_ppp0_ip['result']['ipv4']['ip'] != "":
-        ppp0_ip = get_ppp0_ip['result']['ipv4']['ip']
-        messages.append("https://" + ppp0_ip + ":5000")
-        
-    displaying_messages = "Listenning at: "
-        
-    for item in messages:
-        displaying_messages += item + ", "
-                
-    clean_up_messages = displaying_messages.rstrip(", ")
-
-    STATUS_FILE = 'status.json'
-
-    status = {'pid': os.getpid(), 'AppInfo': clean_up_messages}
-    
-    # Write to the status.json with the message
-    with open(STATUS_FILE, 'w') as file:
-        json.dump(status, file, indent=2)
+    startup_timer.mark('app')
+
+    if backend.mode == REMOTE:
+        # Decoding and storing run in the ingest process, this process only serves the pages.
+        ingest_supervisor = IngestSupervisor().start()
+        atexit.register(ingest_supervisor.stop)
+    backend.start()
+    atexit.register(backend.close)
+    # Stop sends SIGTERM, exit normally so the history is flushed by atexit.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    startup_timer.mark('history')
+
+    threading.Thread(target=publish_status, name='startup-status', daemon=True).start()
+    startup_timer.mark('status_started')
+    logger.info("Started in %s ms: %s", startup_timer.total_ms(), startup_timer.summary())
 
     # BT - Debug false
     app.run(host="0.0.0.0", debug=False, port=5000, ssl_context=('certs/cert.pem', 'certs/key.pem'))
@@ -0,0 +1,276 @@
+"""
+This file contains the golden corpus of the RadioBridge decoder: representative payloads of every event
+with the data_decoded the decoder must return for them (None when the event is not decoded).
+It is used by static/py/decoder_bench.py to check the decoder outputs and to measure its speed.
+"""
+
+"""
+(name, payload as hex, expected data_decoded)
+"""
+DECODER_CORPUS = [
+    ("reset_old_firmware", "10 00 0e 11 02 05", {
+        "event": "reset",
+        "device_type": "Air Temperature and Humidity Sensor",
+        "hardware_version": "1.1",
+        "firmware_format": "2.5",
+        "packet_count": 0,
+        "protocol_version": 1,
+    }),
+    ("reset_new_firmware", "11 00 10 11 8a 45", {
+        "event": "reset",
+        "device_type": "Ultrasonic Level Sensor",
+        "hardware_version": "1.1",
+        "firmware_format": "2.4.5",
+        "packet_count": 1,
+        "protocol_version": 1,
+    }),
+    ("reset_undefined_device", "12 00 7f 10 00 01", {
+        "event": "reset",
+        "device_type": "Device Undefined",
+        "hardware_version": "1.0",
+        "firmware_format": "0.1",
+        "packet_count": 2,
+        "protocol_version": 1,
+    }),
+    ("supervisory", "19 01 01 02 30 01 00 00 00 00 04", {
+        "event": "supervisory",
+        "battery_level": 3.0,
+        "accumulation_count": 4,
+        "tamper_reset": 0,
+        "tamper_current": 0,
+        "downlink_error": 0,
+        "battery_low": 0,
+        "radio_error": 1,
+        "packet_count": 9,
+        "protocol_version": 1,
+    }),
+    ("supervisory_errors", "1a 01 1f 02 2b 01 00 00 00 01 02", {
+        "event": "supervisory",
+        "battery_level": 2.11,
+        "accumulation_count": 258,
+        "tamper_reset": 1,
+        "tamper_current": 1,
+        "downlink_error": 1,
+        "battery_low": 1,
+        "radio_error": 1,
+        "packet_count": 10,
+        "protocol_version": 1,
+    }),
+    ("tamper_open", "13 02 00", {
+        "event": "tamper",
+        "tamper_state": "open",
+        "packet_count": 3,
+        "protocol_version": 1,
+    }),
+    ("tamper_closed", "14 02 01", {
+        "event": "tamper",
+        "tamper_state": "closed",
+        "packet_count": 4,
+        "protocol_version": 1,
+    }),
+    ("door_window_open", "15 03 01", {
+        "event": "door_window",
+        "state": "open",
+        "packet_count": 5,
+        "protocol_version": 1,
+    }),
+    ("door_window_closed", "16 03 00", {
+        "event": "door_window",
+        "state": "closed",
+        "packet_count": 6,
+        "protocol_version": 1,
+    }),
+    ("push_button_pressed", "17 06 03 00", {
+        "event": "push_button",
+        "button_id": "button_1",
+        "button_state": "pressed",
+        "packet_count": 7,
+        "protocol_version": 1,
+    }),
+    ("push_button_both_held", "18 06 12 02", {
+        "event": "push_button",
+        "button_id": "button_1&2",
+        "button_state": "held",
+        "packet_count": 8,
+        "protocol_version": 1,
+    }),
+    ("contact_open", "19 07 01", {
+        "event": "contact",
+        "state": "open",
+        "packet_count": 9,
+        "protocol_version": 1,
+    }),
+    ("water_wet", "1a 08 00 2d", {
+        "event": "water",
+        "state": "wet",
+        "relative_resistance": 45,
+        "packet_count": 10,
+        "protocol_version": 1,
+    }),
+    ("water_dry", "1b 08 01 ff", {
+        "event": "water",
+        "state": "dry",
+        "relative_resistance": 255,
+        "packet_count": 11,
+        "protocol_version": 1,
+    }),
+    ("temperature_negative", "1c 09 01 fb 7f", {
+        "event": "temperature",
+        "temperature_event": "above_threshold",
+        "temperature": -5,
+        "relative_temperature": 127,
+        "packet_count": 12,
+        "protocol_version": 1,
+    }),
+    ("tilt", "1d 0a 01 5a", {
+        "event": "tilt",
+        "tilt_event": "transition_horizontal",
+        "tilt_angle": 90,
+        "packet_count": 13,
+        "protocol_version": 1,
+    }),
+    ("ath_periodic", "1e 0d 00 16 50 2d 30", {
+        "event": "air_temperature_humidity",
+        "ath_event": "periodic_report",
+        "temperature": 22.5,
+        "humidity": 45.3,
+        "packet_count": 14,
+        "protocol_version": 1,
+    }),
+    ("ath_negative", "1f 0d 02 85 20 50 00", {
+        "event": "air_temperature_humidity",
+        "ath_event": "temperature_below_threshold",
+        "temperature": -5.2,
+        "humidity": 80.0,
+        "packet_count": 15,
+        "protocol_version": 1,
+    }),
+    ("abm_start", "10 0e 00", {
+        "event": "acceleration",
+        "abm_event": "movement_start",
+        "packet_count": 0,
+        "protocol_version": 1,
+    }),
+    ("tilt_hp", "11 0f 03 2d 05 ec", {
+        "event": "hp_tilt",
+        "tilt_hp_event": "change_toward_0_vertical",
+        "angle": 45.5,
+        "temperature": -20,
+        "packet_count": 1,
+        "protocol_version": 1,
+    }),
+    ("ultrasonic", "12 10 01 04 d2", {
+        "event": "ultrasonic_level",
+        "ultrasonic_event": "distance_above_threshold",
+        "distance": 1234,
+        "packet_count": 2,
+        "protocol_version": 1,
+    }),
+    ("sensor420ma", "13 11 00 07 d0", {
+        "event": "sensor420ma",
+        "sensor420ma_event": "periodic_report",
+        "current_milliamps": 20.0,
+        "packet_count": 3,
+        "protocol_version": 1,
+    }),
+    ("thermocouple", "14 13 00 01 90 00", {
+        "event": "thermocouple",
+        "thermocouple_event": "periodic_report",
+        "temperature": 25,
+        "packet_count": 4,
+        "protocol_version": 1,
+    }),
+    ("thermocouple_faults", "15 13 01 06 40 81", {
+        "event": "thermocouple",
+        "thermocouple_event": "above_threshold",
+        "temperature": 100,
+        "faults": ", Fault: The cold-Junction temperature is outside of the normal operating range, Fault: An open circuit such as broken thermocouple wires has been detected",
+        "packet_count": 5,
+        "protocol_version": 1,
+    }),
+    ("voltmeter", "16 14 04 01 2c", {
+        "event": "voltmeter",
+        "voltmeter_event": "change_decrease",
+        "volts": 3.0,
+        "packet_count": 6,
+        "protocol_version": 1,
+    }),
+    ("custom_sensor", "17 15 00", {
+        "event": "custom_sensor",
+        "packet_count": 7,
+        "protocol_version": 1,
+    }),
+    ("gps", "18 16 01 1a cf 1b 54 c8 69 0f 18", {
+        "event": "gps",
+        "gps_status": "valid_fix",
+        "acp_lat": 44.9780564,
+        "acp_lng": -93.2638952,
+        "packet_count": 8,
+        "protocol_version": 1,
+    }),
+    ("honeywell5800", "19 17 0a 1b 2c 02 ab cd", {
+        "event": "honeywell5800",
+        "hw_sensor_id": 662316,
+        "honeywell5800_event": "sensor_data_payload",
+        "sensor_payload": "0xabcd",
+        "packet_count": 9,
+        "protocol_version": 1,
+    }),
+    ("magnetometer", "1a 18 00", None),
+    ("vibration_lb", "1b 19 04 00 0a 00 14 00 1e 19", {
+        "event": "vibration_lb",
+        "vibration_lb_event": "x_above_threshold",
+        "x_inches_per_second": 10,
+        "y_inches_per_second": 20,
+        "z_inches_per_second": 30,
+        "temperature": 25,
+        "packet_count": 11,
+        "protocol_version": 1,
+    }),
+    ("vibration_hb", "1c 1a 02 01 f4 e2", {
+        "event": "vibration_hb",
+        "vibration_hb_event": "above_threshold",
+        "peak_g": 500,
+        "temperature": -30,
+        "packet_count": 12,
+        "protocol_version": 1,
+    }),
+    ("device_info", "1d fa 11 01 93 00 01 01 00 00", {
+        "event": "device_info",
+        "message": "1 of 1",
+        "downlinkBytes": "01 93 00 01 01 00 00",
+        "packet_count": 13,
+        "protocol_version": 1,
+    }),
+    ("link_quality", "1e fb 02 b5 07", {
+        "event": "link_quality",
+        "sub_band": 2,
+        "rssi": 181,
+        "snr": 7,
+        "packet_count": 14,
+        "protocol_version": 1,
+    }),
+    ("rate_limit_exceeded", "1f fc 00", {
+        "event": "rate_limit_exceeded_DEPRECATED",
+        "packet_count": 15,
+        "protocol_version": 1,
+    }),
+    ("test_message", "10 fd 00", {
+        "event": "test_message_DEPRECATED",
+        "packet_count": 0,
+        "protocol_version": 1,
+    }),
+    ("downlink_ack_valid", "11 ff 00", {
+        "event": "downlink_ack",
+        "downlink_ack_event": "message_valid",
+        "packet_count": 1,
+        "protocol_version": 1,
+    }),
+    ("downlink_ack_invalid", "12 ff 01", {
+        "event": "downlink_ack",
+        "downlink_ack_event": "message_invalid",
+        "packet_count": 2,
+        "protocol_version": 1,
+    }),
+    ("unknown_event", "13 55 00", None),
+]
@@ -14,9 +14,8 @@ document.addEventListener('DOMContentLoaded', () => {
             // BT - Step 1: Load the html file based on the user selection.
             // door_window.html, temperature.
             //##################################################################
-            loadSensorContent(selectedSensorText);
-            // BT - Step 2: Then connect to broker.
-            connectToBroker();
+            // BT - Step 2: Then connect to broker, once the page is there to be animated.
+            loadSensorContent(selectedSensorText).then(() => connectToBroker());
 
         });
     }
@@ -51,7 +50,7 @@ function loadSensorContent(selectedSensorText) {
     sensorContentDiv.innerHTML = '';
 
     // Assuming the files are named after the deveui, e.g., deveui1.html, deveui2.html
-    fetch(currentURL)
+    return fetch(currentURL)
         .then(response => {
             if (!response.ok) {
                 throw new Error('Network response was not ok');
@@ -100,10 +99,10 @@ window.onclick = function(event) {
 //#####################################################################
 
 // Helper function to create a full endpoint URL
-function getEndpointURL(filter) {
+function getEndpointURL(filter, since = 0) {
     let currentPath = window.location.pathname;
     let endpoint = (currentPath === '/animations') ? 'messages' : 'default';
-    return `${window.location.origin}/${endpoint}?filter=${filter}`;
+    return `${window.location.origin}/${endpoint}?filter=${encodeURIComponent(filter)}&since=${since}`;
 }
 
 // Helper function to handle fetch errors and log messages
@@ -120,6 +119,21 @@ function fetchData(url, onSuccess) {
         .catch(error => console.error('Error fetching data:', error));
 }
 
+// Fetch only the messages stored after the cursor, then move the cursor to the newest one.
+// cursor is { value, filter }, a new filter starts again from the beginning.
+function fetchNewMessages(filter, cursor, onMessages) {
+    if (filter !== cursor.filter) {
+        cursor.value = 0;
+        cursor.filter = filter;
+    }
+    fetchData(getEndpointURL(filter, cursor.value), data => {
+        if (data.head !== undefined) {
+            cursor.value = data.head;
+        }
+        onMessages(data.messages || []);
+    });
+}
+
 // Process data based on timestamp and state, avoiding duplicate actions
 function processMessageData(messages, lastTimestamp, callback) {
     messages.forEach(message => {
@@ -140,19 +154,20 @@ function processMessageData(messages, lastTimestamp, callback) {
 //#####################################################################
 
 let lastTimestampDoor = { value: null };
+let cursorDoor = { value: 0, filter: null };
 
 function getDoorWindowAnimation(filter = '') {
-    const url = getEndpointURL(filter);
-
-    // BT - Step1: We pass in a function to fetchData.
-    fetchData(url, data => {
-        processMessageData(data.messages, lastTimestampDoor, decodedData => {
-            toggleDoorState(decodedData.state);
-            changeCircleColor(decodedData.state);
-        });
+    // BT - Step1: We pass in a function to fetchNewMessages.
+    fetchNewMessages(filter, cursorDoor, messages => {
+        processMessageData(messages, lastTimestampDoor, renderDoorWindow);
     });
 }
 
+function renderDoorWindow(decodedData) {
+    toggleDoorState(decodedData.state);
+    changeCircleColor(decodedData.state);
+}
+
 function toggleDoorState(state) {
     document.getElementById('door-text').textContent = state;
 }
@@ -162,20 +177,21 @@ function toggleDoorState(state) {
 //#####################################################################
 
 let lastTimestampAir = { value: null };
+let cursorAir = { value: 0, filter: null };
 
 function getAirTempHumidityAnimation(filter = '') {
-    const url = getEndpointURL(filter);
-
-    fetchData(url, data => {
-        processMessageData(data.messages, lastTimestampAir, decodedData => {
-            updateTemperatureC(decodedData.temperature);
-            updateTemperatureF(decodedData.temperature);
-            updateHumidity(decodedData.humidity);
-            changeCircleColor('standby');
-        });
+    fetchNewMessages(filter, cursorAir, messages => {
+        processMessageData(messages, lastTimestampAir, renderAirTempHumidity);
     });
 }
 
+function renderAirTempHumidity(decodedData) {
+    updateTemperatureC(decodedData.temperature);
+    updateTemperatureF(decodedData.temperature);
+    updateHumidity(decodedData.humidity);
+    changeCircleColor('standby');
+}
+
 function updateTemperatureC(temp) {
     document.getElementById("air-temp-humidity-celsius").textContent = `${temp}°C`;
 
@@ -216,18 +232,19 @@ function updateHumidity(humidity) {
 //#####################################################################
 
 let lastTimestampTilt = { value: null };
+let cursorTilt = { value: 0, filter: null };
 
 function getTiltAnimation(filter = '') {
-    const url = getEndpointURL(filter);
-
-    fetchData(url, data => {
-        processMessageData(data.messages, lastTimestampTilt, decodedData => {
-            updateAngle(decodedData.tilt_angle);
-            // changeCircleColor('standby');
-        });
+    fetchNewMessages(filter, cursorTilt, messages => {
+        processMessageData(messages, lastTimestampTilt, renderTilt);
     });
 }
 
+function renderTilt(decodedData) {
+    updateAngle(decodedData.tilt_angle);
+    // changeCircleColor('standby');
+}
+
 function updateAngle(degrees) {
     document.getElementById('tilt-text').textContent = `Angle tilted: ${degrees} °`;
 
@@ -251,19 +268,20 @@ function updateAngle(degrees) {
 //#####################################################################
 
 let lastTimestampTemp = { value: null };
+let cursorTemp = { value: 0, filter: null };
 
 function getTemperatureAnimation(filter = '') {
-    const url = getEndpointURL(filter);
-
-    fetchData(url, data => {
-        processMessageData(data.messages, lastTimestampTemp, decodedData => {
-            updateTempTemperatureC(decodedData.temperature);
-            updateTempTemperatureF(decodedData.temperature);
-            // changeCircleColor('standby');
-        });
+    fetchNewMessages(filter, cursorTemp, messages => {
+        processMessageData(messages, lastTimestampTemp, renderTemperature);
     });
 }
 
+function renderTemperature(decodedData) {
+    updateTempTemperatureC(decodedData.temperature);
+    updateTempTemperatureF(decodedData.temperature);
+    // changeCircleColor('standby');
+}
+
 function updateTempTemperatureC(temp) {
     document.getElementById("temp-celsius").textContent = `${temp}°C`;
         // Get the current temperature element
@@ -299,18 +317,19 @@ function updateTempTemperatureF(celsius) {
 //#####################################################################
 
 let lastTimestampWetDry = { value: null };
+let cursorWetDry = { value: 0, filter: null };
 
 function getWetAndDryAnimation(filter = '') {
-    const url = getEndpointURL(filter);
-
-    fetchData(url, data => {
-        processMessageData(data.messages, lastTimestampWetDry, decodedData => {
-            updateWetAndDryCenterText(decodedData.state);
-            changeCircleColor(decodedData.state);
-        });
+    fetchNewMessages(filter, cursorWetDry, messages => {
+        processMessageData(messages, lastTimestampWetDry, renderWetAndDry);
     });
 }
 
+function renderWetAndDry(decodedData) {
+    updateWetAndDryCenterText(decodedData.state);
+    changeCircleColor(decodedData.state);
+}
+
 function updateWetAndDryCenterText(state) {
     document.getElementById('center-text').textContent = state;
 }
@@ -320,17 +339,18 @@ function updateWetAndDryCenterText(state) {
 //#####################################################################
 
 let lastTimestampPush = { value: null };
+let cursorPush = { value: 0, filter: null };
 
 function getPushButtonAnimation(filter = '') {
-    const url = getEndpointURL(filter);
-
-    fetchData(url, data => {
-        processMessageData(data.messages, lastTimestampPush, decodedData => {
-            updatePushButtonCenterText(decodedData.button_state);
-        });
+    fetchNewMessages(filter, cursorPush, messages => {
+        processMessageData(messages, lastTimestampPush, renderPushButton);
     });
 }
 
+function renderPushButton(decodedData) {
+    updatePushButtonCenterText(decodedData.button_state);
+}
+
 function updatePushButtonCenterText(state) {
     document.getElementById('push-button-text').textContent = state;
     changeCircleColor(state);
@@ -371,8 +391,40 @@ function changeCircleColor(state) {
 }
 
 
+//#####################################################################
+// Live stream
+//#####################################################################
 
+// Render function and last timestamp of each animation, keyed by event
+const animationRenderers = {
+    door_window: [lastTimestampDoor, renderDoorWindow],
+    air_temperature_humidity: [lastTimestampAir, renderAirTempHumidity],
+    tilt: [lastTimestampTilt, renderTilt],
+    temperature: [lastTimestampTemp, renderTemperature],
+    water: [lastTimestampWetDry, renderWetAndDry],
+    push_button: [lastTimestampPush, renderPushButton],
+};
 
+// Subscribe the selected 'deveui - event' sensor to the live stream.
+// The animation is updated as soon as the sensor reports instead of on the next poll.
+function streamAnimation(selectedSensorText) {
+    if (!selectedSensorText) {
+        return;
+    }
+    const parts = selectedSensorText.split('-');
+    const event = parts.pop().trim();
+    const deveui = parts.join('-').trim();
+    const renderer = animationRenderers[event];
 
+    if (!renderer) {
+        return;
+    }
+    const [lastTimestamp, render] = renderer;
+    lastTimestamp.value = null;
 
-
+    openMessageStream({ deveui: deveui, event: event }, (message) => {
+        processMessageData([message], lastTimestamp, render);
+    }, () => {
+        lastTimestamp.value = null;
+    });
+}
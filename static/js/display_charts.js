@@ -4,6 +4,11 @@ let chart;  // Will hold the Chart.js instance
 let freqs = []; // Global times array
 let rssiValues = []; // Global rssiValues array
 let lsnrValues = []; // Global rssiValues array
+let chartSeqs = []; // Sequence number of each plotted message
+// Most points kept on the chart, the server may keep old messages with an eviction policy other than fifo.
+const MAX_CHART_POINTS = 1000;
+let chartCursor = 0; // Last sequence number received from /messages
+let chartCursorFilter = null; // Filter the cursor belongs to
 
 
 // When the page loads, connect to the broker and set up the chart
@@ -18,7 +23,11 @@ document.addEventListener('DOMContentLoaded', () => {
             const selectedSensorText = sensorSelectElement.options[sensorSelectElement.selectedIndex].textContent;
             localStorage.setItem('sensorSelected-charts', selectedSensorText);
             // Fetch initial data for the selected sensor
-            getData(selectedSensorText);
+            if (window.EventSource) {
+                streamChart(selectedSensorText);
+            } else {
+                getData(selectedSensorText);
+            }
         });
     }
 
@@ -90,10 +99,17 @@ function initChart() {
 }
 
 // Function to fetch data
+// Only the messages newer than chartCursor are requested, they are appended to the plotted points.
 function getData(filter = '') {
     let currentPath = window.location.pathname;
     let endpoint = (currentPath === '/charts') ? 'messages' : 'default';
-    let currentURL = `${window.location.origin}/${endpoint}?filter=${filter}`;
+
+    if (filter !== chartCursorFilter) {
+        chartCursor = 0;
+        chartCursorFilter = filter;
+    }
+    const requestedFilter = filter;
+    let currentURL = `${window.location.origin}/${endpoint}?filter=${encodeURIComponent(filter)}&since=${chartCursor}`;
 
     fetch(currentURL)
         .then(response => {
@@ -107,11 +123,17 @@ function getData(filter = '') {
             return response.json();
         })
         .then(data => {
+            if (requestedFilter !== chartCursorFilter) {
+                return;
+            }
 
-            // Clear old data arrays
-            freqs = [];
-            rssiValues = [];
-            lsnrValues = []; 
+            // Start over for a new sensor or when the server lost our cursor
+            if (chartCursor === 0 || data.reset) {
+                freqs = [];
+                rssiValues = [];
+                lsnrValues = [];
+                chartSeqs = [];
+            }
 
             data.messages.forEach((message) => {
                 const currentFreq = message.data.freq;
@@ -122,9 +144,23 @@ function getData(filter = '') {
                     freqs.push(currentFreq); // Push time for X-axis
                     rssiValues.push(rssi);   // Push RSSI for Y-axis
                     lsnrValues.push(lsnr);
+                    chartSeqs.push(message.seq);
                 }
             });
 
+            // Drop the points of messages the server no longer buffers
+            let evicted = 0;
+            while (evicted < chartSeqs.length && (chartSeqs[evicted] < data.tail || chartSeqs.length - evicted > MAX_CHART_POINTS)) {
+                evicted++;
+            }
+            if (evicted > 0) {
+                freqs.splice(0, evicted);
+                rssiValues.splice(0, evicted);
+                lsnrValues.splice(0, evicted);
+                chartSeqs.splice(0, evicted);
+            }
+
+            chartCursor = data.head;
             updateChart(freqs, rssiValues,lsnrValues); // Update the chart with new data
         })
         .catch(error => {
@@ -132,6 +168,54 @@ function getData(filter = '') {
         });
 }
 
+// Function to plot the messages of the live stream
+// The server first sends the buffered messages, then every new one as it arrives.
+function streamChart(filter = '') {
+    const clearChart = () => {
+        freqs = [];
+        rssiValues = [];
+        lsnrValues = [];
+        chartSeqs = [];
+        updateChart(freqs, rssiValues, lsnrValues);
+    };
+    clearChart();
+
+    openMessageStream({ filter: filter || '' }, (message) => {
+        const currentFreq = message.data.freq;
+        const rssi = message.data.rssi;
+        const lsnr = message.data.lsnr;
+
+        if (currentFreq && rssi && lsnr !== undefined) {
+            freqs.push(currentFreq);
+            rssiValues.push(rssi);
+            lsnrValues.push(lsnr);
+            chartSeqs.push(message.seq);
+        }
+
+        // Drop the points of messages the server no longer buffers
+        while (chartSeqs.length && (chartSeqs[0] < message.tail || chartSeqs.length > MAX_CHART_POINTS)) {
+            freqs.shift();
+            rssiValues.shift();
+            lsnrValues.shift();
+            chartSeqs.shift();
+        }
+        scheduleChartUpdate();
+    }, clearChart);
+}
+
+// Redraw the chart at most once per frame, the stream can deliver many messages at once
+let chartUpdateScheduled = false;
+function scheduleChartUpdate() {
+    if (chartUpdateScheduled) {
+        return;
+    }
+    chartUpdateScheduled = true;
+    requestAnimationFrame(() => {
+        chartUpdateScheduled = false;
+        updateChart(freqs, rssiValues, lsnrValues);
+    });
+}
+
 // Function to update the chart with new data
 function updateChart(newFreqs, newRssiValues, newLsnr) {
     chart.data.labels = newFreqs; // Update X-axis labels
@@ -5,6 +5,10 @@
  * It contains the following functions:
  * - connectToBroker(event)
  * - fetchMessages(filter = '')
+ * - streamMessages(filter = '')
+ * - filterMessages(filter = '')
+ * - removeEvictedRows(messageTable, tail)
+ * - createMessageRow(message)
  * - showModal(data)
  * - closeModal()
  * - startFetchingMessages()
@@ -13,9 +17,15 @@
  */
 
 
+// Cursor of the last message received from /messages and the filter it belongs to.
+let messageCursor = 0;
+let messageCursorFilter = null;
+
 /**
  * Function to fetch messages from the server
- * and display them in the table
+ * and display them in the table.
+ * On the live messages page only the messages newer than the cursor are requested
+ * and prepended to the table. The upload page loads its pages with loadUploadedMessages().
  * @param filter - The filter to apply to the messages
  * @returns {void}
  */
@@ -23,12 +33,19 @@ function fetchMessages(filter = '') {
 
     let currentPath = window.location.pathname;
     let endpoint = (currentPath === '/') ? 'messages' : (currentPath === '/upload_messages') ? 'upload' : 'default';
-    let currentURL = `${window.location.origin}/${endpoint}?filter=${filter}`;
- 
+
+    // A new filter gives a new result set, start again from the beginning.
+    if (filter !== messageCursorFilter) {
+        messageCursor = 0;
+        messageCursorFilter = filter;
+    }
+    const requestedFilter = filter;
+    let currentURL = `${window.location.origin}/${endpoint}?filter=${encodeURIComponent(filter)}&since=${messageCursor}`;
+
     /**
      * Fetch the messages from the server
      * creates a table row for each message
-     * and appends it to the table
+     * and adds it to the table
      * @param currentURL - The URL to fetch the messages from
      */
     fetch(currentURL)
@@ -43,106 +60,166 @@ function fetchMessages(filter = '') {
             if (!response.ok) {
                 throw new Error('Network response was not ok, status: ' + response.status);
             }
-            // console.log(`BT - Fetching data from Python server at: ${currentURL}`)
             return response.json(); // Only parse if the response is okay
 
         })
         .then(data => {
+            // The filter changed while the request was in flight, the next poll will reload.
+            if (requestedFilter !== messageCursorFilter) {
+                return;
+            }
             const messageTable = document.getElementById('messageTableBody');
-            messageTable.innerHTML = '';
-            data.messages.reverse();
+            const isDelta = data.head !== undefined;
 
-            // console.log(`BT - Receiving data from the server: ${JSON.stringify(data.messages)}`);
-
-            data.messages.forEach((message, index) => {
-                const row = document.createElement('tr');
-                const timeCell = document.createElement('td');
-                const devEUICell = document.createElement('td');
-                const topicCell = document.createElement('td');
-                const messageTypeCell = document.createElement('td');
-                const messageDataCell = document.createElement('td');
-                // const messageData2Cell = document.createElement('td');
-                // const messageData3Cell = document.createElement('td');
-                const buttonCell = document.createElement('td');
-                const moreInfoButton = document.createElement('button');
-                buttonCell.style.textAlign = 'center';  // Center the button inside the cell
-
-
-                // const time = message.data.current_time;
-                // const date = new Date(time);
-                // const options = {
-                //     year: 'numeric',
-                //     month: 'long',
-                //     day: 'numeric',
-                //     hour: '2-digit',
-                //     minute: '2-digit',
-                //     second: '2-digit',
-                //     timeZoneName: 'short'
-                // };
-
-                // timeCell.textContent = date.toLocaleDateString('en-US', options);
-                timeCell.textContent = message.data.current_time;
-                timeCell.style.textAlign = 'center'; // Center the text in the topicCell
-
-                if (!(message.data.deveui)){
-                    const parsedValue = message.topic.split('/')[1];
-                    devEUICell.textContent = parsedValue;
-                }
-                else{
-                    devEUICell.textContent = message.data.deveui;
-                }
-                
-                devEUICell.style.textAlign = 'center'; // Center the text in the topicCell
-                topicCell.textContent = message.topic.substring(message.topic.lastIndexOf('/') + 1);
-                topicCell.style.textAlign = 'center'; // Center the text in the topicCell
-
-                /**
-                 * Check if the message type is 'json'
-                 * checks for which type of sensor the JSON has data for
-                 * and displays the data in the table
-                 * @param message - The message object
-                 */
-                if (message.type === 'json') {
-                    if ('data_decoded' in message.data) {
-                        if ('event' in message.data.data_decoded) {
-                            messageTypeCell.textContent = message.data.data_decoded.event;
-                            messageTypeCell.style.textAlign = 'center'; // Center the text in the topicCell
-                            messageDataCell.textContent = JSON.stringify(message.data.data_decoded, null, 1);
-                        }
-                    }
-                    else if (topicCell.textContent === 'down_queued'){
-                        messageTypeCell.textContent = `Received response id: ${message.data.id}`;
-                        messageTypeCell.style.textAlign = 'center'; // Center the text in the topicCell
-                        messageDataCell.textContent = JSON.stringify(message.data.data_decoded, null, 1);                        
-                    }
-
-                }//(message.type === 'json')
-                
-                    /**
-                     * Create a button to show the full JSON data
-                     * and a button to ask GPT for a response
-                     * @param message - The message object
-                     */
-                    moreInfoButton.textContent = 'Full Json';
-                    moreInfoButton.onclick = () => showModal(message.data);
-                    buttonCell.appendChild(moreInfoButton);
-
-                    row.appendChild(timeCell);
-                    row.appendChild(devEUICell);
-                    row.appendChild(topicCell);
-                    row.appendChild(messageTypeCell);
-                    row.appendChild(messageDataCell);
-                    // row.appendChild(messageData2Cell);
-                    // row.appendChild(messageData3Cell);
-                    row.appendChild(buttonCell);
-                    messageTable.appendChild(row);
+            if (!isDelta || messageCursor === 0 || data.reset) {
+                messageTable.innerHTML = '';
+            }
+
+            // Newest messages are displayed first, above the rows already in the table.
+            const firstRow = messageTable.firstChild;
+            data.messages.reverse();
+            data.messages.forEach((message) => {
+                messageTable.insertBefore(createMessageRow(message), firstRow);
             });
+
+            if (isDelta) {
+                messageCursor = data.head;
+                removeEvictedRows(messageTable, data.tail);
+            }
         }) 
         .catch(error => {
             return {}
         })
 }
 
+/**
+ * Function to display the messages matching the filter from the live stream.
+ * The server first sends the buffered messages, then every new one as it arrives.
+ * @param filter - The filter to apply to the messages
+ * @returns {void}
+ */
+function streamMessages(filter = '') {
+    const messageTable = document.getElementById('messageTableBody');
+    messageTable.innerHTML = '';
+
+    openMessageStream({ filter: filter }, (message) => {
+        messageTable.insertBefore(createMessageRow(message), messageTable.firstChild);
+        removeEvictedRows(messageTable, message.tail);
+    }, () => {
+        messageTable.innerHTML = '';
+    });
+}
+
+/**
+ * Function called when the filter of the message table changes.
+ * Reopens the live stream with the new filter, or fetches the messages once without it.
+ * @param filter - The filter to apply to the messages
+ * @returns {void}
+ */
+function filterMessages(filter = '') {
+    if (window.EventSource && typeof openMessageStream === 'function') {
+        streamMessages(filter);
+    } else {
+        fetchMessages(filter);
+    }
+}
+
+// Most rows kept in the table. With an eviction policy other than fifo the server keeps old messages,
+// so 'tail' alone does not bound the table.
+const MAX_TABLE_ROWS = 1000;
+
+/**
+ * Remove the rows of messages the server no longer buffers and the oldest rows beyond MAX_TABLE_ROWS
+ * @param messageTable - The table body
+ * @param tail - The oldest sequence number still buffered on the server
+ * @returns {void}
+ */
+function removeEvictedRows(messageTable, tail) {
+    let row = messageTable.lastChild;
+    while (row && row.dataset && Number(row.dataset.seq) < tail) {
+        const previous = row.previousSibling;
+        messageTable.removeChild(row);
+        row = previous;
+    }
+    while (messageTable.rows.length > MAX_TABLE_ROWS) {
+        messageTable.removeChild(messageTable.lastChild);
+    }
+}
+
+/**
+ * Create the table row for one message
+ * @param message - The message object
+ * @returns {HTMLTableRowElement}
+ */
+function createMessageRow(message) {
+    const row = document.createElement('tr');
+    const timeCell = document.createElement('td');
+    const devEUICell = document.createElement('td');
+    const topicCell = document.createElement('td');
+    const messageTypeCell = document.createElement('td');
+    const messageDataCell = document.createElement('td');
+    const buttonCell = document.createElement('td');
+    const moreInfoButton = document.createElement('button');
+    buttonCell.style.textAlign = 'center';  // Center the button inside the cell
+
+    if (message.seq !== undefined) {
+        row.dataset.seq = message.seq;
+    }
+
+    timeCell.textContent = message.data.current_time;
+    timeCell.style.textAlign = 'center'; // Center the text in the topicCell
+
+    if (!(message.data.deveui)){
+        const parsedValue = message.topic.split('/')[1];
+        devEUICell.textContent = parsedValue;
+    }
+    else{
+        devEUICell.textContent = message.data.deveui;
+    }
+
+    devEUICell.style.textAlign = 'center'; // Center the text in the topicCell
+    topicCell.textContent = message.topic.substring(message.topic.lastIndexOf('/') + 1);
+    topicCell.style.textAlign = 'center'; // Center the text in the topicCell
+
+    /**
+     * Check if the message type is 'json'
+     * checks for which type of sensor the JSON has data for
+     * and displays the data in the table
+     * @param message - The message object
+     */
+    if (message.type === 'json') {
+        if ('data_decoded' in message.data) {
+            if ('event' in message.data.data_decoded) {
+                messageTypeCell.textContent = message.data.data_decoded.event;
+                messageTypeCell.style.textAlign = 'center'; // Center the text in the topicCell
+                messageDataCell.textContent = JSON.stringify(message.data.data_decoded, null, 1);
+            }
+        }
+        else if (topicCell.textContent === 'down_queued'){
+            messageTypeCell.textContent = `Received response id: ${message.data.id}`;
+            messageTypeCell.style.textAlign = 'center'; // Center the text in the topicCell
+            messageDataCell.textContent = JSON.stringify(message.data.data_decoded, null, 1);
+        }
+
+    }//(message.type === 'json')
+
+    /**
+     * Create a button to show the full JSON data
+     * @param message - The message object
+     */
+    moreInfoButton.textContent = 'Full Json';
+    moreInfoButton.onclick = () => showModal(message.data);
+    buttonCell.appendChild(moreInfoButton);
+
+    row.appendChild(timeCell);
+    row.appendChild(devEUICell);
+    row.appendChild(topicCell);
+    row.appendChild(messageTypeCell);
+    row.appendChild(messageDataCell);
+    row.appendChild(buttonCell);
+    return row;
+}
+
 /**
  * Function to show the modal with the given data
  * @param data - The data to show in the modal
@@ -10,5 +10,98 @@ function updateFileName() {
     }
 }
 
+// Number of messages requested from /upload at a time.
+const UPLOAD_PAGE_SIZE = 200;
+
+/**
+ * Load the messages of the imported capture one page at a time, newest first,
+ * appending every page to the table so a large capture is displayed progressively.
+ * @param offset - The offset of the page to load
+ * @returns {void}
+ */
+function loadUploadedMessages(offset = 0) {
+    fetch(`${window.location.origin}/upload?offset=${offset}&limit=${UPLOAD_PAGE_SIZE}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Network response was not ok, status: ' + response.status);
+            }
+            return response.json();
+        })
+        .then(data => {
+            const messageTable = document.getElementById('messageTableBody');
+            if (offset === 0) {
+                messageTable.innerHTML = '';
+            }
+            const rows = document.createDocumentFragment();
+            data.messages.forEach((message) => {
+                rows.appendChild(createMessageRow(message));
+            });
+            messageTable.appendChild(rows);
+
+            // Apply the search to the new rows too.
+            const filterElement = document.getElementById('filter');
+            if (filterElement && filterElement.value) {
+                filterElement.dispatchEvent(new Event('keyup'));
+            }
+
+            if (data.next_offset !== null && data.next_offset !== undefined) {
+                // Let the browser render this page before asking for the next one.
+                setTimeout(() => loadUploadedMessages(data.next_offset), 0);
+            }
+        })
+        .catch(error => {
+            console.error('Error loading the uploaded messages:', error);
+        });
+}
+
+/**
+ * Replay the uploaded capture through the live ingest pipeline at the selected speed.
+ * The replayed messages show up on the live pages (messages, charts and animations).
+ * @returns {void}
+ */
+function startReplay() {
+    const speed = Number(document.getElementById('replaySpeed').value);
+    fetch(`${window.location.origin}/replay`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ speed: speed })
+    })
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                showReplayStatus(data.error);
+                return;
+            }
+            pollReplay();
+        })
+        .catch(error => showReplayStatus('Error: ' + error));
+}
+
+/**
+ * Show the progress of the replay every second, then its report.
+ * @returns {void}
+ */
+function pollReplay() {
+    fetch(`${window.location.origin}/replay`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.state === 'running') {
+                showReplayStatus(`Replaying: ${data.sent} of ${data.messages} messages sent, ${data.dropped} dropped`);
+                setTimeout(pollReplay, 1000);
+            } else if (data.report) {
+                const report = data.report;
+                const process = report.latency.process || {};
+                showReplayStatus(`Replay ${data.state}: ${report.processed} messages in ${report.duration_s} s ` +
+                    `(${report.throughput_per_s} messages/s), ${report.dropped} dropped, ${report.errors} errors, ` +
+                    `processing p50 ${process.p50_ms} ms, p99 ${process.p99_ms} ms`);
+            }
+        })
+        .catch(error => showReplayStatus('Error: ' + error));
+}
+
+function showReplayStatus(text) {
+    document.getElementById('replayStatus').textContent = text;
+}
+
 // BT - Call to fetch messages to display on our table.
-fetchMessages();
+loadUploadedMessages();
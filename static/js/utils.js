@@ -53,20 +53,52 @@ function connectToBroker(event) {
 }
 
 
-// Function to start fetching messages every 5 seconds
+// The live message stream of this page, see openMessageStream()
+let messageStream = null;
+
+// Open a Server-Sent Events stream of live messages from /stream, closing the previous one.
+// params are the query parameters (filter, deveui, event). onMessage is called for every message,
+// onReset when the server no longer knows our position and the page must clear what it displays.
+// EventSource reconnects by itself and resumes from the last message it received.
+function openMessageStream(params, onMessage, onReset) {
+    if (messageStream) {
+        messageStream.close();
+    }
+    const query = new URLSearchParams(params).toString();
+    messageStream = new EventSource(`${window.location.origin}/stream?${query}`);
+    messageStream.onmessage = (event) => onMessage(JSON.parse(event.data));
+    messageStream.addEventListener('reset', () => {
+        if (onReset) {
+            onReset();
+        }
+    });
+    return messageStream;
+}
+
+// Start receiving messages: from the live stream when the browser supports it,
+// otherwise by fetching the messages every 5 seconds.
 function startFetchingMessages() {
 
     const connectForm = document.getElementById('connectForm');
     const filterElement = document.getElementById('filter');
     const sensorSelectChartsElement = document.getElementById('sensorSelect-charts');
     const sensorSelectAnimationsElement = document.getElementById('sensorSelect-animations')
+    const useStream = !!window.EventSource;
 
     if(connectForm && filterElement){
-        setInterval(() => fetchMessages(filterElement.value), 5000);
+        if (useStream) {
+            streamMessages(filterElement.value);
+        } else {
+            setInterval(() => fetchMessages(filterElement.value), 5000);
+        }
     }
     // BT - Select charts page.
     else if (sensorSelectChartsElement){
-        setInterval(() => getData(localStorage.getItem('sensorSelected-charts')), 5000);
+        if (useStream) {
+            streamChart(localStorage.getItem('sensorSelected-charts'));
+        } else {
+            setInterval(() => getData(localStorage.getItem('sensorSelected-charts')), 5000);
+        }
     }
     // BT - Select 'Animation' page
     else if (sensorSelectAnimationsElement){
@@ -74,6 +106,12 @@ function startFetchingMessages() {
         // BT - This is where we must call door_window, temperature, tilt...etc.
         //#################################################################################
         const sensorLocalStorage = localStorage.getItem('sensorSelected-animations');
+
+        if (useStream) {
+            streamAnimation(sensorLocalStorage);
+            return;
+        }
+
         // BT - Using pop() to get the last element
         const partAfterDash = sensorLocalStorage.split('-').pop().trim();
 
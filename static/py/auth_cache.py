@@ -0,0 +1,144 @@
+"""
+This file contains the AuthCache class which remembers the successful gateway logins for a while.
+Every POST to /login called the gateway login API synchronously, so many operators logging in at once (or
+every session recreated after a restart) queued up behind each other. Credentials verified by the gateway are
+kept as salted HMAC digests for 'ttl' seconds and checked in memory, and identical logins arriving while one of
+them is being verified wait for that single gateway call instead of making their own.
+This file is used by server.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SUCCESS = 'success'
+
+
+class _Flight:
+    """
+    A gateway login in progress, shared by the identical logins made meanwhile.
+    """
+
+    __slots__ = ('done', 'status')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.status = None
+
+
+class AuthCache:
+    """
+    Cache of the logins accepted by authenticate(username, password, ip), which returns the gateway
+    login status ('success' when accepted).
+
+    An accepted login is kept for 'ttl' seconds, at most 'max_entries' of them (the least recently used
+    goes first). A cache entry holds a random salt and the HMAC-SHA256 of the password with it under a
+    key drawn when the app starts, never the password. Rejected logins are not cached. A ttl of 0
+    disables the cache, identical concurrent logins are still verified once.
+    """
+
+    def __init__(self, authenticate, ttl=300, max_entries=256):
+        self.authenticate_upstream = authenticate
+        self.ttl = ttl
+        self.max_entries = max(1, int(max_entries))
+        self._key = os.urandom(32)
+        self._lock = threading.Lock()
+        # (ip, username) -> (salt, digest, expires), least recently used first.
+        self._entries = OrderedDict()
+        # (ip, username, unsalted digest) -> _Flight of the gateway logins in progress.
+        self._flights = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.evictions = 0
+
+    def authenticate(self, username, password, ip):
+        """
+        Return the login status of the credentials: 'success' from the cache or from the gateway.
+        """
+        secret = (password or '').encode()
+        entry_key = (ip, username)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None:
+                salt, digest, expires = entry
+                if expires <= now:
+                    del self._entries[entry_key]
+                elif hmac.compare_digest(digest, self._digest(salt, secret)):
+                    self._entries.move_to_end(entry_key)
+                    self.hits += 1
+                    return SUCCESS
+            self.misses += 1
+
+            flight_key = (ip, username, self._digest(b'', secret))
+            flight = self._flights.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[flight_key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            return flight.status
+
+        self.upstream_calls += 1
+        try:
+            status = self.authenticate_upstream(username, password, ip)
+        except Exception as e:
+            logger.error("Login of %s at %s failed: %s", username, ip, e)
+            status = 'failed'
+
+        with self._lock:
+            if status == SUCCESS and self.ttl > 0:
+                salt = os.urandom(16)
+                self._entries[entry_key] = (salt, self._digest(salt, secret), time.monotonic() + self.ttl)
+                self._entries.move_to_end(entry_key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            del self._flights[flight_key]
+        flight.status = status
+        flight.done.set()
+        return status
+
+    def invalidate(self, username=None, ip=None):
+        """
+        Forget the cached logins of a username and/or ip, all of them when both are None.
+        """
+        with self._lock:
+            for key in [key for key in self._entries
+                        if (ip is None or key[0] == ip) and (username is None or key[1] == username)]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            'ttl': self.ttl,
+            'max_entries': self.max_entries,
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'upstream_calls': self.upstream_calls,
+            'evictions': self.evictions,
+        }
+
+    def _digest(self, salt, secret):
+        return hmac.new(self._key, salt + secret, hashlib.sha256).digest()
@@ -0,0 +1,546 @@
+"""
+This file contains the backends the web server uses for everything owned by the MQTT ingest: the broker connection,
+the downlinks and campaigns, the ingest pipeline and the on-disk history.
+LocalBackend runs them in the web server process (python server.py). RemoteBackend is used by the web workers of the
+multi-process serving mode (gunicorn with wsgi.py): the ingest runs in its own process (ingest_owner.py), the workers
+call it (ingest_rpc.py) and copy the decoded messages it writes into a shared-memory ring (shared_ring.py) into their
+own message buffer and stream hub when they serve them, so the message reads are served locally by each worker.
+This file is used by server.py, wsgi.py and ingest_owner.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from static.py import mqtt_utils
+from static.py.capture_import import CHUNK_SIZE, import_capture
+from static.py.ingest_rpc import BackendError, RPCClient, key_path, ring_path, rpc_address, run_dir
+from static.py.message_record import MessageRecord
+from static.py.message_store import FIFO
+from static.py.replay import RUNNING, Replay
+from static.py.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+LOCAL = 'local'
+REMOTE = 'remote'
+
+
+def create_backend(mode=LOCAL):
+    """
+    Return the backend of the serving mode: LOCAL (ingest in this process) or REMOTE (ingest process).
+    """
+    if mode == LOCAL:
+        return LocalBackend()
+    if mode == REMOTE:
+        return RemoteBackend()
+    raise ValueError(f"backend must be '{LOCAL}' or '{REMOTE}'")
+
+
+"""
+Following is the backend running the ingest in the web server process.
+"""
+
+
+class LocalBackend:
+    """
+    The ingest objects of mqtt_utils, used directly. The ingest process serves this backend to the workers.
+    """
+
+    mode = LOCAL
+
+    def __init__(self):
+        self.broker_ip = None
+        self.broker_port = 1883
+        mqtt_utils.create_ingest()
+        self.campaigns = mqtt_utils.campaign_scheduler
+        self.pipeline = mqtt_utils.ingest_pipeline
+        self.uploads = Uploads(self.pipeline)
+
+    @property
+    def history(self):
+        """
+        The on-disk history (a HistoryStore), None while it is disabled.
+        """
+        return mqtt_utils.message_history
+
+    def start(self):
+        """
+        Reload the history, once when the app starts.
+        """
+        mqtt_utils.open_history()
+
+    def sync(self):
+        """
+        Called before a request reads the message buffer, which is always up to date here.
+        """
+
+    def close(self):
+        """
+        Write the queued messages to the history and disconnect the downlink publisher, before the app exits.
+        """
+        mqtt_utils.close_history()
+        mqtt_utils.downlink_publisher.close()
+
+    def broker(self):
+        return self.broker_ip, self.broker_port
+
+    def connect(self, broker_ip, port, topic):
+        """
+        Connect to the MQTT broker and subscribe to topic. Returns (response, HTTP status).
+        """
+        logger.info("Setting broker_ip to: %s", broker_ip)
+        try:
+            mqtt_utils.connect_broker(broker_ip, port, topic)
+        except Exception as e:
+            # Log the error message
+            logger.error("Error connecting to MQTT broker: %s", e)
+            return {"error": f"Could not connect to MQTT broker: {str(e)}"}, 500
+        self.broker_ip, self.broker_port = broker_ip, port
+        return {"message": "Connected to MQTT broker"}, 200
+
+    def send_downlink(self, data):
+        """
+        Publish a downlink to the broker of the last connect(). Returns (response, HTTP status).
+        """
+        return mqtt_utils.send_downlink(data, self.broker_ip, self.broker_port)
+
+    def devices(self):
+        """
+        Return every device record of the device registry.
+        """
+        mqtt_utils.message_buffer.decode_pending()
+        return mqtt_utils.device_registry.devices()
+
+    def device_event_options(self, excluded_events=()):
+        """
+        Return the 'deveui - event' options of the sensor drop-downs, see DeviceRegistry.
+        """
+        mqtt_utils.message_buffer.decode_pending()
+        return mqtt_utils.device_registry.device_event_options(excluded_events)
+
+    def stats(self):
+        """
+        Return the statistics of the ingest objects for /stats.
+        """
+        history = self.history
+        return {
+            'ingest': self.pipeline.stats(),
+            'decoder_cache': mqtt_utils.decode_cache.stats(),
+            'downlink': mqtt_utils.downlink_publisher.stats(),
+            'campaigns': self.campaigns.stats(),
+            'history': history.stats() if history is not None else None,
+            'devices': len(mqtt_utils.device_registry),
+        }
+
+
+class Uploads:
+    """
+    The capture last imported on the Upload page and its replay through the ingest pipeline. Kept by the
+    process which owns the ingest, so every web worker pages and replays the same capture and only one
+    replay runs at a time.
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.capture = None
+        self.replay = None
+        self._lock = threading.Lock()
+
+    def load(self, stream, filename=''):
+        """
+        Import a capture file, it replaces the previous one. Raises ValueError when it is not a valid capture.
+        """
+        capture = import_capture(stream, filename, capacity=get_setting('upload', 'capacity'),
+                                 max_bytes=get_setting('upload', 'max_bytes'))
+        self.capture = capture
+        return capture.stats()
+
+    def load_file(self, path, filename=''):
+        """
+        Import the capture a web worker saved in the upload directory (see RemoteUploads), then delete it.
+        """
+        directory = os.path.realpath(upload_dir())
+        path = os.path.realpath(path)
+        if os.path.dirname(path) != directory:
+            raise ValueError(f"{path} is not in the upload directory")
+        try:
+            with open(path, 'rb') as file:
+                return self.load(file, filename)
+        finally:
+            os.remove(path)
+
+    def page(self, message_type=None, deveui=None, event=None, start_ts=None, end_ts=None, offset=0, limit=100):
+        """
+        Return (messages, total, stats) for a page of the capture (see UploadedCapture.page), the messages
+        as dictionaries. None when no capture was imported.
+        """
+        capture = self.capture
+        if capture is None:
+            return None
+        messages, total = capture.page(message_type, deveui, event, start_ts, end_ts, offset, limit)
+        return [m.to_dict() for m in messages], total, capture.stats()
+
+    def replay_status(self):
+        replay = self.replay
+        return replay.status() if replay is not None else {'state': 'idle'}
+
+    def stop_replay(self):
+        replay = self.replay
+        if replay is not None:
+            replay.stop()
+        return self.replay_status()
+
+    def start_replay(self, speed=1.0):
+        """
+        Replay the capture at speed (see Replay). Returns (response, HTTP status).
+        """
+        with self._lock:
+            if self.replay is not None and self.replay.state == RUNNING:
+                return {"error": "A replay is already running"}, 409
+            capture = self.capture
+            if capture is None or not len(capture):
+                return {"error": "Upload a capture first"}, 400
+            self.replay = Replay(list(capture.store.snapshot()), self.pipeline, speed)
+            self.replay.start()
+            return self.replay.status(), 200
+
+
+def upload_dir():
+    """
+    Directory where the web workers hand the uploaded captures to the ingest process.
+    """
+    return os.path.join(run_dir(), 'uploads')
+
+
+"""
+Following is the backend of the web workers calling the ingest process.
+"""
+
+
+class RemoteHistory:
+    """
+    The history of the ingest process, read like a HistoryStore.
+    """
+
+    def __init__(self, rpc):
+        self.rpc = rpc
+
+    @property
+    def last_seq(self):
+        return self.rpc.call('history.last_seq')
+
+    def read_before(self, seq, limit=50):
+        return [MessageRecord.from_dict(message) for message in self.rpc.call('history.read_before', seq, limit)]
+
+    def read_range(self, after_seq=0, start_ts=None, end_ts=None, limit=None, until_seq=None, chunk=500):
+        """
+        Yield the messages like HistoryStore.read_range, fetched chunk messages at a time.
+        """
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = chunk if remaining is None else min(chunk, remaining)
+            messages = self.rpc.call('history.read_range', after_seq, start_ts, end_ts, size, until_seq)
+            for message in messages:
+                yield MessageRecord.from_dict(message)
+            if len(messages) < size:
+                return
+            after_seq = messages[-1]['seq']
+            if remaining is not None:
+                remaining -= len(messages)
+
+    def stats(self):
+        return self.rpc.call('history.stats')
+
+
+class RemotePipeline:
+    """
+    The ingest pipeline of the ingest process, used like an IngestPipeline.
+    """
+
+    def __init__(self, rpc):
+        self.rpc = rpc
+
+    def submit(self, topic, payload, receive_ts=None, block=False, replayed=False):
+        return self.rpc.call('ingest.submit', topic, payload, receive_ts, block, replayed)
+
+    def join(self):
+        self.rpc.request('ingest.join', timeout=None)
+
+    def stats(self):
+        return self.rpc.call('ingest.stats')
+
+    def reset_latency(self):
+        self.rpc.call('ingest.reset_latency')
+
+
+class RemoteUploads:
+    """
+    The Uploads of the ingest process. An uploaded file is copied to the upload directory and imported there.
+    """
+
+    def __init__(self, rpc):
+        self.rpc = rpc
+
+    def load(self, stream, filename=''):
+        os.makedirs(upload_dir(), mode=0o700, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix='.capture', dir=upload_dir())
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                shutil.copyfileobj(stream, file, CHUNK_SIZE)
+            return self.rpc.call('uploads.load_file', path, filename)
+        finally:
+            # Deleted by the ingest process once imported.
+            if os.path.exists(path):
+                os.remove(path)
+
+    def page(self, message_type=None, deveui=None, event=None, start_ts=None, end_ts=None, offset=0, limit=100):
+        return self.rpc.call('uploads.page', message_type, deveui, event, start_ts, end_ts, offset, limit)
+
+    def replay_status(self):
+        return self.rpc.call('uploads.replay_status')
+
+    def stop_replay(self):
+        return self.rpc.call('uploads.stop_replay')
+
+    def start_replay(self, speed=1.0):
+        return tuple(self.rpc.call('uploads.start_replay', speed))
+
+
+class RemoteCampaigns:
+    """
+    The CampaignScheduler of the ingest process.
+    """
+
+    def __init__(self, rpc):
+        self.rpc = rpc
+        self._defaults = None
+
+    @property
+    def defaults(self):
+        if self._defaults is None:
+            self._defaults = self.rpc.call('campaigns.defaults')
+        return self._defaults
+
+    def create(self, data, deveuis, port=2, name=None, qos=None, **limits):
+        return self.rpc.call('campaigns.create', data, deveuis, port=port, name=name, qos=qos, **limits)
+
+    def get(self, campaign_id, targets=True):
+        return self.rpc.call('campaigns.get', campaign_id, targets)
+
+    def campaigns(self):
+        return self.rpc.call('campaigns.list')
+
+    def cancel(self, campaign_id):
+        return self.rpc.call('campaigns.cancel', campaign_id)
+
+    def stats(self):
+        return self.rpc.call('campaigns.stats')
+
+
+class RingMirror:
+    """
+    Copies the messages the ingest process writes into the shared ring into the message buffer and the
+    stream hub of this worker. The ingest process writes them decoded, a worker never runs the decoder.
+
+    Copying costs a json.loads(), a MessageRecord and a store insert per message, so a worker only copies
+    when it needs the messages: sync() is called before a request reads the buffer, and the mirror thread
+    only polls the ring every poll_interval seconds while /stream clients are connected. A worker serving
+    no reads does no work per message. With the 'fifo' policy only the newest 'capacity' records are
+    copied, the older ones would be evicted at once.
+
+    When the ingest process restarts it creates a new ring, the buffer is then emptied and filled again
+    from the new ring. Messages overwritten in the ring before this worker copied them are counted in
+    'missed', they are still read from the history.
+    """
+
+    def __init__(self, path, store, hub, poll_interval=0.05, batch_size=256):
+        self.path = path
+        self.store = store
+        self.hub = hub
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._ring = None
+        self._position = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.mirrored = 0
+        self.skipped = 0
+        self.missed = 0
+        self.reopened = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ring-mirror', daemon=True)
+            self._thread.start()
+
+    def sync(self):
+        """
+        Copy the records written since the last call. Returns the number of messages copied.
+        """
+        with self._lock:
+            if self._ring is None or self._ring.replaced():
+                self._open()
+            if self._ring is None:
+                return 0
+            copied = 0
+            while True:
+                count = self._copy()
+                if count is None:
+                    return copied
+                copied += count
+
+    def stats(self):
+        ring = self._ring
+        return {
+            'path': self.path,
+            'position': self._position,
+            'head': ring.head if ring is not None else None,
+            'mirrored': self.mirrored,
+            'skipped': self.skipped,
+            'missed': self.missed,
+            'reopened': self.reopened,
+        }
+
+    def _run(self):
+        while True:
+            try:
+                if len(self.hub):
+                    self.sync()
+                time.sleep(self.poll_interval)
+            except Exception as e:
+                logger.warning("Error mirroring the message ring %s: %s", self.path, e)
+                time.sleep(1.0)
+
+    def _open(self):
+        # Imported here, the ring module needs fcntl which only exists on POSIX.
+        from static.py.shared_ring import SharedRing
+
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+            self.reopened += 1
+        try:
+            self._ring = SharedRing.open(self.path)
+        except (FileNotFoundError, ValueError):
+            return
+        self._position = 0
+        # A new ingest process: its messages replace the buffered ones.
+        self.store.clear()
+        logger.info("Mirroring the message ring %s", self.path)
+
+    def _copy(self):
+        """
+        Copy the next records of the ring. Returns the number of messages copied, None when there was
+        nothing new.
+        """
+        head = self._ring.head
+        if head <= self._position:
+            return None
+        # Not counted as missed when catching up with a ring just opened, it only keeps the newest messages.
+        opened = not self._position
+        first = head - self.store.capacity
+        if self.store.policy == FIFO and self.store.capacity and first > self._position:
+            # Only the newest 'capacity' messages stay in the buffer, do not parse the others.
+            self.skipped += max(first - max(self._position, head - self._ring.slots), 0)
+            self._position = first
+
+        records, head, missed = self._ring.read(self._position, self.batch_size)
+        if not opened:
+            self.missed += missed
+        if not records:
+            self._position = max(self._position, head)
+            return None
+
+        last_seq = self.store.last_seq
+        messages = [MessageRecord.from_dict(json.loads(bytes(data)))
+                    for position, seq, data in records if seq > last_seq]
+        self._position = records[-1][0]
+        if messages:
+            self.store.restore(messages)
+            for message in messages:
+                self.hub.publish(message)
+            self.mirrored += len(messages)
+        return len(messages)
+
+
+class RemoteBackend:
+    """
+    Backend of a web worker: the calls go to the ingest process, the messages come from the shared ring.
+    """
+
+    mode = REMOTE
+
+    def __init__(self):
+        self._rpc = None
+        self._lock = threading.Lock()
+        self.mirror = RingMirror(ring_path(), mqtt_utils.message_buffer, mqtt_utils.message_hub,
+                                 poll_interval=get_setting('serving', 'poll_interval'))
+        # RemoteHistory, False while the ingest process was not asked yet whether the history is enabled.
+        self._history = False
+
+    @property
+    def rpc(self):
+        # Connected on first use, after the worker process was forked.
+        with self._lock:
+            if self._rpc is None:
+                self._rpc = RPCClient(rpc_address(), key_path(), timeout=get_setting('serving', 'rpc_timeout'))
+            return self._rpc
+
+    @property
+    def campaigns(self):
+        return RemoteCampaigns(self.rpc)
+
+    @property
+    def pipeline(self):
+        return RemotePipeline(self.rpc)
+
+    @property
+    def uploads(self):
+        return RemoteUploads(self.rpc)
+
+    @property
+    def history(self):
+        if self._history is False:
+            self._history = RemoteHistory(self.rpc) if self.rpc.call('history.enabled') else None
+        return self._history
+
+    def start(self):
+        self.mirror.start()
+
+    def sync(self):
+        self.mirror.sync()
+
+    def close(self):
+        # The ingest process writes and closes its history itself.
+        if self._rpc is not None:
+            self._rpc.close()
+
+    def broker(self):
+        return tuple(self.rpc.call('broker'))
+
+    def connect(self, broker_ip, port, topic):
+        return tuple(self.rpc.call('connect', broker_ip, port, topic))
+
+    def send_downlink(self, data):
+        return tuple(self.rpc.call('send_downlink', data))
+
+    def devices(self):
+        return self.rpc.call('devices')
+
+    def device_event_options(self, excluded_events=()):
+        return self.rpc.call('devices.options', list(excluded_events))
+
+    def stats(self):
+        stats = self.rpc.call('stats')
+        stats['ring'] = self.mirror.stats()
+        return stats
@@ -0,0 +1,284 @@
+"""
+This file contains the import of the message captures uploaded on the Upload page.
+A capture (a JSON array as written by /dump_messages, or NDJSON) is parsed incrementally from the uploaded
+file, every message is checked and stored as a MessageRecord in a MessageStore like the live messages, and
+the message_type, deveui and time indexes used by /upload are built once when the import ends.
+This file is used by backend.py and replay.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import codecs
+import json
+import logging
+from bisect import bisect_left, bisect_right
+
+from static.py.message_record import MessageRecord
+from static.py.message_store import MessageStore
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 65536
+
+# A single message larger than this is not a message capture.
+MAX_RECORD_SIZE = 1048576
+
+# A decoding error this close to the end of the buffer may only mean the value continues in the next
+# chunk, e.g. a literal, a number or a \uXXXX escape cut in two.
+TRUNCATION_MARGIN = 16
+
+_json_decoder = json.JSONDecoder()
+
+
+"""
+Following functions are used to parse a capture file incrementally.
+"""
+
+
+def _text_chunks(stream, chunk_size):
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                yield tail
+            return
+        yield data if isinstance(data, str) else decoder.decode(data)
+
+
+def iter_capture(stream, chunk_size=CHUNK_SIZE, max_record_size=MAX_RECORD_SIZE):
+    """
+    Yield the items of a capture file one by one, reading it chunk_size bytes at a time.
+    A file starting with '[' is read as a JSON array, anything else as NDJSON (one JSON value per line).
+    Raises ValueError when the file is not valid JSON.
+    """
+    chunks = _text_chunks(stream, chunk_size)
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk
+        if buffer.strip():
+            break
+    stripped = buffer.lstrip()
+    if not stripped:
+        return
+    if stripped[0] == '[':
+        yield from _iter_array(stripped, chunks, max_record_size, len(buffer) - len(stripped))
+    else:
+        yield from _iter_lines(stripped, chunks, max_record_size)
+
+
+def _iter_array(buffer, chunks, max_record_size, offset=0):
+    # offset is the position of buffer[0] in the file, in characters, for the error messages.
+    pos = 1
+    first = True
+    while True:
+        buffer, pos, offset = _skip_whitespace(buffer, pos, offset, chunks)
+        if buffer[pos] == ']' and first:
+            return
+        if not first:
+            if buffer[pos] == ']':
+                return
+            if buffer[pos] != ',':
+                raise ValueError(f"Expected ',' or ']' in the JSON array at character {offset + pos}, "
+                                 f"found {buffer[pos]!r}")
+            buffer, pos, offset = _skip_whitespace(buffer, pos + 1, offset, chunks)
+
+        while True:
+            try:
+                item, end = _json_decoder.raw_decode(buffer, pos)
+                # A number at the end of the buffer may continue in the next chunk.
+                if end < len(buffer) or isinstance(item, (dict, list)):
+                    break
+            except json.JSONDecodeError as e:
+                if not _truncated(e, buffer):
+                    raise ValueError(f"Invalid JSON in the capture at character {offset + e.pos}: {e.msg}")
+                error = e
+            else:
+                error = None
+            chunk = next(chunks, None)
+            if chunk is None:
+                if error is not None:
+                    raise ValueError(f"Invalid JSON in the capture at character {offset + error.pos}: {error.msg}")
+                break
+            buffer = buffer[pos:] + chunk
+            offset += pos
+            pos = 0
+            if len(buffer) - len(chunk) > max_record_size:
+                raise ValueError(f"Capture message at character {offset} is larger than {max_record_size} characters")
+
+        yield item
+        first = False
+        pos = end
+        if pos > CHUNK_SIZE:
+            buffer = buffer[pos:]
+            offset += pos
+            pos = 0
+
+
+def _truncated(error, buffer):
+    """
+    True when the decoding error may come from the value being cut at the end of the buffer rather than
+    from invalid JSON.
+    """
+    return error.msg.startswith('Unterminated string') or error.pos >= len(buffer) - TRUNCATION_MARGIN
+
+
+def _skip_whitespace(buffer, pos, offset, chunks):
+    """
+    Return (buffer, pos, offset) with pos on the next non-whitespace character, reading more chunks if needed.
+    """
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        if pos < len(buffer):
+            return buffer, pos, offset
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise ValueError("Unexpected end of the JSON array")
+        offset += len(buffer)
+        buffer = chunk
+        pos = 0
+
+
+def _iter_lines(buffer, chunks, max_record_size):
+    line_number = 0
+    while True:
+        lines = buffer.split('\n')
+        buffer = lines.pop()
+        for line in lines:
+            line_number += 1
+            yield _parse_line(line, line_number)
+        if len(buffer) > max_record_size:
+            raise ValueError(f"Line {line_number + 1} of the capture is too long")
+        chunk = next(chunks, None)
+        if chunk is None:
+            break
+        buffer += chunk
+    if buffer.strip():
+        yield _parse_line(buffer, line_number + 1)
+
+
+def _parse_line(line, line_number):
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON on line {line_number} of the capture: {e.msg}")
+
+
+def normalize(item):
+    """
+    Return the MessageRecord of one captured message, or None when the item is not a message.
+    """
+    if not isinstance(item, dict):
+        return None
+    topic = item.get('topic')
+    message_type = item.get('type', 'json')
+    if not isinstance(topic, str) or not isinstance(message_type, str) or 'data' not in item:
+        return None
+    if message_type == 'json' and not isinstance(item['data'], dict):
+        return None
+    return MessageRecord.from_dict(item)
+
+
+"""
+Following class is used to page through an imported capture.
+"""
+
+
+class UploadedCapture:
+    """
+    The messages of an imported capture with their message_type, deveui, event and time indexes.
+    The indexes are lists of sequence numbers in capture order, built once after the import.
+    """
+
+    def __init__(self, store, filename='', skipped=0):
+        self.store = store
+        self.filename = filename
+        self.skipped = skipped
+
+        self._messages = {}
+        self._by_message_type = {}
+        self._by_deveui = {}
+        self._by_event = {}
+        times = []
+        for m in store.snapshot():
+            self._messages[m.seq] = m
+            message_type = m.decoded_field('message_type') if m.type == 'json' else None
+            if message_type is not None:
+                self._by_message_type.setdefault(message_type, []).append(m.seq)
+            if m.deveui is not None:
+                self._by_deveui.setdefault(m.deveui.lower(), []).append(m.seq)
+            if m.event is not None:
+                self._by_event.setdefault(m.event.lower(), []).append(m.seq)
+            if m.ts is not None:
+                times.append((m.ts, m.seq))
+        times.sort()
+        self._times = times
+
+    def __len__(self):
+        return len(self._messages)
+
+    def page(self, message_type=None, deveui=None, event=None, start_ts=None, end_ts=None, offset=0, limit=100):
+        """
+        Return (messages, total): the page of the selected messages, newest first, and how many there are.
+        """
+        selections = []
+        if message_type:
+            selections.append(self._by_message_type.get(message_type, []))
+        if deveui:
+            selections.append(self._by_deveui.get(deveui.lower(), []))
+        if event:
+            selections.append(self._by_event.get(event.lower(), []))
+        if start_ts is not None or end_ts is not None:
+            low = bisect_left(self._times, (start_ts,)) if start_ts is not None else 0
+            high = bisect_right(self._times, (end_ts, float('inf'))) if end_ts is not None else len(self._times)
+            selections.append(sorted(seq for ts, seq in self._times[low:high]))
+
+        if not selections:
+            seqs = list(self._messages)
+        else:
+            # Walk the smallest selection and check the others.
+            selections.sort(key=len)
+            others = [set(selection) for selection in selections[1:]]
+            seqs = [seq for seq in selections[0] if all(seq in other for other in others)]
+
+        total = len(seqs)
+        end = total - offset
+        page = seqs[max(end - limit, 0):max(end, 0)]
+        return [self._messages[seq] for seq in reversed(page)], total
+
+    def stats(self):
+        store_stats = self.store.stats()
+        return {
+            'filename': self.filename,
+            'imported': len(self._messages),
+            'skipped': self.skipped,
+            'evicted': store_stats['evicted'],
+        }
+
+
+def import_capture(stream, filename='', capacity=10000, max_bytes=0):
+    """
+    Parse a capture file and return its UploadedCapture. Messages beyond the capacity or memory budget
+    evict the oldest ones. Raises ValueError when the file is not a valid capture.
+    """
+    store = MessageStore(capacity=capacity, max_bytes=max_bytes)
+    skipped = 0
+    for item in iter_capture(stream):
+        if item is None:
+            continue
+        record = normalize(item)
+        if record is None:
+            skipped += 1
+            continue
+        store.put(record)
+    capture = UploadedCapture(store, filename, skipped)
+    logger.info("Imported %s messages from %s (%s skipped, %s evicted)",
+                len(capture), filename, skipped, store.evicted)
+    return capture
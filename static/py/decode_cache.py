@@ -0,0 +1,100 @@
+"""
+This file contains the DecodeCache class, a bounded LRU cache in front of the RadioBridge decoder.
+Sensors send many payloads that only differ by the packet counter (the lower nibble of the first byte):
+periodic supervisory reports, repeated door states, unchanged temperatures. The cache is keyed on the payload
+bytes with the counter masked out, and on a hit only packet_count is filled in from the new payload.
+This file is used by mqtt_utils.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+def cache_key(payload_bytes):
+    """
+    Return the payload bytes with the packet counter nibble cleared.
+    """
+    return bytes((payload_bytes[0] & 0xf0,)) + bytes(payload_bytes[1:])
+
+
+class DecodeCache:
+    """
+    LRU cache of the decoded payloads of a Decoder, holding at most 'capacity' payloads.
+    A capacity of 0 disables the cache, every payload is then decoded.
+    Instead of a decoder, decoder_factory() may be given: it is called for the decoder on first use.
+    """
+
+    def __init__(self, decoder=None, capacity=1024, decoder_factory=None):
+        if decoder is None and decoder_factory is None:
+            raise ValueError("decoder or decoder_factory must be given")
+        self._decoder = decoder
+        self._decoder_factory = decoder_factory
+        self.capacity = max(0, int(capacity))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def decoder(self):
+        if self._decoder is None:
+            self._decoder = self._decoder_factory()
+        return self._decoder
+
+    def decode(self, payload_bytes):
+        """
+        Return the decoded payload like Decoder.decodePayload, from the cache when an identical payload
+        apart from the packet counter was decoded before. Decoder exceptions are raised and not cached.
+        """
+        if not self.capacity or len(payload_bytes) < 2:
+            return self.decoder.decodePayload(None, payload_bytes)
+
+        key = cache_key(payload_bytes)
+        with self._lock:
+            cached = self._entries.get(key, _MISSING)
+            if cached is not _MISSING:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if cached is not _MISSING:
+            if cached is None:
+                return None
+            decoded = dict(cached)
+            decoded['packet_count'] = payload_bytes[0] & 0x0f
+            return decoded
+
+        decoded = self.decoder.decodePayload(None, payload_bytes)
+        with self._lock:
+            self._entries[key] = dict(decoded) if decoded is not None else None
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return decoded
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'capacity': self.capacity,
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+        }
@@ -0,0 +1,191 @@
+"""
+This file contains the regression check and the benchmark of the RadioBridge decoder.
+Every payload of the golden corpus (static/data/decoder_corpus.py) is decoded by decodePayload, decode_many
+and the DecodeCache and compared with its expected output, then the decoding speed (packets per second) and
+the memory kept per decoded packet are measured for every event, so decoder performance work is measured
+and cannot silently change the outputs.
+This file is run on its own and exits with status 1 when an output differs from the corpus:
+
+    python -m static.py.decoder_bench [--packets N] [--json]
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from static.data.config import message_type_map
+from static.data.decoder_corpus import DECODER_CORPUS
+from static.py.decode_cache import DecodeCache
+from static.py.radiobridgev3 import Decoder, load_numpy
+
+
+def corpus():
+    """
+    Return the corpus as (name, payload bytes, expected data_decoded).
+    """
+    return [(name, bytes.fromhex(payload), expected) for name, payload, expected in DECODER_CORPUS]
+
+
+def event_groups(entries):
+    """
+    Return the corpus payloads grouped by event name ('undecoded' for the events the decoder skips).
+    """
+    groups = {}
+    for name, payload, expected in entries:
+        event = expected['event'] if expected is not None else 'undecoded'
+        groups.setdefault(event, []).append(payload)
+    return groups
+
+
+"""
+Following functions are used to check the decoder outputs against the corpus.
+"""
+
+
+def verify(decoder=None):
+    """
+    Return the list of differences between the decoder outputs and the corpus, empty when they all match.
+    """
+    decoder = decoder or Decoder()
+    entries = corpus()
+    failures = []
+
+    covered = {payload[1] for name, payload, expected in entries}
+    for event in sorted(set(message_type_map) - covered):
+        failures.append(f"no corpus payload for event 0x{event:02X} ({message_type_map[event]})")
+
+    cache = DecodeCache(decoder, capacity=len(entries))
+    for name, payload, expected in entries:
+        try:
+            decoded = decoder.decodePayload(None, payload)
+        except Exception as e:
+            failures.append(f"{name}: decodePayload raised {type(e).__name__}: {e}")
+            continue
+        if decoded != expected:
+            failures.append(f"{name}: decodePayload returned {decoded}, expected {expected}")
+
+        # Once to fill the cache, once from it with another packet counter.
+        for cached_payload in (payload, bytes((payload[0] ^ 0x0f,)) + payload[1:]):
+            cached = cache.decode(cached_payload)
+            if expected is not None:
+                expected = dict(expected, packet_count=cached_payload[0] & 0x0f)
+            if cached != expected:
+                failures.append(f"{name}: DecodeCache returned {cached}, expected {expected}")
+
+    for vectorized in ((False, True) if load_numpy() is not None else (False,)):
+        columns = decoder.decode_many([payload for name, payload, expected in entries], vectorized)
+        rows = {}
+        for event, values in columns.items():
+            for row, index in enumerate(values['index']):
+                rows[index] = {'event': event, **{key: column[row] for key, column in values.items()
+                                                  if key != 'index' and column[row] is not None}}
+        for index, (name, payload, expected) in enumerate(entries):
+            if rows.get(index) != expected:
+                failures.append(f"{name}: decode_many(vectorized={vectorized}) returned {rows.get(index)}, "
+                                f"expected {expected}")
+
+    return failures
+
+
+"""
+Following functions are used to measure the decoding speed and memory.
+"""
+
+
+def _rate(function, packets):
+    started = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - started
+    return round(packets / elapsed) if elapsed > 0 else None
+
+
+def _kept_memory(function, packets):
+    """
+    Return (bytes, blocks) per packet still allocated after function() returned its results.
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        results = function()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    size = sum(stat.size_diff for stat in stats)
+    count = sum(stat.count_diff for stat in stats)
+    del results
+    return round(size / packets, 1), round(count / packets, 2)
+
+
+def benchmark(decoder=None, packets=20000):
+    """
+    Decode 'packets' packets of every event and return, per event, the packets per second of decodePayload
+    and the memory kept per decoded packet, plus the packets per second of decode_many and of cache hits
+    over the whole corpus.
+    """
+    decoder = decoder or Decoder()
+    entries = corpus()
+    report = {'events': {}}
+
+    for event, payloads in event_groups(entries).items():
+        batch = (payloads * (packets // len(payloads) + 1))[:packets]
+
+        def decode_all():
+            return [decoder.decodePayload(None, payload) for payload in batch]
+
+        decode_all()
+        bytes_per_packet, blocks_per_packet = _kept_memory(decode_all, len(batch))
+        report['events'][event] = {
+            'packets_per_s': _rate(decode_all, len(batch)),
+            'bytes_per_packet': bytes_per_packet,
+            'blocks_per_packet': blocks_per_packet,
+        }
+
+    payloads = [payload for name, payload, expected in entries]
+    batch = (payloads * (packets // len(payloads) + 1))[:packets]
+    report['decodePayload_per_s'] = _rate(lambda: [decoder.decodePayload(None, p) for p in batch], len(batch))
+    report['decode_many_per_s'] = _rate(lambda: decoder.decode_many(batch, vectorized=False), len(batch))
+    if load_numpy() is not None:
+        report['decode_many_numpy_per_s'] = _rate(lambda: decoder.decode_many(batch, vectorized=True), len(batch))
+    cache = DecodeCache(decoder, capacity=len(payloads))
+    for payload in payloads:
+        cache.decode(payload)
+    report['cache_hit_per_s'] = _rate(lambda: [cache.decode(p) for p in batch], len(batch))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the RadioBridge decoder against its corpus and measure it.')
+    parser.add_argument('--packets', type=int, default=20000, help='packets decoded per measurement')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    failures = verify()
+    report = benchmark(packets=max(1, args.packets))
+    report['failures'] = failures
+
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print(f"{'event':<32} {'packets/s':>10} {'bytes/packet':>13} {'blocks/packet':>14}")
+        for event, stats in sorted(report['events'].items()):
+            print(f"{event:<32} {stats['packets_per_s']:>10} {stats['bytes_per_packet']:>13} "
+                  f"{stats['blocks_per_packet']:>14}")
+        print()
+        for key in ('decodePayload_per_s', 'decode_many_per_s', 'decode_many_numpy_per_s', 'cache_hit_per_s'):
+            if key in report:
+                print(f"{key:<32} {report[key]:>10}")
+        print()
+        print('\n'.join(failures) if failures else f"All {len(DECODER_CORPUS)} corpus payloads decoded as expected.")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
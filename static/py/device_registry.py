@@ -0,0 +1,126 @@
+"""
+This file contains the DeviceRegistry class which keeps one record per sensor seen on the MQTT broker.
+The registry is updated for every stored message and survives the message buffer eviction, so the sensor
+drop-downs and /get_sensors never have to walk the message buffer.
+This file is used by mqtt_utils.py and server.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+
+class DeviceRegistry:
+    """
+    deveui -> device record, in the order the devices were first seen.
+
+    A record holds the device type (from its reset message), the events it reported, the first and last
+    receive time, the last frame counter, RSSI and SNR and the last battery level it reported.
+    What a message stored undecoded tells about its device is only added once it is decoded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._devices = OrderedDict()
+        # (deveui, event) pairs in the order they were first seen, for the sensor drop-downs.
+        self._device_events = OrderedDict()
+
+    def __len__(self):
+        return len(self._devices)
+
+    def update(self, message):
+        """
+        Update the record of the device which sent the message. Messages without a deveui are ignored.
+        """
+        deveui = message.deveui
+        if deveui is None:
+            return
+        received = message.ts
+
+        with self._lock:
+            device = self._devices.get(deveui)
+            if device is None:
+                device = self._devices[deveui] = {
+                    'deveui': deveui,
+                    'device_type': None,
+                    'events': [],
+                    'first_seen': received,
+                    'last_seen': None,
+                    'last_fcnt': None,
+                    'rssi': None,
+                    'lsnr': None,
+                    'battery_level': None,
+                    'messages': 0,
+                }
+
+            device['messages'] += 1
+            device['last_seen'] = received
+            for key, field in (('last_fcnt', 'fcnt'), ('rssi', 'rssi'), ('lsnr', 'lsnr')):
+                value = message.field(field)
+                if value is not None:
+                    device[key] = value
+
+            if not message.pending:
+                self._update_decoded(device, message)
+
+    def decoded(self, message):
+        """
+        Update the device record with a buffered message decoded after it was stored, see
+        mqtt_utils.buffered_decoded().
+        """
+        with self._lock:
+            device = self._devices.get(message.deveui)
+            if device is not None:
+                self._update_decoded(device, message)
+
+    def _update_decoded(self, device, message):
+        event = message.event
+        if message.decoded_layout is not None:
+            decoded = message.decoded
+            if decoded.get('device_type') is not None:
+                device['device_type'] = decoded['device_type']
+            if decoded.get('battery_level') is not None:
+                device['battery_level'] = decoded['battery_level']
+
+        if event is not None and event not in device['events']:
+            device['events'].append(event)
+        if 'data_decoded' in message.layout:
+            self._device_events.setdefault((device['deveui'], event), None)
+
+    def get(self, deveui):
+        """
+        Return a copy of the record of a device or None if it was never seen.
+        """
+        with self._lock:
+            device = self._devices.get(deveui)
+            return self._copy(device) if device is not None else None
+
+    def devices(self):
+        """
+        Return a copy of every device record, in the order the devices were first seen.
+        """
+        with self._lock:
+            return [self._copy(device) for device in self._devices.values()]
+
+    def device_event_options(self, excluded_events=()):
+        """
+        Return the 'deveui - event' options of the sensor drop-downs, skipping the excluded events.
+        """
+        with self._lock:
+            pairs = list(self._device_events)
+        return [{'deveui': f"{deveui} - {event if event else 'No Event'}"}
+                for deveui, event in pairs if event not in excluded_events]
+
+    @staticmethod
+    def _copy(device):
+        device = dict(device)
+        device['events'] = list(device['events'])
+        # Receive times are kept as epoch seconds and returned as local ISO 8601 strings like current_time.
+        for key in ('first_seen', 'last_seen'):
+            if device[key] is not None:
+                device[key] = datetime.fromtimestamp(device[key]).astimezone().isoformat()
+        return device
@@ -0,0 +1,407 @@
+"""
+This file contains the CampaignScheduler class which sends the same downlink to many sensors.
+A campaign is a payload and a list of deveuis; the scheduler publishes its downlinks at a limited rate, with at most
+'concurrency' of them waiting for their acknowledgement and never more than one downlink per sensor at a time,
+spaced by at least 'device_interval' seconds since a class A sensor only receives a downlink after each uplink.
+The downlink_ack uplink of a sensor completes its downlink, a downlink not acknowledged within 'ack_timeout'
+seconds is sent again up to 'retries' times. Every campaign reports its progress and its acknowledgement latency.
+This file is used by mqtt_utils.py (acknowledgements) and server.py (/campaigns).
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import base64
+import binascii
+import itertools
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from static.py.downlink_publisher import QOS_LEVELS, downlink_message
+from static.py.ingest import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+# Target states.
+QUEUED = 'queued'
+SENT = 'sent'
+ACKED = 'acked'
+REJECTED = 'rejected'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+TARGET_STATES = (QUEUED, SENT, ACKED, REJECTED, FAILED, CANCELLED)
+FINAL_STATES = frozenset((ACKED, REJECTED, FAILED, CANCELLED))
+
+_NOT_HEX = re.compile('[^0-9a-f]')
+
+
+def normalize_deveui(deveui):
+    """
+    Return a deveui in the form of the gateway messages (70-74-14-00-00-0d-eb-04), whatever its separators and case.
+    """
+    digits = _NOT_HEX.sub('', str(deveui).lower())
+    if len(digits) != 16:
+        raise ValueError(f"invalid deveui {deveui!r}")
+    return '-'.join(digits[i:i + 2] for i in range(0, 16, 2))
+
+
+def downlink_topic(deveui):
+    return f"lora/{deveui}/down"
+
+
+class Target:
+    """
+    The downlink of one sensor in a campaign.
+    """
+
+    __slots__ = ('deveui', 'state', 'attempts', 'sent', 'sent_at', 'not_before', 'delivery', 'acked_at',
+                 'latency', 'error')
+
+    def __init__(self, deveui):
+        self.deveui = deveui
+        self.state = QUEUED
+        self.attempts = 0
+        # monotonic and epoch time of the last attempt.
+        self.sent = None
+        self.sent_at = None
+        # monotonic time before which the target is not sent again.
+        self.not_before = 0.0
+        self.delivery = None
+        self.acked_at = None
+        # Seconds between the last attempt and its acknowledgement.
+        self.latency = None
+        self.error = None
+
+    def to_dict(self):
+        return {
+            'deveui': self.deveui,
+            'state': self.state,
+            'attempts': self.attempts,
+            'sent_at': self.sent_at,
+            'acked_at': self.acked_at,
+            'latency_s': round(self.latency, 3) if self.latency is not None else None,
+            'error': self.error,
+        }
+
+
+class Campaign:
+    """
+    One payload sent to a list of sensors. Its attributes are only changed by the CampaignScheduler.
+    """
+
+    def __init__(self, campaign_id, name, data, port, deveuis, rate, concurrency, device_interval, ack_timeout,
+                 retries, qos):
+        self.id = campaign_id
+        self.name = name
+        self.data = data
+        self.port = port
+        self.rate = rate
+        self.concurrency = concurrency
+        self.device_interval = device_interval
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.qos = qos
+        self.targets = OrderedDict((deveui, Target(deveui)) for deveui in deveuis)
+        self.created_at = time.time()
+        self.finished_at = None
+        # monotonic time of the next send allowed by the rate.
+        self.next_send = 0.0
+        self.inflight = 0
+        self.latency = LatencyStats()
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def counts(self):
+        counts = dict.fromkeys(TARGET_STATES, 0)
+        for target in self.targets.values():
+            counts[target.state] += 1
+        return counts
+
+    def summary(self):
+        counts = self.counts()
+        done = sum(counts[state] for state in FINAL_STATES)
+        return {
+            'id': self.id,
+            'name': self.name,
+            'port': self.port,
+            'devices': len(self.targets),
+            'rate': self.rate,
+            'concurrency': self.concurrency,
+            'device_interval': self.device_interval,
+            'ack_timeout': self.ack_timeout,
+            'retries': self.retries,
+            'qos': self.qos,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'progress': round(done / len(self.targets), 3) if self.targets else 1.0,
+            'states': counts,
+            'attempts': sum(target.attempts for target in self.targets.values()),
+            'ack_latency': self.latency.stats(),
+        }
+
+
+class CampaignScheduler:
+    """
+    Runs the downlink campaigns on a background thread, publishing through a DownlinkPublisher.
+
+    The rate (downlinks per second) and the concurrency (downlinks waiting for their acknowledgement) are
+    per campaign. A sensor is only sent one downlink at a time across all campaigns, and not again before
+    device_interval seconds. An acknowledgement completes the downlink its sensor is waiting for, there is
+    no way to tell which attempt it acknowledges. Finished campaigns are kept until there are more than
+    'keep_finished' of them.
+    """
+
+    def __init__(self, publisher, rate=1.0, concurrency=10, device_interval=60, ack_timeout=900, retries=2,
+                 keep_finished=20):
+        self.publisher = publisher
+        self.defaults = {
+            'rate': rate,
+            'concurrency': concurrency,
+            'device_interval': device_interval,
+            'ack_timeout': ack_timeout,
+            'retries': retries,
+        }
+        self.keep_finished = keep_finished
+        self._cond = threading.Condition()
+        self._campaigns = OrderedDict()
+        self._ids = itertools.count(1)
+        # deveui -> (campaign, target) of the downlink the sensor is waiting for.
+        self._busy = {}
+        # deveui -> monotonic time of the last downlink sent to the sensor.
+        self._last_sent = {}
+        self._thread = None
+
+    def create(self, data, deveuis, port=2, name=None, qos=None, **limits):
+        """
+        Start a campaign sending data (the base64 payload, like /send_downlink) to the deveuis and return its summary.
+        limits are rate, concurrency, device_interval, ack_timeout and retries, the defaults apply to the
+        missing ones. Raises ValueError for an invalid campaign.
+        """
+        try:
+            base64.b64decode(data, validate=True)
+        except (binascii.Error, TypeError, ValueError):
+            raise ValueError("data must be the base64 encoded payload")
+        unknown = set(limits) - set(self.defaults)
+        if unknown:
+            raise ValueError(f"unknown campaign settings {sorted(unknown)}")
+        limits = {**self.defaults, **{key: value for key, value in limits.items() if value is not None}}
+        try:
+            limits = {key: (int if key in ('concurrency', 'retries') else float)(value) for key, value in limits.items()}
+        except (TypeError, ValueError):
+            raise ValueError("the campaign settings must be numbers")
+        if not limits['rate'] > 0 or limits['concurrency'] < 1:
+            raise ValueError("rate must be positive and concurrency at least 1")
+        if limits['device_interval'] < 0 or limits['ack_timeout'] <= 0 or limits['retries'] < 0:
+            raise ValueError("device_interval and retries cannot be negative and ack_timeout must be positive")
+        if qos is not None and qos not in QOS_LEVELS:
+            raise ValueError(f"qos must be one of {QOS_LEVELS}")
+        deveuis = list(OrderedDict.fromkeys(normalize_deveui(deveui) for deveui in deveuis))
+        if not deveuis:
+            raise ValueError("no devices to send the downlink to")
+
+        with self._cond:
+            campaign_id = next(self._ids)
+            campaign = Campaign(campaign_id, name or f"campaign {campaign_id}", data, port, deveuis, qos=qos,
+                                **limits)
+            self._campaigns[campaign_id] = campaign
+            self._start()
+            self._cond.notify()
+        logger.info("Campaign %s started for %s devices", campaign_id, len(deveuis))
+        return campaign.summary()
+
+    def get(self, campaign_id, targets=True):
+        """
+        Return the summary of a campaign, with the state of every target, or None if it is unknown.
+        """
+        with self._cond:
+            campaign = self._campaigns.get(campaign_id)
+            if campaign is None:
+                return None
+            summary = campaign.summary()
+            if targets:
+                summary['targets'] = [target.to_dict() for target in campaign.targets.values()]
+            return summary
+
+    def campaigns(self):
+        """
+        Return the summaries of the campaigns, oldest first.
+        """
+        with self._cond:
+            return [campaign.summary() for campaign in self._campaigns.values()]
+
+    def cancel(self, campaign_id):
+        """
+        Stop sending the downlinks of a campaign not acknowledged yet. Returns its summary or None if it is unknown.
+        """
+        with self._cond:
+            campaign = self._campaigns.get(campaign_id)
+            if campaign is None:
+                return None
+            for target in campaign.targets.values():
+                if target.state in (QUEUED, SENT):
+                    self._release(campaign, target)
+                    target.state = CANCELLED
+            self._finish(campaign)
+            return campaign.summary()
+
+    def uplink(self, message):
+        """
+        Complete the downlink waiting for the downlink_ack uplink of its sensor. Called for every stored
+        message, an uplink of a sensor without a downlink in flight is not even decoded.
+        """
+        if not self._busy or message.deveui is None:
+            return
+        try:
+            deveui = normalize_deveui(message.deveui)
+        except ValueError:
+            return
+        if deveui not in self._busy or message.decoded_field('event') != 'downlink_ack':
+            return
+
+        with self._cond:
+            campaign, target = self._busy.get(deveui, (None, None))
+            if target is None or target.state != SENT or (message.ts or 0) < target.sent_at:
+                return
+            self._release(campaign, target)
+            target.acked_at = message.ts
+            target.latency = max(0.0, message.ts - target.sent_at)
+            if message.decoded_field('downlink_ack_event') == 'message_invalid':
+                target.state = REJECTED
+                target.error = 'the device rejected the downlink'
+            else:
+                target.state = ACKED
+                campaign.latency.add(target.latency)
+            self._cond.notify()
+
+    def stop(self):
+        """
+        Stop the scheduler thread, the campaigns stay as they are.
+        """
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
+
+    def stats(self):
+        with self._cond:
+            active = sum(1 for campaign in self._campaigns.values() if not campaign.finished)
+            return {
+                'campaigns': len(self._campaigns),
+                'active': active,
+                'devices_waiting_ack': len(self._busy),
+            }
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='downlink-campaigns', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        thread = threading.current_thread()
+        while True:
+            with self._cond:
+                if self._thread is not thread:
+                    return
+                sends, timeout = self._step(time.monotonic())
+            for campaign, target in sends:
+                self._send(campaign, target)
+            if not sends:
+                with self._cond:
+                    if self._thread is not thread:
+                        return
+                    self._cond.wait(timeout)
+
+    def _step(self, now):
+        """
+        Settle the expired and failed attempts and pick the targets to send now.
+        Returns (list of (campaign, target) to send, seconds until the next step). Called with the lock held.
+        """
+        sends = []
+        # Failed publishes are only noticed here, so steps are at most a second apart.
+        wake = now + 1.0
+        for campaign in list(self._campaigns.values()):
+            if campaign.finished:
+                continue
+            for target in campaign.targets.values():
+                if target.state != SENT:
+                    continue
+                if target.delivery is not None and target.delivery.failed:
+                    self._attempt_failed(campaign, target, now, 'publish failed')
+                elif now - target.sent >= campaign.ack_timeout:
+                    self._attempt_failed(campaign, target, now, 'no acknowledgement')
+                else:
+                    wake = min(wake, target.sent + campaign.ack_timeout)
+
+            for target in campaign.targets.values():
+                if campaign.inflight >= campaign.concurrency:
+                    break
+                if target.state != QUEUED or target.deveui in self._busy:
+                    continue
+                due = max(target.not_before, campaign.next_send,
+                          self._last_sent.get(target.deveui, -campaign.device_interval) + campaign.device_interval)
+                if due > now:
+                    wake = min(wake, due)
+                    continue
+                target.state = SENT
+                target.attempts += 1
+                target.sent = now
+                target.sent_at = time.time()
+                target.delivery = None
+                campaign.inflight += 1
+                campaign.next_send = max(campaign.next_send, now) + 1.0 / campaign.rate
+                self._busy[target.deveui] = (campaign, target)
+                self._last_sent[target.deveui] = now
+                sends.append((campaign, target))
+
+            if all(target.state in FINAL_STATES for target in campaign.targets.values()):
+                self._finish(campaign)
+        return sends, max(0.0, wake - now)
+
+    def _send(self, campaign, target):
+        try:
+            delivery = self.publisher.publish(downlink_topic(target.deveui),
+                                              downlink_message(campaign.data, campaign.port), qos=campaign.qos)
+        except Exception as e:
+            logger.warning("Campaign %s: error publishing the downlink to %s: %s", campaign.id, target.deveui, e)
+            delivery = None
+        with self._cond:
+            if target.state != SENT:
+                return
+            if delivery is None:
+                self._attempt_failed(campaign, target, time.monotonic(), 'publish failed')
+            else:
+                target.delivery = delivery
+
+    def _attempt_failed(self, campaign, target, now, reason):
+        self._release(campaign, target)
+        if target.attempts <= campaign.retries:
+            target.state = QUEUED
+            target.not_before = now + campaign.device_interval
+            logger.debug("Campaign %s: %s for %s, retrying", campaign.id, reason, target.deveui)
+        else:
+            target.state = FAILED
+            target.error = reason
+            logger.info("Campaign %s: %s for %s after %s attempts", campaign.id, reason, target.deveui,
+                        target.attempts)
+
+    def _release(self, campaign, target):
+        if target.state == SENT:
+            campaign.inflight -= 1
+            if self._busy.get(target.deveui, (None, None))[1] is target:
+                del self._busy[target.deveui]
+
+    def _finish(self, campaign):
+        if campaign.finished:
+            return
+        campaign.finished_at = time.time()
+        logger.info("Campaign %s finished: %s", campaign.id, campaign.counts())
+        finished = [campaign_id for campaign_id, c in self._campaigns.items() if c.finished]
+        for campaign_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._campaigns[campaign_id]
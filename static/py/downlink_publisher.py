@@ -0,0 +1,283 @@
+"""
+This file contains the DownlinkPublisher class which publishes the sensor downlinks over one long-lived MQTT connection.
+publish.single() opened a new TCP connection and did a full MQTT handshake for every downlink; the publisher keeps its
+connection (or shares the connection of the subscriber client) and paho reconnects it when the broker goes away.
+Every publish is tracked by its message id until paho reports it complete (written to the socket for QoS 0,
+acknowledged by the broker for QoS 1 and 2), so callers can wait for it and /stats reports the publish latency.
+This file is used by mqtt_utils.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import json
+import logging
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from static.py.ingest import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+QOS_LEVELS = (0, 1, 2)
+
+
+def downlink_message(data, port):
+    """
+    Return the JSON message of a downlink for the gateway: the base64 payload and the LoRa port.
+    """
+    return json.dumps({
+        "data": data,
+        "port": port
+    })
+
+
+class Delivery:
+    """
+    One published downlink. wait() blocks until the publish is complete or failed.
+    """
+
+    __slots__ = ('topic', 'qos', 'mid', 'rc', 'sent', 'completed', '_event')
+
+    def __init__(self, topic, qos):
+        self.topic = topic
+        self.qos = qos
+        self.mid = None
+        self.rc = mqtt.MQTT_ERR_SUCCESS
+        self.sent = time.monotonic()
+        # monotonic time the publish completed, None while it is in flight or when it failed.
+        self.completed = None
+        self._event = threading.Event()
+
+    @property
+    def done(self):
+        return self._event.is_set()
+
+    @property
+    def failed(self):
+        return self.rc != mqtt.MQTT_ERR_SUCCESS
+
+    @property
+    def latency(self):
+        """
+        Seconds between the publish and its completion, None until it is complete.
+        """
+        return self.completed - self.sent if self.completed is not None else None
+
+    def wait(self, timeout=None):
+        """
+        Wait for the publish to complete or fail. Returns True when it completed.
+        """
+        self._event.wait(timeout)
+        return self.completed is not None
+
+    def _complete(self):
+        self.completed = time.monotonic()
+        self._event.set()
+
+    def _fail(self, rc):
+        self.rc = rc
+        self._event.set()
+
+
+class DownlinkPublisher:
+    """
+    Publishes downlinks over a persistent MQTT connection.
+
+    configure(host, port) points the publisher at the broker; its own client connects in the background and
+    paho reconnects it with a backoff between reconnect_delay and reconnect_max_delay seconds. With share()
+    the publisher uses the connected subscriber client instead and opens no connection of its own.
+
+    QoS 1 and 2 publishes made while the connection is down are queued by paho (at most max_queued)
+    and sent once it is back. A QoS 0 publish needs the connection, so publish() waits up to
+    connect_timeout seconds for it.
+    """
+
+    def __init__(self, qos=1, keepalive=60, connect_timeout=5.0, reconnect_delay=1, reconnect_max_delay=60,
+                 max_inflight=20, max_queued=1000):
+        if qos not in QOS_LEVELS:
+            raise ValueError(f"qos must be one of {QOS_LEVELS}")
+        self.qos = qos
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+
+        self.host = None
+        self.port = None
+        self._client = None
+        self._shared = False
+        self._connected = threading.Event()
+        self._lock = threading.Lock()
+        # mid -> Delivery of the publishes not complete yet.
+        self._inflight = {}
+        # mids completed before publish() registered them (paho may call on_publish first).
+        self._completed_early = set()
+
+        self.published = 0
+        self.completed = 0
+        self.failed = 0
+        self.connects = 0
+        self._latency = LatencyStats()
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def configure(self, host, port=1883):
+        """
+        Publish to the broker at host:port over a connection of our own, connecting in the background.
+        Nothing changes when the publisher already uses its own connection to that broker.
+        """
+        with self._lock:
+            if not self._shared and self._client is not None and (self.host, self.port) == (host, port):
+                return
+            previous = self._detach()
+            self.host, self.port = host, port
+
+            client = mqtt.Client()
+            client.max_inflight_messages_set(self.max_inflight)
+            client.max_queued_messages_set(self.max_queued)
+            client.reconnect_delay_set(self.reconnect_delay, self.reconnect_max_delay)
+            client.on_connect = self._on_connect
+            client.on_disconnect = self._on_disconnect
+            client.on_publish = self._on_publish
+            client.connect_async(host, port, self.keepalive)
+            client.loop_start()
+            self._client = client
+            self._shared = False
+        self._stop(*previous)
+        logger.info("Downlink publisher connecting to %s:%s", host, port)
+
+    def share(self, client, host=None, port=None):
+        """
+        Publish through an already connected client (the subscriber) instead of a connection of our own.
+        Its on_publish callback is taken over, paho keeps reconnecting it in its own network loop.
+        """
+        with self._lock:
+            previous = self._detach()
+            self.host, self.port = host, port
+            client.on_publish = self._on_publish
+            self._client = client
+            self._shared = True
+            self._connected.set()
+        self._stop(*previous)
+
+    def publish(self, topic, payload, qos=None):
+        """
+        Publish payload to topic and return its Delivery, already failed when paho refused the publish.
+        """
+        qos = self.qos if qos is None else qos
+        if qos not in QOS_LEVELS:
+            raise ValueError(f"qos must be one of {QOS_LEVELS}")
+        delivery = Delivery(topic, qos)
+
+        client = self._client
+        if client is None:
+            self.failed += 1
+            delivery._fail(mqtt.MQTT_ERR_NO_CONN)
+            return delivery
+        if qos == 0 and not self._shared:
+            self._connected.wait(self.connect_timeout)
+
+        info = client.publish(topic, payload=payload, qos=qos)
+        delivery.mid = info.mid
+        self.published += 1
+
+        # With QoS 1 and 2 paho keeps the message queued when the connection is down.
+        if info.rc != mqtt.MQTT_ERR_SUCCESS and not (qos > 0 and info.rc == mqtt.MQTT_ERR_NO_CONN):
+            with self._lock:
+                self._completed_early.discard(info.mid)
+            self.failed += 1
+            logger.warning("Downlink to %s not published: %s", topic, mqtt.error_string(info.rc))
+            delivery._fail(info.rc)
+            return delivery
+
+        with self._lock:
+            if info.mid in self._completed_early:
+                self._completed_early.discard(info.mid)
+                complete = True
+            else:
+                self._inflight[info.mid] = delivery
+                complete = False
+        if complete:
+            self._record_complete(delivery)
+        return delivery
+
+    def close(self):
+        """
+        Disconnect our own client and fail the publishes still in flight.
+        """
+        with self._lock:
+            previous = self._detach()
+        self._stop(*previous)
+
+    def stats(self):
+        return {
+            'host': self.host,
+            'port': self.port,
+            'shared': self._shared,
+            'connected': self.connected,
+            'connects': self.connects,
+            'qos': self.qos,
+            'published': self.published,
+            'completed': self.completed,
+            'failed': self.failed,
+            'inflight': len(self._inflight),
+            'latency': self._latency.stats(),
+        }
+
+    def _detach(self):
+        """
+        Forget the current client and return (client it owned or None, its deliveries in flight).
+        Called with the lock held, the client is stopped by _stop() once the lock is released, since
+        its network thread may be waiting for the lock in _on_publish.
+        """
+        client = self._client if not self._shared else None
+        inflight = list(self._inflight.values())
+        self._client = None
+        self._connected.clear()
+        self._inflight.clear()
+        self._completed_early.clear()
+        return client, inflight
+
+    def _stop(self, client, inflight):
+        if client is not None:
+            client.disconnect()
+            client.loop_stop()
+        for delivery in inflight:
+            self.failed += 1
+            delivery._fail(mqtt.MQTT_ERR_NO_CONN)
+
+    def _record_complete(self, delivery):
+        delivery._complete()
+        self.completed += 1
+        self._latency.add(delivery.latency)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self.connects += 1
+            self._connected.set()
+            logger.info("Downlink publisher connected to %s:%s", self.host, self.port)
+        else:
+            logger.warning("Downlink publisher connection refused: %s", mqtt.connack_string(rc))
+
+    def _on_disconnect(self, client, userdata, rc):
+        self._connected.clear()
+        if rc != 0:
+            logger.warning("Downlink publisher disconnected (%s), reconnecting", mqtt.error_string(rc))
+
+    def _on_publish(self, client, userdata, mid):
+        with self._lock:
+            if client is not self._client:
+                return
+            delivery = self._inflight.pop(mid, None)
+            if delivery is None:
+                self._completed_early.add(mid)
+                return
+        self._record_complete(delivery)
@@ -0,0 +1,179 @@
+"""
+This file contains FakeGatewayAPI, a local HTTP server answering the mPower gateway API endpoints used by the app:
+login, the network interfaces of the startup message and the time settings of /setTime. It keeps the connections
+alive like the gateway, can answer slowly and records every request, so the GatewayAPI client and the login and
+/setTime flows can be tried without a gateway.
+This file is used for testing and can be run on its own (then point the 'gateway_api' settings at it):
+
+    python -m static.py.fake_gateway_api [--port 8080] [--delay SECONDS] [--user NAME:PASSWORD]
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import argparse
+import json
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Interfaces of the startup message: eth0, ppp0 and br0.
+DEFAULT_INTERFACES = {
+    '0': {'name': 'eth0', 'ipv4': {'ip': '192.168.2.1'}},
+    '3': {'name': 'ppp0', 'ipv4': {'ip': ''}},
+    '6': {'name': 'br0', 'ipv4': {'ip': '192.168.3.1'}},
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.api.handle(self)
+
+    def do_POST(self):
+        self.server.api.handle(self)
+
+    def do_PUT(self):
+        self.server.api.handle(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGatewayAPI:
+    """
+    Fake gateway API on host:port (port 0 picks a free port), served by a background thread.
+
+    users maps the accepted usernames to their passwords, interfaces the interface numbers of ni/nis/<n>
+    to their records. Every request is answered after 'delay' seconds and appended to 'requests' as
+    (method, path, JSON body or None). With certfile and keyfile it serves https like the gateway.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, users=None, interfaces=None, delay=0.0, certfile=None, keyfile=None):
+        self.users = dict(users or {'admin': 'admin'})
+        self.interfaces = dict(interfaces or DEFAULT_INTERFACES)
+        self.delay = delay
+        self.settings = {}
+        self.requests = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+        self._thread = None
+        self._sockets = set()
+
+    @property
+    def address(self):
+        """
+        host:port the server listens on.
+        """
+        host, port = self._server.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-gateway-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handle(self, handler):
+        length = int(handler.headers.get('Content-Length') or 0)
+        raw = handler.rfile.read(length) if length else b''
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            body = None
+        with self._lock:
+            self.requests.append((handler.command, handler.path, body))
+            if id(handler.connection) not in self._sockets:
+                self._sockets.add(id(handler.connection))
+                self.connections += 1
+        if self.delay:
+            time.sleep(self.delay)
+
+        status, response = self.respond(handler.command, handler.path, body)
+        payload = json.dumps(response).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def respond(self, method, path, body):
+        """
+        Return (HTTP status, JSON response) of a request.
+        """
+        path = path.split('?', 1)[0].rstrip('/')
+        if not path.startswith('/api/'):
+            return 404, {'status': 'fail', 'error': 'Not found'}
+        endpoint = path[len('/api/'):].lstrip('/')
+
+        if method == 'POST' and endpoint == 'login':
+            body = body if isinstance(body, dict) else {}
+            if body.get('username') in self.users and self.users[body['username']] == body.get('password'):
+                return 200, {'status': 'success', 'result': {'token': 'fake-token'}}
+            return 401, {'status': 'fail', 'error': 'Invalid username or password'}
+
+        if method == 'GET' and endpoint.startswith('ni/nis/'):
+            interface = self.interfaces.get(endpoint[len('ni/nis/'):])
+            if interface is None:
+                return 404, {'status': 'fail', 'error': 'No such interface'}
+            return 200, {'status': 'success', 'result': interface}
+
+        if method == 'PUT' and endpoint in ('sntp', 'system'):
+            self.settings.setdefault(endpoint, {}).update(body if isinstance(body, dict) else {})
+            return 200, {'status': 'success', 'result': self.settings[endpoint]}
+
+        if method == 'POST' and endpoint == 'command/save_apply':
+            return 200, {'status': 'success'}
+
+        return 404, {'status': 'fail', 'error': f'Unknown endpoint {method} {endpoint}'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake mPower gateway API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds before every response')
+    parser.add_argument('--user', action='append', default=[], help='accepted NAME:PASSWORD, admin:admin by default')
+    parser.add_argument('--cert', help='certificate file, serves https with --key')
+    parser.add_argument('--key', help='private key file of --cert')
+    args = parser.parse_args()
+
+    users = dict(user.split(':', 1) for user in args.user) or None
+    api = FakeGatewayAPI(args.host, args.port, users=users, delay=args.delay, certfile=args.cert, keyfile=args.key)
+    print(f"Fake gateway API listening on {'https' if args.cert else 'http'}://{api.address}/api/")
+    api.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == '__main__':
+    main()
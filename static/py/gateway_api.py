@@ -0,0 +1,214 @@
+"""
+This file contains the GatewayAPI class, a small HTTP client of the mPower gateway API.
+Every login, /setTime step and interface lookup used to fork a curl process and open a new connection (and TLS
+session for the login); the client keeps a pool of keep-alive connections per host instead, with a timeout on every
+request. Responses are returned as GatewayResponse objects and every transport or protocol error is raised as a
+GatewayAPIError. For local testing static/py/fake_gateway_api.py serves the endpoints the app uses.
+This file is used by server.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import http.client
+import json
+import logging
+import queue
+import ssl
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayAPIError(Exception):
+    """
+    A gateway API request failed: the connection failed or timed out, or the response was not JSON.
+    status is the HTTP status when a response was received, None otherwise.
+    """
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class GatewayResponse:
+    """
+    Response of a gateway API request: the HTTP status, the headers and the raw body.
+    """
+
+    __slots__ = ('status', 'headers', 'body', 'elapsed')
+
+    def __init__(self, status, headers, body, elapsed):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    def json(self):
+        """
+        Return the decoded JSON body. Raises GatewayAPIError when the body is not JSON.
+        """
+        try:
+            return json.loads(self.body)
+        except ValueError as e:
+            raise GatewayAPIError(f"Invalid JSON response: {e}", self.status)
+
+
+class GatewayAPI:
+    """
+    Client of the gateway API at scheme://host[:port]/api/, safe to share between threads.
+
+    At most pool_size idle connections are kept open for reuse. A request on a reused connection which the
+    server closed in the meantime is sent again once on a new connection. Like curl -k, the certificate
+    of an https gateway is not verified, the gateways use self-signed certificates.
+    """
+
+    def __init__(self, host='127.0.0.1', port=None, scheme='http', timeout=10.0, pool_size=4, prefix='/api/'):
+        if scheme not in ('http', 'https'):
+            raise ValueError("scheme must be 'http' or 'https'")
+        self.host = host
+        self.port = port
+        self.scheme = scheme
+        self.timeout = timeout
+        self.prefix = prefix
+        self._pool = queue.LifoQueue(maxsize=max(1, int(pool_size)))
+        self._context = None
+        if scheme == 'https':
+            self._context = ssl.create_default_context()
+            self._context.check_hostname = False
+            self._context.verify_mode = ssl.CERT_NONE
+
+        self.requests = 0
+        self.connections = 0
+        self.errors = 0
+
+    def request(self, method, path, data=None):
+        """
+        Send a request to the API path (e.g. 'ni/nis/0') with data as its JSON body (a str is sent as is)
+        and return the GatewayResponse, whatever its HTTP status.
+        """
+        url = self.prefix + path.lstrip('/')
+        if data is None or data == '':
+            body = None
+        elif isinstance(data, (str, bytes)):
+            body = data
+        else:
+            body = json.dumps(data)
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+
+        started = time.perf_counter()
+        self.requests += 1
+        for attempt in (1, 2):
+            connection, reused = self._connection()
+            try:
+                connection.request(method, url, body=body, headers=headers)
+                response = connection.getresponse()
+                payload = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                connection.close()
+                if reused and attempt == 1:
+                    # The server closed the idle connection, try once more on a new one.
+                    continue
+                self.errors += 1
+                raise GatewayAPIError(f"{method} {self._url(url)} failed: {e}")
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                self.errors += 1
+                raise GatewayAPIError(f"{method} {self._url(url)} failed: {e}")
+
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(connection)
+            elapsed = time.perf_counter() - started
+            logger.debug("%s %s: %s in %.1f ms", method, self._url(url), response.status, elapsed * 1000)
+            return GatewayResponse(response.status, dict(response.getheaders()), payload, elapsed)
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def put(self, path, data=None):
+        return self.request('PUT', path, data)
+
+    def post(self, path, data=None):
+        return self.request('POST', path, data)
+
+    def close(self):
+        """
+        Close the idle connections.
+        """
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        return {
+            'host': self.host,
+            'requests': self.requests,
+            'connections': self.connections,
+            'errors': self.errors,
+            'idle': self._pool.qsize(),
+        }
+
+    def _url(self, url):
+        port = f":{self.port}" if self.port else ''
+        return f"{self.scheme}://{self.host}{port}{url}"
+
+    def _connection(self):
+        """
+        Return (connection, reused): an idle connection of the pool or a new one.
+        """
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            pass
+        self.connections += 1
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self._context), False
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, connection):
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+
+class GatewayAPIPool:
+    """
+    One GatewayAPI per host, for the hosts known only at request time (the login host of the login form).
+    The clients of at most max_hosts hosts are kept, the least recently used one is closed first.
+    """
+
+    def __init__(self, max_hosts=8, **options):
+        self.max_hosts = max_hosts
+        self.options = options
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, host, port=None):
+        key = (host, port)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+            client = self._clients[key] = GatewayAPI(host, port, **self.options)
+            while len(self._clients) > self.max_hosts:
+                self._clients.popitem(last=False)[1].close()
+            return client
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
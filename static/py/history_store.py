@@ -0,0 +1,406 @@
+"""
+This file contains the HistoryStore class which keeps the message history on disk across restarts.
+Messages are appended to segment files as length-prefixed JSON records by a background writer thread
+in batches, old segments are deleted by size and age, and a sparse in-memory index of every segment
+lets /messages page backwards into the history beyond the in-memory buffer.
+This file is used by mqtt_utils.py and server.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from bisect import bisect_right
+
+from static.py.message_record import MessageRecord
+
+logger = logging.getLogger(__name__)
+
+# Record header: body length, crc32 of the body, sequence number, receive timestamp.
+RECORD_HEADER = struct.Struct('>IIQd')
+SEGMENT_SUFFIX = '.log'
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+class Segment:
+    """
+    One segment file. 'index' is the sparse index: (seq, offset) of every index_every-th record.
+    """
+
+    def __init__(self, path, first_seq):
+        self.path = path
+        self.first_seq = first_seq
+        self.last_seq = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.size = 0
+        self.count = 0
+        self.index = []
+
+    def add(self, seq, ts, offset, length, index_every):
+        if self.count % index_every == 0:
+            self.index.append((seq, offset))
+        if self.first_ts is None:
+            self.first_ts = ts
+        self.last_seq = max(self.last_seq, seq)
+        self.last_ts = ts
+        self.size = offset + length
+        self.count += 1
+
+
+class HistoryStore:
+    """
+    Append-only, segment rotated message log.
+
+    append() only queues the message; the writer thread writes the queue every batch_size messages or
+    every flush_interval seconds, whichever comes first. fsync is 'always' (after every batch),
+    'interval' (at most every fsync_interval seconds) or 'never' (left to the OS), which lets the
+    flash wear be traded against what a power cut may lose.
+
+    At most max_pending messages wait for the writer, e.g. while the flash is slow, the oldest ones are
+    dropped beyond. A batch which cannot be written (e.g. the flash is full) is lost and its records are
+    cut off the segment again, both are counted in stats().
+
+    Messages not decoded yet are written undecoded. on_read(message) is called with every message read
+    back, e.g. to decode those lazily again.
+    """
+
+    def __init__(self, directory, segment_bytes=1048576, max_bytes=20971520, max_age_days=7,
+                 batch_size=50, flush_interval=2.0, fsync='interval', fsync_interval=30.0, index_every=64,
+                 max_pending=10000, on_read=None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.index_every = max(1, int(index_every))
+        self.max_pending = max(self.batch_size, int(max_pending))
+        self.on_read = on_read
+
+        self._segments = []
+        self._file = None
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._pending = []
+        self._thread = None
+        self._closed = False
+        self._last_fsync = time.time()
+
+        self.written = 0
+        self.batches = 0
+        self.fsyncs = 0
+        self.deleted_segments = 0
+        self.dropped = 0
+        self.lost = 0
+
+    """
+    Opening and closing.
+    """
+
+    def open(self):
+        """
+        Scan the existing segments, drop a torn record at the end of the last one and start the writer.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                first_seq = int(name[:-len(SEGMENT_SUFFIX)])
+            except ValueError:
+                continue
+            segment = Segment(path, first_seq)
+            self._scan(segment)
+            if segment.count:
+                self._segments.append(segment)
+            else:
+                os.remove(path)
+
+        if self._segments:
+            self._file = open(self._segments[-1].path, 'ab')
+
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+        logger.info("History opened: %s segments, last seq %s", len(self._segments), self.last_seq)
+        return self
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    @property
+    def last_seq(self):
+        segments = self._segments
+        return segments[-1].last_seq if segments else 0
+
+    """
+    Writing.
+    """
+
+    def append(self, message):
+        """
+        Queue a stored MessageRecord (it must carry its seq) for the writer thread.
+        """
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                del self._pending[0]
+                self.dropped += 1
+            self._pending.append((message.seq, message.ts or 0.0, message))
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self):
+        """
+        Write the queued messages now, from the calling thread.
+        """
+        with self._cond:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._write(batch)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._pending) < self.batch_size and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                batch, self._pending = self._pending, []
+                closed = self._closed
+            if batch:
+                try:
+                    self._write(batch)
+                except OSError as e:
+                    logger.error("Error writing %s messages to the history: %s", len(batch), e)
+            if closed:
+                return
+
+    def _write(self, batch):
+        batch.sort(key=lambda item: item[0])
+        with self._lock:
+            last = self._segments[-1] if self._segments else None
+            segment = last
+            size = segment.size if segment is not None else 0
+            # Readers read a segment up to its size without the lock, so the records of the batch are only
+            # added to the segments once they are flushed: (segment, seq, ts, offset, length).
+            written = []
+            new_segments = []
+            try:
+                for seq, ts, message in batch:
+                    body = json.dumps(message.to_dict(decode=False), separators=(',', ':')).encode()
+                    record = RECORD_HEADER.pack(len(body), zlib.crc32(body), seq, ts) + body
+
+                    if segment is None or size >= self.segment_bytes or self._file is None:
+                        segment = self._rotate(seq)
+                        new_segments.append(segment)
+                        size = 0
+                    self._file.write(record)
+                    written.append((segment, seq, ts, size, len(record)))
+                    size += len(record)
+
+                self._file.flush()
+            except OSError:
+                self._rollback(last, new_segments)
+                self.lost += len(batch)
+                raise
+
+            for segment, seq, ts, offset, length in written:
+                segment.add(seq, ts, offset, length, self.index_every)
+            if new_segments:
+                # Readers iterate a copy of the list, replace it instead of appending in place.
+                self._segments = self._segments + new_segments
+            self.written += len(batch)
+            self.batches += 1
+            now = time.time()
+            if self.fsync == 'always' or (self.fsync == 'interval' and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+                self.fsyncs += 1
+            self._apply_retention(now)
+
+    def _rotate(self, first_seq):
+        if self._file is not None:
+            self._file.flush()
+            if self.fsync != 'never':
+                os.fsync(self._file.fileno())
+            self._file.close()
+        path = os.path.join(self.directory, f'{first_seq:016d}{SEGMENT_SUFFIX}')
+        self._file = open(path, 'ab')
+        # Listed by _write() once its first records are flushed.
+        return Segment(path, first_seq)
+
+    def _rollback(self, segment, new_segments):
+        """
+        Undo a batch which could not be written: cut what reached the last listed segment off it and
+        delete the segments the batch started. The next batch starts a new segment.
+        """
+        if self._file is not None:
+            try:
+                # Closing writes the rest of the buffered batch, or fails again.
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+        for new_segment in new_segments:
+            try:
+                os.remove(new_segment.path)
+            except OSError as e:
+                logger.warning("Error deleting history segment %s: %s", new_segment.path, e)
+        if segment is not None:
+            try:
+                os.truncate(segment.path, segment.size)
+            except OSError as e:
+                logger.error("Error truncating history segment %s back to %s bytes: %s",
+                             segment.path, segment.size, e)
+
+    def _apply_retention(self, now):
+        # The active segment is never deleted.
+        while len(self._segments) > 1:
+            oldest = self._segments[0]
+            total = sum(segment.size for segment in self._segments)
+            too_big = self.max_bytes and total > self.max_bytes
+            too_old = self.max_age and oldest.last_ts is not None and oldest.last_ts < now - self.max_age
+            if not (too_big or too_old):
+                break
+            self._segments = self._segments[1:]
+            try:
+                os.remove(oldest.path)
+            except OSError as e:
+                logger.warning("Error deleting history segment %s: %s", oldest.path, e)
+            self.deleted_segments += 1
+
+    """
+    Reading.
+    """
+
+    def read_before(self, seq, limit=50):
+        """
+        Return up to limit messages with a sequence number lower than seq, oldest first.
+        """
+        result = []
+        for segment in reversed(self._segments):
+            if segment.first_seq >= seq or not segment.index:
+                continue
+            # Start at the index point far enough back to hold what is still needed.
+            needed = limit - len(result)
+            position = bisect_right(segment.index, (seq, -1)) - 1 - (needed // self.index_every + 1)
+            offset = segment.index[max(position, 0)][1]
+            page = []
+            for message_seq, ts, message in self._read_segment(segment, offset):
+                if message_seq >= seq:
+                    break
+                page.append(message)
+            result = page[-needed:] + result
+            if len(result) >= limit:
+                break
+            seq = segment.first_seq
+        return result
+
+    def read_range(self, after_seq=0, start_ts=None, end_ts=None, limit=None, until_seq=None):
+        """
+        Yield the messages with a sequence number greater than after_seq (and up to until_seq) received
+        between start_ts and end_ts (epoch seconds, both optional), oldest first.
+        """
+        count = 0
+        for segment in list(self._segments):
+            if segment.last_seq <= after_seq or not segment.index:
+                continue
+            if start_ts is not None and segment.last_ts is not None and segment.last_ts < start_ts:
+                continue
+            if end_ts is not None and segment.first_ts is not None and segment.first_ts > end_ts:
+                break
+            if until_seq is not None and segment.first_seq > until_seq:
+                break
+            position = bisect_right(segment.index, (after_seq + 1, -1)) - 1
+            offset = segment.index[max(position, 0)][1]
+            for seq, ts, message in self._read_segment(segment, offset):
+                if seq <= after_seq or (start_ts is not None and ts < start_ts):
+                    continue
+                if until_seq is not None and seq > until_seq:
+                    continue
+                if end_ts is not None and ts > end_ts:
+                    return
+                yield message
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+    def _read_segment(self, segment, offset):
+        """
+        Yield (seq, ts, MessageRecord) from offset to the end of what the writer has committed.
+        """
+        end = segment.size
+        try:
+            with open(segment.path, 'rb') as file:
+                file.seek(offset)
+                while offset < end:
+                    header = file.read(RECORD_HEADER.size)
+                    if len(header) < RECORD_HEADER.size:
+                        return
+                    length, crc, seq, ts = RECORD_HEADER.unpack(header)
+                    body = file.read(length)
+                    offset += RECORD_HEADER.size + length
+                    if len(body) < length or zlib.crc32(body) != crc:
+                        return
+                    message = MessageRecord.from_dict(json.loads(body), ts)
+                    if self.on_read is not None:
+                        self.on_read(message)
+                    yield seq, ts, message
+        except FileNotFoundError:
+            # Deleted by the retention while we were reading.
+            return
+
+    def _scan(self, segment):
+        offset = 0
+        with open(segment.path, 'rb') as file:
+            while True:
+                header = file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                length, crc, seq, ts = RECORD_HEADER.unpack(header)
+                body = file.read(length)
+                if len(body) < length or zlib.crc32(body) != crc:
+                    break
+                segment.add(seq, ts, offset, RECORD_HEADER.size + length, self.index_every)
+                offset += RECORD_HEADER.size + length
+            torn = file.seek(0, os.SEEK_END) != offset
+        if torn:
+            logger.warning("Dropping a torn record at the end of %s", segment.path)
+            with open(segment.path, 'r+b') as file:
+                file.truncate(offset)
+
+    def stats(self):
+        segments = list(self._segments)
+        return {
+            'segments': len(segments),
+            'bytes': sum(segment.size for segment in segments),
+            'messages': sum(segment.count for segment in segments),
+            'first_seq': segments[0].first_seq if segments else 0,
+            'last_seq': segments[-1].last_seq if segments else 0,
+            'pending': len(self._pending),
+            'dropped': self.dropped,
+            'written': self.written,
+            'lost': self.lost,
+            'batches': self.batches,
+            'fsyncs': self.fsyncs,
+            'deleted_segments': self.deleted_segments,
+        }
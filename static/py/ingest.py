@@ -0,0 +1,176 @@
+"""
+This file contains the IngestPipeline class which takes the MQTT messages off the paho network thread.
+The paho callback only enqueues the raw (topic, payload, receive_ts) into a bounded queue and a pool of
+worker threads decodes and stores them, so a slow decode never stalls the MQTT keepalives.
+This file is used by mqtt_utils.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    """
+    Latency of one pipeline stage: count, mean and max of every sample, and percentiles of the
+    last 'samples' ones.
+    """
+
+    def __init__(self, samples=1024):
+        self._samples = deque(maxlen=samples)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def stats(self):
+        samples = sorted(self._samples)
+        if not samples:
+            return {'count': 0}
+
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 3)
+
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 3),
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class IngestPipeline:
+    """
+    Bounded queue of raw MQTT messages processed by a pool of worker threads.
+
+    handler(topic, payload, receive_ts, replayed) is called by the workers for every message, replayed is
+    True for the messages submitted by a Replay.
+    When the queue is full new messages are dropped and counted instead of blocking the caller.
+
+    The time a message waits in the queue ('queue') and spends in the handler ('process') is measured,
+    the handler can add its own stages with record().
+    """
+
+    def __init__(self, handler, workers=1, queue_size=1000):
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.queue_size = queue_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self._latency = {}
+
+    def start(self):
+        """
+        Start the worker threads. Calling it again is a no-op.
+        """
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'ingest-worker-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, topic, payload, receive_ts=None, block=False, replayed=False):
+        """
+        Enqueue a raw message. Returns False if the queue was full and the message was dropped.
+        Called from the paho network thread, so it must never block. With block the caller waits for room
+        in the queue instead, e.g. to replay a capture as fast as the workers go. replayed marks a message
+        played back from a capture.
+        """
+        if not self._threads:
+            self.start()
+        if receive_ts is None:
+            receive_ts = time.time()
+
+        self.received += 1
+        try:
+            self._queue.put((topic, payload, receive_ts, replayed, time.perf_counter()), block=block)
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def join(self):
+        """
+        Wait until every queued message was processed.
+        """
+        self._queue.join()
+
+    def record(self, stage, seconds):
+        """
+        Add one latency sample of a stage.
+        """
+        with self._lock:
+            latency = self._latency.get(stage)
+            if latency is None:
+                latency = self._latency[stage] = LatencyStats()
+            latency.add(seconds)
+
+    def latency(self):
+        """
+        Return the latency statistics of every stage.
+        """
+        with self._lock:
+            return {stage: latency.stats() for stage, latency in self._latency.items()}
+
+    def reset_latency(self):
+        with self._lock:
+            self._latency = {}
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self.max_depth,
+            'received': self.received,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'latency': self.latency(),
+        }
+
+    def _run(self):
+        while True:
+            topic, payload, receive_ts, replayed, enqueued = self._queue.get()
+            started = time.perf_counter()
+            self.record('queue', started - enqueued)
+            try:
+                self.handler(topic, payload, receive_ts, replayed)
+                self.record('process', time.perf_counter() - started)
+                with self._lock:
+                    self.processed += 1
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                logger.warning("Error processing message on %s: %s", topic, e)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,166 @@
+"""
+This file contains the ingest process of the multi-process serving mode (see gunicorn.conf.py and wsgi.py).
+It is the only process connected to the MQTT broker: it runs the ingest pipeline, the downlink publisher, the campaigns
+and the history like python server.py does, writes every stored message into the shared ring mirrored by the web
+workers and answers their calls (connect, downlinks, campaigns, history reads, uploads and replays) on a Unix socket.
+This file is started by gunicorn.conf.py and can be run on its own:
+
+    python -m static.py.ingest_owner [--parent-pid PID]
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+from static.py.backend import LocalBackend
+from static.py.ingest_rpc import RPCServer, ring_path, rpc_address, run_dir, write_authkey
+from static.py.log_utils import configure_logging
+from static.py.mqtt_utils import message_buffer, message_hub
+from static.py.settings import get_setting, get_settings
+from static.py.shared_ring import SharedRing
+
+logger = logging.getLogger(__name__)
+
+
+class RingWriter:
+    """
+    Writes the messages of the message buffer into the ring in sequence order: the buffered ones when
+    started, then every new one, woken up by the stream hub.
+    Uplinks stored undecoded (ingest lazy_decode) are decoded here first, the web workers never run the
+    decoder. A message too large for a slot is written as an error message with the same seq.
+    """
+
+    def __init__(self, ring, store, hub):
+        self.ring = ring
+        self.store = store
+        self.hub = hub
+        self.last_seq = 0
+        self._thread = None
+
+    def start(self):
+        self._write(self.store.since(0))
+        self._thread = threading.Thread(target=self._run, name='ring-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        client = self.hub.subscribe()
+        while True:
+            try:
+                if client is None:
+                    time.sleep(0.05)
+                else:
+                    client.wait(1.0)
+                self._write(self.store.since(self.last_seq))
+            except Exception as e:
+                logger.error("Error writing the message ring: %s", e)
+                time.sleep(1.0)
+
+    def _write(self, messages):
+        for message in messages:
+            record = json.dumps(message.to_dict()).encode()
+            try:
+                self.ring.append(message.seq, record)
+            except ValueError:
+                logger.warning("Message %s of %s bytes is too large for the ring", message.seq, len(record))
+                placeholder = {'type': message.type, 'topic': message.topic, 'seq': message.seq,
+                               'data': {'error': f"Message of {len(record)} bytes too large for the shared ring",
+                                        'current_time': message.current_time}}
+                self.ring.append(message.seq, json.dumps(placeholder).encode())
+            self.last_seq = message.seq
+
+
+def rpc_handlers(backend, ring):
+    """
+    Return the calls the web workers may make, by name.
+    """
+
+    def history():
+        if backend.history is None:
+            raise ValueError("The message history is disabled")
+        return backend.history
+
+    pipeline = backend.pipeline
+    campaigns = backend.campaigns
+    uploads = backend.uploads
+    return {
+        'ping': os.getpid,
+        'broker': backend.broker,
+        'connect': backend.connect,
+        'send_downlink': backend.send_downlink,
+        'devices': backend.devices,
+        'devices.options': backend.device_event_options,
+        'stats': lambda: {**backend.stats(), 'ring_writer': ring.stats()},
+        'ingest.submit': pipeline.submit,
+        'ingest.join': pipeline.join,
+        'ingest.stats': pipeline.stats,
+        'ingest.reset_latency': pipeline.reset_latency,
+        'history.enabled': lambda: backend.history is not None,
+        'history.last_seq': lambda: history().last_seq,
+        'history.read_before': lambda seq, limit=50: [m.to_dict() for m in history().read_before(seq, limit)],
+        'history.read_range': lambda *args: [m.to_dict() for m in history().read_range(*args)],
+        'history.stats': lambda: history().stats(),
+        'campaigns.create': campaigns.create,
+        'campaigns.get': campaigns.get,
+        'campaigns.list': campaigns.campaigns,
+        'campaigns.cancel': campaigns.cancel,
+        'campaigns.stats': campaigns.stats,
+        'campaigns.defaults': lambda: dict(campaigns.defaults),
+        'uploads.load_file': uploads.load_file,
+        'uploads.page': uploads.page,
+        'uploads.replay_status': uploads.replay_status,
+        'uploads.stop_replay': uploads.stop_replay,
+        'uploads.start_replay': uploads.start_replay,
+    }
+
+
+def watch_parent(parent_pid):
+    """
+    Stop this process once its parent (the gunicorn master) is gone.
+    """
+    while os.getppid() == parent_pid:
+        time.sleep(1.0)
+    logger.warning("Parent process %s exited, stopping the ingest process", parent_pid)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the MQTT ingest process of the multi-process serving mode.')
+    parser.add_argument('--parent-pid', type=int, help='exit when this process exits')
+    args = parser.parse_args()
+
+    configure_logging(get_settings()['logging'])
+    os.makedirs(run_dir(), mode=0o700, exist_ok=True)
+
+    try:
+        # First, a second ingest process must not open the history too.
+        ring = SharedRing.create(ring_path(), get_setting('serving', 'ring_slots'),
+                                 get_setting('serving', 'slot_size'))
+    except BlockingIOError as e:
+        logger.error("%s, exiting", e)
+        sys.exit(1)
+
+    backend = LocalBackend()
+    backend.start()
+    RingWriter(ring, message_buffer, message_hub).start()
+
+    atexit.register(backend.close)
+    # Stop sends SIGTERM, exit normally so the history is flushed by atexit.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if args.parent_pid:
+        threading.Thread(target=watch_parent, args=(args.parent_pid,), name='parent-watch', daemon=True).start()
+
+    RPCServer(rpc_address(), write_authkey(), rpc_handlers(backend, ring)).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
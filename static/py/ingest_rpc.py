@@ -0,0 +1,301 @@
+"""
+This file contains the calls between the web workers and the ingest process of the multi-process serving mode:
+RPCClient in the workers and RPCServer in the ingest process, over a Unix socket with multiprocessing.connection and
+a key only the app user can read, the location of the files they share and spawn_ingest_process() used by gunicorn
+and by python server.py with the 'serving' ingest_process setting.
+It only needs the settings, so the gunicorn master can import it without creating the MQTT ingest objects.
+IngestSupervisor starts the ingest process again when it exits.
+This file is used by backend.py, ingest_owner.py, server.py and gunicorn.conf.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from static.py.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+APP_NAME = 'NetworkDashboard'
+
+
+class BackendError(Exception):
+    """
+    The ingest process could not be reached or failed to answer.
+    """
+
+
+"""
+Following functions are used to find the files shared by the ingest process and the web workers.
+"""
+
+
+def run_dir():
+    """
+    Directory of the ring, socket and key files: the 'serving' run_dir setting, by default a directory in
+    /dev/shm (memory, never the flash) or in the temporary directory when there is no /dev/shm.
+    """
+    directory = get_setting('serving', 'run_dir')
+    if not directory:
+        base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        directory = os.path.join(base, APP_NAME)
+    return directory
+
+
+def ring_path():
+    return os.path.join(run_dir(), 'messages.ring')
+
+
+def rpc_address():
+    return os.path.join(run_dir(), 'ingest.sock')
+
+
+def key_path():
+    return os.path.join(run_dir(), 'ingest.key')
+
+
+def spawn_ingest_process(ready_timeout=30.0):
+    """
+    Start the ingest process (python -m static.py.ingest_owner) and wait until it accepts calls.
+    Returns the Popen of the process.
+    """
+    app_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    process = subprocess.Popen([sys.executable, '-m', 'static.py.ingest_owner', '--parent-pid', str(os.getpid())],
+                               cwd=app_dir)
+    deadline = time.monotonic() + ready_timeout
+    other_pid = None
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise BackendError(f"The ingest process exited with status {process.returncode}")
+        try:
+            # ping answers the pid, a stale ingest process left on the same socket must not pass for this one.
+            pid = RPCClient(rpc_address(), key_path(), timeout=1.0).call('ping')
+        except BackendError:
+            pid = None
+        if pid == process.pid:
+            logger.info("Ingest process %s ready", process.pid)
+            return process
+        if pid is not None and pid != other_pid:
+            other_pid = pid
+            logger.warning("Ingest process %s answers on %s, waiting for %s", pid, rpc_address(), process.pid)
+        time.sleep(0.1)
+    process.terminate()
+    raise BackendError(f"The ingest process did not start within {ready_timeout} s")
+
+
+class IngestSupervisor:
+    """
+    Starts the ingest process and, from a watchdog thread, starts it again whenever it exits, waiting longer
+    between the tries while it keeps exiting right after starting. The web workers notice the new ring and
+    key by themselves. Used by the gunicorn master (gunicorn.conf.py) and by python server.py with the
+    'serving' ingest_process setting.
+    """
+
+    def __init__(self, ready_timeout=30.0, check_interval=1.0, max_backoff=60.0):
+        self.ready_timeout = ready_timeout
+        self.check_interval = check_interval
+        self.max_backoff = max_backoff
+        self.process = None
+        self.restarts = 0
+        self._started = 0.0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start the ingest process and the watchdog. Raises BackendError when the process does not start.
+        """
+        self._spawn()
+        self._thread = threading.Thread(target=self._watch, name='ingest-supervisor', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=30.0):
+        """
+        Stop the watchdog and terminate the ingest process.
+        """
+        self._stopped.set()
+        with self._lock:
+            process = self.process
+            if process is not None and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+
+    def _spawn(self):
+        with self._lock:
+            if self._stopped.is_set():
+                return
+            self.process = spawn_ingest_process(self.ready_timeout)
+            self._started = time.monotonic()
+
+    def _watch(self):
+        backoff = 1.0
+        while not self._stopped.wait(self.check_interval):
+            status = self.process.poll()
+            if status is None or self._stopped.is_set():
+                continue
+            logger.error("The ingest process %s exited with status %s, starting it again", self.process.pid, status)
+            if time.monotonic() - self._started >= self.max_backoff:
+                backoff = 1.0
+            while not self._stopped.wait(backoff):
+                backoff = min(backoff * 2, self.max_backoff)
+                try:
+                    self._spawn()
+                    self.restarts += 1
+                    break
+                except BackendError as e:
+                    logger.error("Error starting the ingest process, trying again in %s s: %s", backoff, e)
+
+
+"""
+Following classes are used to call the ingest process.
+"""
+
+
+class RPCClient:
+    """
+    Calls the ingest process: every call sends (name, args, kwargs) and receives ('ok', result) or
+    ('error', exception type name, message). Connections are reused, one per concurrent call. The key
+    is read from key_file for every new connection, it changes when the ingest process restarts.
+    """
+
+    def __init__(self, address, key_file, timeout=30.0):
+        self.address = address
+        self.key_file = key_file
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def call(self, name, /, *args, **kwargs):
+        return self.request(name, args, kwargs)
+
+    def request(self, name, args=(), kwargs=None, timeout=-1):
+        """
+        Call name(*args, **kwargs) in the ingest process. A ValueError raised there is raised again,
+        any other failure raises BackendError. timeout=None waits for the answer as long as it takes.
+        """
+        timeout = self.timeout if timeout == -1 else timeout
+        for attempt in (1, 2):
+            connection, reused = self._connection()
+            try:
+                connection.send((name, args, kwargs or {}))
+                if timeout is not None and not connection.poll(timeout):
+                    connection.close()
+                    raise BackendError(f"The ingest process did not answer {name} within {timeout} s")
+                status, result = connection.recv()
+            except (EOFError, OSError) as e:
+                connection.close()
+                if reused and attempt == 1:
+                    # The ingest process restarted since the connection was used, try a new one.
+                    continue
+                raise BackendError(f"Error calling {name} in the ingest process: {e}")
+            with self._lock:
+                self._idle.append(connection)
+            if status == 'ok':
+                return result
+            error_type, message = result
+            raise (ValueError if error_type == 'ValueError' else BackendError)(message)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def _connection(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        try:
+            with open(self.key_file, 'rb') as file:
+                authkey = file.read()
+            return Client(self.address, family='AF_UNIX', authkey=authkey), False
+        except (OSError, EOFError, AuthenticationError) as e:
+            raise BackendError(f"The ingest process is not running: {e}")
+
+
+class RPCServer:
+    """
+    Answers the calls of RPCClient on a Unix socket, one thread per connection.
+    """
+
+    def __init__(self, address, authkey, handlers):
+        self.address = address
+        self.authkey = authkey
+        self.handlers = handlers
+        self.calls = 0
+        self.errors = 0
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            # Left by an ingest process which did not exit cleanly.
+            os.unlink(self.address)
+        listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        os.chmod(self.address, 0o600)
+        logger.info("Ingest process %s listening on %s", os.getpid(), self.address)
+        try:
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    logger.warning("Rejected a connection to the ingest process: %s", e)
+                    continue
+                threading.Thread(target=self._serve, args=(connection,), name='ingest-rpc', daemon=True).start()
+        finally:
+            listener.close()
+
+    def _serve(self, connection):
+        with connection:
+            while True:
+                try:
+                    name, args, kwargs = connection.recv()
+                except (EOFError, OSError):
+                    return
+                self.calls += 1
+                handler = self.handlers.get(name)
+                try:
+                    if handler is None:
+                        raise LookupError(f"Unknown call {name}")
+                    response = ('ok', handler(*args, **kwargs))
+                except ValueError as e:
+                    response = ('error', ('ValueError', str(e)))
+                except Exception as e:
+                    self.errors += 1
+                    logger.exception("Error in the %s call", name)
+                    response = ('error', (type(e).__name__, str(e)))
+                try:
+                    connection.send(response)
+                except OSError:
+                    return
+                except Exception as e:
+                    # The result could not be pickled.
+                    self.errors += 1
+                    connection.send(('error', (type(e).__name__, f"Invalid result of the {name} call: {e}")))
+
+
+def write_authkey():
+    """
+    Draw the key the web workers must present and write it, readable by this user only.
+    """
+    authkey = os.urandom(32)
+    temp = key_path() + '.tmp'
+    fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as file:
+        file.write(authkey)
+    os.replace(temp, key_path())
+    return authkey
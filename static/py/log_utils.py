@@ -0,0 +1,189 @@
+"""
+This file configures the application logging.
+Log levels are set per module from the 'logging' settings and can be changed at runtime with set_level().
+Hot-path records are rate limited per message and the most recent records are kept in memory and served
+by the /logs route, so debugging does not have to write every uplink to the gateway flash.
+The StartupTimer measures the phases of the app startup, logged once the app is ready and served by /stats.
+This file is used by server.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+recent_records = None
+rate_limit_filter = None
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per message: every logger/format-string pair may emit 'burst' records at once and then
+    'per_second' records per second. Records at WARNING or above are never limited.
+    The number of suppressed records is counted per key.
+    """
+
+    def __init__(self, per_second=5.0, burst=20):
+        super().__init__()
+        self.per_second = float(per_second)
+        self.burst = float(burst)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.suppressed = {}
+
+    def filter(self, record):
+        # The filter is shared by several handlers, decide once per record.
+        allowed = getattr(record, 'rate_allowed', None)
+        if allowed is None:
+            allowed = record.rate_allowed = self._allow(record)
+        return allowed
+
+    def _allow(self, record):
+        if record.levelno >= logging.WARNING or self.per_second <= 0:
+            return True
+
+        key = getattr(record, 'rate_key', None) or (record.name, record.msg)
+        now = record.created
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.per_second)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+            self._buckets[key] = (tokens - 1, now)
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {f'{key[0]}: {key[1]}' if isinstance(key, tuple) else str(key): count
+                    for key, count in self.suppressed.items()}
+
+
+class RecentRecordsHandler(logging.Handler):
+    """
+    Keep the last 'capacity' records in memory. Records are only formatted when they are read.
+    """
+
+    def __init__(self, capacity=500, level=logging.NOTSET):
+        super().__init__(level)
+        self._records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self._records.append(record)
+
+    def records(self, level=logging.NOTSET, limit=None, name=None):
+        """
+        Return the recent records as dictionaries, newest last.
+        """
+        selected = [r for r in list(self._records)
+                    if r.levelno >= level and (not name or r.name.startswith(name))]
+        if limit:
+            selected = selected[-limit:]
+        return [{
+            'time': r.created,
+            'level': r.levelname,
+            'logger': r.name,
+            'message': r.getMessage(),
+        } for r in selected]
+
+
+def parse_level(level):
+    """
+    Accept a level name ('debug', 'INFO') or number and return the number.
+    """
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return value
+
+
+def configure_logging(settings):
+    """
+    Configure the root logger from the 'logging' settings section.
+    """
+    global recent_records, rate_limit_filter
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(parse_level(settings.get('level', 'INFO')))
+
+    rate_limit_filter = RateLimitFilter(settings.get('rate_limit_per_second', 5),
+                                        settings.get('rate_limit_burst', 20))
+
+    if settings.get('console', True):
+        console = logging.StreamHandler()
+        console.setLevel(parse_level(settings.get('console_level', 'NOTSET')))
+        console.setFormatter(logging.Formatter(LOG_FORMAT))
+        console.addFilter(rate_limit_filter)
+        root.addHandler(console)
+
+    capacity = settings.get('memory_records', 500)
+    if capacity:
+        recent_records = RecentRecordsHandler(capacity)
+        recent_records.addFilter(rate_limit_filter)
+        root.addHandler(recent_records)
+    else:
+        recent_records = None
+
+    for name, level in settings.get('levels', {}).items():
+        logging.getLogger(name).setLevel(parse_level(level))
+
+
+def set_level(name, level):
+    """
+    Change the level of a logger at runtime. An empty name is the root logger.
+    """
+    logging.getLogger(name or None).setLevel(parse_level(level))
+
+
+def get_levels():
+    """
+    Return the level of the root logger and of every logger with its own level.
+    """
+    levels = {'': logging.getLevelName(logging.getLogger().level)}
+    for name, logger in logging.Logger.manager.loggerDict.items():
+        if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET:
+            levels[name] = logging.getLevelName(logger.level)
+    return levels
+
+
+class StartupTimer:
+    """
+    Time of each startup phase: mark(phase) ends the current phase, which started at the previous mark
+    (or when the timer was created). Phases run in the background are added with add().
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = OrderedDict()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = round((now - self._last) * 1000, 1)
+        self._last = now
+
+    def add(self, phase, seconds):
+        self.phases[phase] = round(seconds * 1000, 1)
+
+    def total_ms(self):
+        return round((self._last - self.started) * 1000, 1)
+
+    def summary(self):
+        """
+        Return the phases as 'phase 12.3 ms, ...' for the log.
+        """
+        return ', '.join(f"{phase} {ms} ms" for phase, ms in self.phases.items())
+
+    def stats(self):
+        return {'total_ms': self.total_ms(), 'phases_ms': dict(self.phases)}
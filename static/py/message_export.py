@@ -0,0 +1,95 @@
+"""
+This file contains the functions used by /dump_messages to export the messages as a stream.
+The messages are serialized one by one from a snapshot and sent in chunks, optionally gzip compressed on
+the fly, so an export never builds the whole document in memory. Every exported message carries its
+sequence number, so an interrupted download can be resumed from the last one received.
+This file is used by server.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import json
+import zlib
+from datetime import datetime
+
+FORMATS = ('json', 'ndjson')
+
+# Size of the chunks sent to the client, before compression.
+CHUNK_SIZE = 65536
+
+
+def parse_time(value):
+    """
+    Parse a time given as epoch seconds or ISO 8601 (local time when no timezone is given).
+    Returns epoch seconds or None for an empty value. Raises ValueError for anything else.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def select_messages(messages, deveui=None, event=None, start_ts=None, end_ts=None, after_seq=0, until_seq=None):
+    """
+    Yield the MessageRecords matching the selection. deveui and event are compared without case.
+    """
+    deveui = deveui.lower() if deveui else None
+    event = event.lower() if event else None
+    for m in messages:
+        if m.seq <= after_seq or (until_seq is not None and m.seq > until_seq):
+            continue
+        if deveui and (m.deveui or '').lower() != deveui:
+            continue
+        if event:
+            m.decode()
+            if (m.event or '').lower() != event:
+                continue
+        if start_ts is not None and (m.ts is None or m.ts < start_ts):
+            continue
+        if end_ts is not None and (m.ts is None or m.ts > end_ts):
+            continue
+        yield m
+
+
+def export_messages(messages, fmt='json', compress=False):
+    """
+    Yield the messages serialized as a JSON array (one message per line) or as NDJSON, in chunks of
+    about CHUNK_SIZE bytes, gzip compressed when compress is set.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def encode(text):
+        data = text.encode()
+        return compressor.compress(data) if compressor else data
+
+    parts = ['['] if fmt == 'json' else []
+    size = 0
+    separator = ''
+    for m in messages:
+        line = json.dumps(m.to_dict(), separators=(',', ':'))
+        if fmt == 'json':
+            parts.append(separator + '\n' + line)
+            separator = ','
+        else:
+            parts.append(line + '\n')
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            chunk = encode(''.join(parts))
+            parts = []
+            size = 0
+            if chunk:
+                yield chunk
+
+    if fmt == 'json':
+        parts.append('\n]\n')
+    chunk = encode(''.join(parts))
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
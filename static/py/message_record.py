@@ -0,0 +1,334 @@
+"""
+This file contains the MessageRecord class, the compact form in which the MQTT messages are buffered.
+A record keeps the uplink fields as a tuple of values next to a shared tuple of keys, the payload as raw
+bytes instead of base64, the receive time as an epoch float and the topic, deveui, event and other
+repeated strings interned. The usual {'type', 'topic', 'data'} dictionary is only rebuilt by to_dict()
+when a message is sent to the browser or written to a file. An uplink may also be stored undecoded and
+decoded the first time its decoded data is needed, see MessageRecord.decode().
+This file is used by mqtt_utils.py, message_store.py, search_index.py, device_registry.py, history_store.py and server.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import base64
+import binascii
+import logging
+import sys
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Uplink fields whose string values repeat from one message to the next.
+INTERNED_FIELDS = frozenset(('deveui', 'appeui', 'joineui', 'gweui', 'modu', 'datr', 'codr', 'cls'))
+
+# Decoded string values up to this length are interned (event names, states, device types...).
+INTERNED_VALUE_LENGTH = 32
+
+# Key tuples shared by every record with the same fields in the same order.
+MAX_LAYOUTS = 1024
+_layouts = {}
+
+# Called with every record decoded by MessageRecord.decode(), e.g. to index its decoded event.
+decode_listeners = []
+# Only held to publish a decoded result, never while decoding or calling the listeners.
+_decode_lock = threading.Lock()
+
+
+def _layout(keys):
+    layout = _layouts.get(keys)
+    if layout is None:
+        if len(_layouts) >= MAX_LAYOUTS:
+            return keys
+        layout = _layouts[keys] = tuple(sys.intern(key) if isinstance(key, str) else key for key in keys)
+    return layout
+
+
+def _payload_bytes(value):
+    """
+    Return the base64 payload as bytes, or None when it would not encode back to the same string.
+    """
+    try:
+        payload = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    if base64.b64encode(payload).decode() != value:
+        return None
+    return payload
+
+
+class MessageRecord:
+    """
+    One buffered MQTT message. Records are read-only once stored, apart from 'seq' which the store sets.
+
+    'layout' and 'values' hold the fields of the message data in their original order, with the 'data'
+    value in 'payload' and the 'data_decoded' dictionary in 'decoded_layout' and 'decoded_values'.
+    When the message data is not a dictionary (error messages) 'layout' is None and 'values' is the data.
+
+    An uplink stored with a 'decoder' is not decoded yet: its 'data_decoded' is None and 'event',
+    'decoded_layout' and 'decoded_values' are only set once decode() ran. decoded, decoded_field() and
+    data() decode it, the other fields never do.
+
+    'replayed' is True for a message played back from a capture (see Replay) rather than received live.
+    """
+
+    __slots__ = ('seq', 'type', 'topic', 'ts', 'deveui', 'event', 'payload',
+                 'layout', 'values', 'decoded_layout', 'decoded_values', 'decoder', 'replayed')
+
+    def __init__(self, type, topic, ts, data):
+        self.seq = 0
+        self.type = sys.intern(type)
+        self.topic = sys.intern(topic)
+        self.ts = ts
+        self.deveui = None
+        self.event = None
+        self.payload = None
+        self.decoded_layout = None
+        self.decoded_values = None
+        self.decoder = None
+        self.replayed = False
+        if isinstance(data, dict):
+            self._pack(data)
+        else:
+            self.layout = None
+            self.values = data
+
+    @classmethod
+    def from_dict(cls, message, ts=None):
+        """
+        Build a record from the dictionary form, e.g. read back from the history or a capture file.
+        Without ts the receive time is parsed from data['current_time'].
+        """
+        data = message.get('data')
+        if ts is None and isinstance(data, dict) and isinstance(data.get('current_time'), str):
+            try:
+                ts = datetime.fromisoformat(data['current_time']).timestamp()
+            except ValueError:
+                ts = None
+        record = cls(message.get('type', 'json'), message.get('topic', ''), ts, data)
+        record.seq = message.get('seq', 0)
+        record.replayed = bool(message.get('replayed', False))
+        return record
+
+    def _pack(self, data):
+        keys = []
+        values = []
+        for key, value in data.items():
+            if key == 'current_time':
+                # Rebuilt from ts.
+                continue
+            if key == 'data' and isinstance(value, str):
+                payload = _payload_bytes(value)
+                if payload is not None:
+                    self.payload = payload
+                    value = None
+            elif key == 'data_decoded' and isinstance(value, dict):
+                self._set_decoded(value)
+                value = None
+            elif key in INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+                if key == 'deveui':
+                    self.deveui = value
+            keys.append(key)
+            values.append(value)
+        self.layout = _layout(tuple(keys))
+        self.values = tuple(values)
+
+    def _set_decoded(self, decoded):
+        self.decoded_layout = _layout(tuple(decoded))
+        self.decoded_values = tuple(
+            sys.intern(v) if isinstance(v, str) and len(v) <= INTERNED_VALUE_LENGTH else v
+            for v in decoded.values())
+        event = decoded.get('event')
+        if isinstance(event, str):
+            self.event = sys.intern(event)
+
+    """
+    Lazy decoding.
+    """
+
+    @property
+    def pending(self):
+        """
+        True while the payload waits to be decoded.
+        """
+        return self.decoder is not None
+
+    def decode(self):
+        """
+        Decode the payload of a record stored undecoded with decoder(payload_bytes) and tell the
+        decode_listeners. Returns True when this call decoded it, False when there was nothing to do.
+        Decoder exceptions are logged and leave the record undecoded for good.
+
+        Threads reading the same record at once may both run the decoder, only the first result is kept
+        and only that thread tells the listeners, after the lock is released.
+        """
+        decoder = self.decoder
+        if decoder is None:
+            return False
+        try:
+            decoded = decoder(self.payload)
+        except Exception as e:
+            logger.warning("Error decoding message %s on %s: %s", self.seq, self.topic, e)
+            decoded = None
+        with _decode_lock:
+            if self.decoder is not decoder:
+                return False
+            if isinstance(decoded, dict):
+                self._set_decoded(decoded)
+            # Cleared last: a reader seeing no decoder finds the decoded fields set.
+            self.decoder = None
+        for listener in decode_listeners:
+            listener(self)
+        return True
+
+    """
+    Field access without rebuilding the dictionary.
+    """
+
+    def field(self, name, default=None):
+        """
+        Return one field of the message data (not 'data' or 'data_decoded').
+        """
+        if self.layout is None:
+            return default
+        try:
+            return self.values[self.layout.index(name)]
+        except ValueError:
+            return default
+
+    def decoded_field(self, name, default=None):
+        """
+        Return one field of data_decoded without rebuilding the dictionary.
+        """
+        self.decode()
+        if self.decoded_layout is None:
+            return default
+        try:
+            return self.decoded_values[self.decoded_layout.index(name)]
+        except ValueError:
+            return default
+
+    @property
+    def decoded(self):
+        """
+        The data_decoded dictionary, or None when the message was not decoded.
+        """
+        self.decode()
+        if self.decoded_layout is None:
+            return None
+        return dict(zip(self.decoded_layout, self.decoded_values))
+
+    @property
+    def current_time(self):
+        """
+        The receive time as the local ISO 8601 string stored in data['current_time'], or None.
+        """
+        if self.layout is None or self.ts is None:
+            return None
+        return datetime.fromtimestamp(self.ts).astimezone().isoformat()
+
+    @property
+    def hhmm(self):
+        """
+        The hh:mm of the receive time, as current_time[11:16], or '' without a receive time.
+        """
+        if self.layout is None or self.ts is None:
+            return ''
+        return time.strftime('%H:%M', time.localtime(self.ts))
+
+    """
+    Conversion to the dictionary form.
+    """
+
+    def data(self, decode=True):
+        """
+        Rebuild the message data as it was received, with 'current_time' added.
+        Without decode a record not decoded yet keeps 'data_decoded' None.
+        """
+        if self.layout is None:
+            return self.values
+        if decode:
+            self.decode()
+        data = {}
+        for key, value in zip(self.layout, self.values):
+            if key == 'data' and self.payload is not None:
+                value = base64.b64encode(self.payload).decode()
+            elif key == 'data_decoded' and self.decoded_layout is not None:
+                value = self.decoded
+            data[key] = value
+        if self.ts is not None:
+            data['current_time'] = self.current_time
+        return data
+
+    def to_dict(self, decode=True):
+        """
+        Return the message in the {'type', 'topic', 'data', 'seq'} shape sent to the browser, with
+        'replayed': True for a replayed message.
+        """
+        message = {
+            'type': self.type,
+            'topic': self.topic,
+            'data': self.data(decode),
+            'seq': self.seq,
+        }
+        if self.replayed:
+            message['replayed'] = True
+        return message
+
+
+def record_size(record):
+    """
+    Estimate the memory of one record from its own objects, leaving out the interned strings and key
+    tuples it shares with other records. Cheap enough to be computed on every store and eviction.
+    """
+    size = sys.getsizeof(record)
+    if record.layout is None:
+        return size + sys.getsizeof(record.values)
+    size += sys.getsizeof(record.values)
+    for key, value in zip(record.layout, record.values):
+        if value is not None and key not in INTERNED_FIELDS:
+            size += sys.getsizeof(value)
+    if record.payload is not None:
+        size += sys.getsizeof(record.payload)
+    return size + decoded_size(record)
+
+
+def decoded_size(record):
+    """
+    The part of record_size() taken by the decoded values, 0 while the record is not decoded.
+    """
+    if record.decoded_values is None:
+        return 0
+    size = sys.getsizeof(record.decoded_values)
+    for value in record.decoded_values:
+        if not (isinstance(value, str) and len(value) <= INTERNED_VALUE_LENGTH):
+            size += sys.getsizeof(value)
+    return size
+
+
+def deep_size(objects):
+    """
+    Return the memory used by the objects and everything they reference, counting shared objects
+    (interned strings, key tuples) once.
+    """
+    seen = set()
+    total = 0
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif isinstance(obj, MessageRecord):
+            stack.extend(getattr(obj, name) for name in MessageRecord.__slots__)
+    return total
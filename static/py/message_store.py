@@ -0,0 +1,385 @@
+"""
+This file contains the MessageStore class used to buffer the MQTT messages received from the broker.
+The store holds MessageRecords up to a message count and/or memory budget: every message gets a monotonic
+sequence number, is indexed by deveui and event, and readers get a cheap immutable snapshot instead of
+walking a live queue. The eviction policy decides which messages go first once the store is full.
+Uplinks stored undecoded are indexed by event once they are decoded.
+This file is used by mqtt_utils.py (writer) and server.py (readers).
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import heapq
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+from static.py.message_record import decoded_size, deep_size, record_size
+from static.py.search_index import SearchIndex
+
+
+# Eviction policies, see _victim().
+FIFO = 'fifo'
+DEVICE_QUOTA = 'device_quota'
+KEEP_LATEST = 'keep_latest'
+PRIORITY = 'priority'
+EVICTION_POLICIES = (FIFO, DEVICE_QUOTA, KEEP_LATEST, PRIORITY)
+
+
+class MessageStore:
+    """
+    Bounded message buffer with sequence numbers and secondary indexes.
+
+    The store is full when it holds more than 'capacity' messages or more than 'max_bytes' of estimated
+    record memory (0 disables either limit). Which message is evicted then depends on the policy:
+
+    - 'fifo': the oldest message.
+    - 'device_quota': the oldest message of the device with the most buffered messages, so a chatty
+      sensor cannot push out everyone else. With device_quota, a device never keeps more than that many.
+    - 'keep_latest': the oldest message which is not the latest one of its (deveui, event).
+    - 'priority': the oldest message whose event is not in priority_events (e.g. tamper and water alarms).
+
+    When the policy has nothing left to evict, the oldest message goes. Sequence numbers stay sorted,
+    but with a policy other than 'fifo' the buffered ones are no longer contiguous.
+
+    Writers call put(). Readers call snapshot(), since(), by_deveui() or by_event() and get back tuples
+    which are never modified afterwards, so they can be iterated without holding the lock while the
+    MQTT thread keeps writing. Stored messages must be treated as read-only.
+
+    A message stored undecoded (see MessageRecord.decode) is only indexed by deveui until decoded() is
+    called for it. by_event(), events() and search() decode the pending messages first. The 'keep_latest'
+    and 'priority' policies need the event of every message, so put() decodes it before storing it.
+    """
+
+    def __init__(self, capacity=150, max_bytes=0, policy=FIFO, device_quota=0, priority_events=()):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"policy must be one of {EVICTION_POLICIES}")
+        if not capacity and not max_bytes:
+            raise ValueError("capacity or max_bytes must be set")
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.device_quota = device_quota
+        self.priority_events = frozenset(priority_events)
+        self._lock = threading.Lock()
+        # seq -> message, oldest first. Sequence numbers are strictly increasing in this order.
+        self._messages = OrderedDict()
+        # deveui/event -> OrderedDict(seq -> message)
+        self._by_deveui = {}
+        self._by_event = {}
+        self._search = SearchIndex()
+        self._next_seq = 1
+        self._bytes = 0
+        self.evicted = 0
+        # keep_latest and priority: heap of the sequence numbers which may be evicted. Entries of
+        # messages already gone are skipped when they reach the top.
+        self._evictable = []
+        # keep_latest: (deveui, event) -> sequence number of its latest message.
+        self._latest = {}
+        # seq -> message of the messages not decoded yet, oldest first.
+        self._pending = OrderedDict()
+        # Cached snapshot, rebuilt on the first read after a write.
+        self._snapshot = ((), ())
+
+    def __len__(self):
+        return len(self._messages)
+
+    @property
+    def first_seq(self):
+        """
+        Sequence number of the oldest buffered message (0 when the store is empty).
+        """
+        with self._lock:
+            return next(iter(self._messages), 0)
+
+    @property
+    def last_seq(self):
+        """
+        Sequence number of the newest message ever stored (0 when nothing was stored yet).
+        """
+        return self._next_seq - 1
+
+    def put(self, message):
+        """
+        Store a message, evicting others as the policy decides once the store is full.
+        Returns the sequence number given to the message.
+        """
+        if self.policy in (KEEP_LATEST, PRIORITY):
+            message.decode()
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            message.seq = seq
+
+            self._add(seq, message)
+            self._evict_while_full()
+
+            self._snapshot = None
+            return seq
+
+    def restore(self, messages, next_seq=None):
+        """
+        Load messages which already carry their seq (e.g. read back from the history at startup),
+        oldest first, and continue numbering after them or at next_seq, whichever is higher.
+        """
+        if self.policy in (KEEP_LATEST, PRIORITY):
+            for message in messages:
+                message.decode()
+        with self._lock:
+            for message in sorted(messages, key=lambda m: m.seq):
+                self._add(message.seq, message)
+                self._next_seq = max(self._next_seq, message.seq + 1)
+                self._evict_while_full()
+            if next_seq is not None:
+                self._next_seq = max(self._next_seq, next_seq)
+
+            self._snapshot = None
+
+    def clear(self):
+        """
+        Drop every message and start numbering at 1 again, e.g. when the messages come from a new source.
+        """
+        with self._lock:
+            self._messages.clear()
+            self._by_deveui = {}
+            self._by_event = {}
+            self._search = SearchIndex()
+            self._next_seq = 1
+            self._bytes = 0
+            self._evictable = []
+            self._latest = {}
+            self._pending.clear()
+            self._snapshot = None
+
+    def snapshot(self):
+        """
+        Return an immutable tuple of all buffered messages, oldest first.
+        """
+        return self._current_snapshot()[0]
+
+    def since(self, seq):
+        """
+        Return the buffered messages with a sequence number greater than seq, oldest first.
+        """
+        messages, seqs = self._current_snapshot()
+        return messages[bisect_right(seqs, seq):]
+
+    def window(self, seq):
+        """
+        Return (messages, head, tail) from a single consistent snapshot: the messages stored after seq,
+        the newest and the oldest buffered sequence numbers (0 when the store is empty).
+        """
+        messages, seqs = self._current_snapshot()
+        if not seqs:
+            return (), 0, 0
+        return messages[bisect_right(seqs, seq):], seqs[-1], seqs[0]
+
+    def search(self, filter_type, deveui_filter, since=0):
+        """
+        Like window(), but only return the messages matching the free text filter of /messages.
+        filter_type is the lowercase filter and deveui_filter its deveui part (see server.parse_filter).
+        """
+        if filter_type:
+            # The decoded values of the pending messages are not indexed yet.
+            self.decode_pending()
+        messages, head, tail = self.window(since)
+        with self._lock:
+            seqs = self._search.search(filter_type, deveui_filter)
+            if seqs is None:
+                return messages, head, tail
+            if len(seqs) < len(messages):
+                # Few matches: fetch them directly instead of testing every message of the window.
+                matches = tuple(self._messages[seq] for seq in sorted(seqs)
+                                if since < seq <= head and seq in self._messages)
+                return matches, head, tail
+        return tuple(m for m in messages if m.seq in seqs), head, tail
+
+    def get(self, seq):
+        """
+        Return the message with the given sequence number or None if it was evicted.
+        """
+        with self._lock:
+            return self._messages.get(seq)
+
+    def by_deveui(self, deveui):
+        """
+        Return the buffered messages of a device, oldest first.
+        """
+        with self._lock:
+            return tuple(self._by_deveui.get(deveui, {}).values())
+
+    def by_event(self, event):
+        """
+        Return the buffered messages with the given decoded event, oldest first.
+        """
+        self.decode_pending()
+        with self._lock:
+            return tuple(self._by_event.get(event, {}).values())
+
+    def deveuis(self):
+        """
+        Return the deveuis currently present in the buffer.
+        """
+        with self._lock:
+            return tuple(self._by_deveui)
+
+    def events(self):
+        """
+        Return the decoded events currently present in the buffer.
+        """
+        self.decode_pending()
+        with self._lock:
+            return tuple(self._by_event)
+
+    def decode_pending(self):
+        """
+        Decode every buffered message which is not decoded yet, oldest first.
+        """
+        with self._lock:
+            pending = tuple(self._pending.values())
+        for message in pending:
+            message.decode()
+
+    def decoded(self, message):
+        """
+        Index a buffered message decoded after it was stored. Called from a MessageRecord decode
+        listener, so it must not decode anything itself. Returns False for a message this store does not
+        hold undecoded, e.g. one read back from the history.
+        """
+        with self._lock:
+            seq = message.seq
+            if self._pending.get(seq) is not message:
+                return False
+            del self._pending[seq]
+            self._index_add(self._by_event, message.event, seq, message)
+            bucket = self._by_event.get(message.event)
+            if bucket is not None and next(reversed(bucket)) != seq:
+                # Decoded out of order, keep the bucket sorted by seq.
+                self._by_event[message.event] = OrderedDict(sorted(bucket.items()))
+            self._search.remove(seq)
+            self._search.add(seq, message)
+            self._bytes += decoded_size(message)
+            return True
+
+    def memory_usage(self, sample=50):
+        """
+        Estimate the memory of one buffered message from the newest ones: as a record and as the
+        dictionary it replaces. The store indexes are not counted.
+        """
+        messages = self.snapshot()[-sample:]
+        if not messages:
+            return {'bytes_per_message': 0, 'dict_bytes_per_message': 0}
+        return {
+            'bytes_per_message': deep_size(messages) // len(messages),
+            'dict_bytes_per_message': deep_size([m.to_dict() for m in messages]) // len(messages),
+        }
+
+    def _current_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = (tuple(self._messages.values()), tuple(self._messages))
+                    self._snapshot = snapshot
+        return snapshot
+
+    def stats(self):
+        """
+        Return the limits, the policy and the current usage of the store.
+        """
+        with self._lock:
+            return {
+                'messages': len(self._messages),
+                'capacity': self.capacity,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'policy': self.policy,
+                'devices': len(self._by_deveui),
+                'evicted': self.evicted,
+                'first_seq': next(iter(self._messages), 0),
+                'last_seq': self._next_seq - 1,
+            }
+
+    def _add(self, seq, message):
+        self._messages[seq] = message
+        if message.pending:
+            self._pending[seq] = message
+        self._index_add(self._by_deveui, message.deveui, seq, message)
+        self._index_add(self._by_event, message.event, seq, message)
+        self._search.add(seq, message)
+        self._bytes += record_size(message)
+
+        if self.policy == KEEP_LATEST:
+            if message.deveui is None:
+                heapq.heappush(self._evictable, seq)
+            else:
+                previous = self._latest.get((message.deveui, message.event))
+                self._latest[(message.deveui, message.event)] = seq
+                if previous is not None:
+                    heapq.heappush(self._evictable, previous)
+        elif self.policy == PRIORITY:
+            if message.event not in self.priority_events:
+                heapq.heappush(self._evictable, seq)
+        elif self.policy == DEVICE_QUOTA and self.device_quota and message.deveui is not None:
+            bucket = self._by_deveui[message.deveui]
+            if len(bucket) > self.device_quota:
+                self._evict(next(iter(bucket)))
+
+    def _evict_while_full(self):
+        # Never evict the last message, however big it is.
+        while len(self._messages) > 1 and (
+                (self.capacity and len(self._messages) > self.capacity) or
+                (self.max_bytes and self._bytes > self.max_bytes)):
+            self._evict(self._victim())
+
+    def _victim(self):
+        """
+        Return the sequence number of the next message to evict.
+        """
+        if self.policy in (KEEP_LATEST, PRIORITY):
+            while self._evictable:
+                seq = heapq.heappop(self._evictable)
+                if seq in self._messages:
+                    return seq
+        elif self.policy == DEVICE_QUOTA:
+            oldest_seq, oldest = next(iter(self._messages.items()))
+            if oldest.deveui is not None and self._by_deveui:
+                busiest = max(self._by_deveui.values(), key=len)
+                return next(iter(busiest))
+            return oldest_seq
+        return next(iter(self._messages))
+
+    def _evict(self, seq):
+        message = self._messages.pop(seq)
+        pending = self._pending.pop(seq, None) is not None
+        self._index_remove(self._by_deveui, message.deveui, seq)
+        self._index_remove(self._by_event, message.event, seq)
+        self._search.remove(seq)
+        # A message decoded while decoded() waits for the lock was counted without its decoded values.
+        self._bytes -= record_size(message) - (decoded_size(message) if pending else 0)
+        self.evicted += 1
+        if self.policy == KEEP_LATEST and self._latest.get((message.deveui, message.event)) == seq:
+            del self._latest[(message.deveui, message.event)]
+
+    @staticmethod
+    def _index_add(index, key, seq, message):
+        if key is None:
+            return
+        bucket = index.get(key)
+        if bucket is None:
+            bucket = index[key] = OrderedDict()
+        bucket[seq] = message
+
+    @staticmethod
+    def _index_remove(index, key, seq):
+        if key is None:
+            return
+        bucket = index.get(key)
+        if bucket is None:
+            return
+        bucket.pop(seq, None)
+        if not bucket:
+            del index[key]
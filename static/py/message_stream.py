@@ -0,0 +1,100 @@
+"""
+This file contains the StreamHub class used to push live messages to the browsers with Server-Sent Events.
+mqtt_utils.on_message publishes every stored message to the hub and every /stream request owns a
+StreamClient with a bounded send queue. This file is used by mqtt_utils.py and server.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import threading
+from collections import deque
+
+
+class StreamClient:
+    """
+    Bounded send queue of one /stream connection.
+
+    publish() is called from the MQTT thread and never blocks: when the browser is too slow and the
+    queue is full the queued messages are dropped and the client is marked as overflowed. The request
+    thread then catches up from the message store instead, which coalesces the backlog into one read.
+    """
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.overflowed = False
+        self.closed = False
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+    def publish(self, message):
+        with self._cond:
+            if len(self._queue) >= self.maxsize:
+                self.dropped += len(self._queue)
+                self._queue.clear()
+                self.overflowed = True
+            self._queue.append(message)
+            self._cond.notify()
+
+    def wait(self, timeout=None):
+        """
+        Wait for queued messages. Returns (messages, overflowed), messages is empty on timeout.
+        """
+        with self._cond:
+            if not self._queue and not self.closed:
+                self._cond.wait(timeout)
+            messages = list(self._queue)
+            self._queue.clear()
+            overflowed = self.overflowed
+            self.overflowed = False
+            return messages, overflowed
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class StreamHub:
+    """
+    Fan-out of the live messages to every connected /stream client.
+    """
+
+    def __init__(self, max_clients=32, queue_size=100):
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._clients = ()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def subscribe(self):
+        """
+        Register a new client. Returns None when the maximum number of clients is reached.
+        """
+        with self._lock:
+            if len(self._clients) >= self.max_clients:
+                return None
+            client = StreamClient(self.queue_size)
+            self._clients = self._clients + (client,)
+            return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients = tuple(c for c in self._clients if c is not client)
+        client.close()
+
+    def publish(self, message):
+        # The tuple is replaced, never modified, so it can be iterated without the lock.
+        for client in self._clients:
+            client.publish(message)
+
+    def stats(self):
+        clients = self._clients
+        return {
+            'clients': len(clients),
+            'dropped': sum(c.dropped for c in clients),
+        }
@@ -9,26 +9,82 @@ Importing the required libraries.
 """
 
 from datetime import datetime, timezone
+import time
 import paho.mqtt.client as mqtt
 import base64
 import json
-import paho.mqtt.publish as publish
+import logging
+import os
+import threading
 from static.data.config import message_type_map
 from static.py.radiobridgev3 import Decoder
+from static.py.decode_cache import DecodeCache
+from static.py.downlink_campaign import CampaignScheduler
+from static.py.downlink_publisher import DownlinkPublisher, QOS_LEVELS, downlink_message
+from static.py.message_record import MessageRecord, decode_listeners
+from static.py.message_store import KEEP_LATEST, PRIORITY, MessageStore
+from static.py.message_stream import StreamHub
+from static.py.device_registry import DeviceRegistry
+from static.py.ingest import IngestPipeline
+from static.py.history_store import HistoryStore
+from static.py.settings import get_setting, get_settings
 
-from queue import Queue
+logger = logging.getLogger(__name__)
 
-# message_buffer = []
+message_buffer = MessageStore(capacity=get_setting('buffer', 'capacity'),
+                              max_bytes=get_setting('buffer', 'max_bytes'),
+                              policy=get_setting('buffer', 'policy'),
+                              device_quota=get_setting('buffer', 'device_quota'),
+                              priority_events=get_setting('buffer', 'priority_events'))
 
-message_buffer = Queue()
+message_hub = StreamHub()
 
-mqtt_client = mqtt.Client()
+# Created by /connect in server.py.
+mqtt_client = None
 
-sensor_list = []
+device_registry = DeviceRegistry()
 
-rb_data_decoded = {}
+# Opened by open_history() when the app starts, None while the history is disabled.
+message_history = None
+
+# Created by get_decoder() when the first uplink is decoded.
+rb_decoder = None
+
+
+def get_decoder():
+    global rb_decoder
+    if rb_decoder is None:
+        rb_decoder = Decoder()
+    return rb_decoder
+
+
+decode_cache = DecodeCache(decoder_factory=get_decoder, capacity=get_setting('decoder_cache', 'capacity'))
+
+# With lazy decoding the uplinks are stored undecoded and decoded the first time they are read.
+lazy_decode = get_setting('ingest', 'lazy_decode')
+
+# Replayed messages are kept out of the history unless this is set.
+record_replays = get_setting('history', 'record_replays')
+
+# Created by create_ingest() in the process which owns the MQTT ingest (LocalBackend), never in the
+# web workers of the multi-process serving mode, which only mirror the messages.
+downlink_publisher = None
+campaign_scheduler = None
+ingest_pipeline = None
+
+
+def buffered_decoded(message):
+    """
+    Decode listener: index the event and update the device of a buffered message decoded after it was
+    stored. Messages read back from the history are not in the buffer and leave both unchanged, an old
+    event must not replace the latest state of its device.
+    """
+    if message_buffer.decoded(message):
+        device_registry.decoded(message)
+
+
+decode_listeners.append(buffered_decoded)
 
-rb_decoder = Decoder()
 
 """
 Following functions are used to connect to the MQTT broker and subscribe to the topic.
@@ -36,89 +92,231 @@ Following functions are used to connect to the MQTT broker and subscribe to the
 
 
 def on_connect(client, userdata, flags, rc):
-    print("Connected with result code " + str(rc))
+    logger.info("Connected with result code %s", rc)
     client.subscribe(userdata['topic'])
 
 
 def on_message(client, userdata, msg):
-    global message_buffer, sensor_list
-    
-    topic = msg.topic
+    """
+    Called on the paho network thread: only hand the raw message to the ingest workers.
+    """
+    ingest_pipeline.submit(msg.topic, msg.payload, time.time())
+
+
+def connect_broker(broker_ip, port, topic):
+    """
+    Replace the subscriber client by one connected to broker_ip:port and subscribed to topic, and publish
+    the downlinks to the same broker. Raises the connection error.
+    """
+    global mqtt_client
+
+    if mqtt_client is not None:
+        mqtt_client.disconnect()
+
+    mqtt_client = mqtt.Client(userdata={'topic': topic})
+    mqtt_client.on_connect = on_connect
+    mqtt_client.on_message = on_message
+
+    mqtt_client.connect(broker_ip, port, 60)
+    mqtt_client.loop_start()
+    use_broker(mqtt_client, broker_ip, port)
+    return mqtt_client
+
+
+def is_uplink(topic):
+    """
+    Return True for an uplink topic, e.g. lora/<deveui>/up.
+    """
+    return topic.rsplit('/', 1)[-1] == 'up'
+
+
+def decode_later(message):
+    """
+    Give an uplink read back without its decoded data (written to the history before it was decoded)
+    the decoder, so it is decoded on first access.
+    """
+    if (message.type == 'json' and message.payload is not None and message.decoded_layout is None and
+            message.layout is not None and 'data_decoded' in message.layout and is_uplink(message.topic)):
+        message.decoder = decode_cache.decode
+
+
+# Held while a message gets its seq and is queued for the history and the stream hub, so with several
+# ingest workers both still see the messages in seq order. Decoding runs before it, in parallel.
+store_lock = threading.Lock()
+
+
+def store_message(entry):
+    """
+    Store a decoded message in the buffer and the history and publish it to the stream hub.
+    Returns (stored, published): the perf_counter() times after storing and after publishing.
+    """
+    with store_lock:
+        message_buffer.put(entry)
+        if message_history is not None and (record_replays or not entry.replayed):
+            message_history.append(entry)
+        stored = time.perf_counter()
+        message_hub.publish(entry)
+        return stored, time.perf_counter()
+
+
+def process_message(topic, payload, receive_ts, replayed=False):
+    """
+    Decode and store one MQTT message. Runs on the ingest worker threads.
+    A replayed message (see Replay) is stored and streamed but never completes a campaign downlink.
+    """
+    started = time.perf_counter()
+    message = payload.decode()
+
+    logger.debug("Received message on %s: %s", topic, message)
 
-    message = msg.payload.decode()
-    
-    print(f"BT - Received message: {message}")
-    
     try:
         # BT - message is converted to dict
         data = json.loads(message)
-        print('\n')
-        print('===================================')
-        print('BT - Topic: {}'.format(topic))
-        print('===================================')
-        print('\n')
-        print('BT - data: {}'.format(data))
-        if 'up' in topic and data['data']:
-            
-            decoded_bytes = base64.b64decode(data['data'])
-            print('BT - hex: {}'.format(decoded_bytes.hex()))
-            rb_data_decoded = rb_decoder.decodePayload(data,decoded_bytes)
-            print('BT - rb_data_decoded: {}'.format(type(rb_data_decoded)))
-            print('\n')
-            print('=============================================================')
-            print('BT - radiobridge data decoded: {}'.format(rb_data_decoded))
-            print('=============================================================')
-            print('\n')
-                     
-            # BT - Adding rb_data_decoded to data
-            data['data_decoded'] = rb_data_decoded
-
-
-        # Get the current system time including the timezone
-        timeStamp1 = datetime.now().astimezone().isoformat()
-        print('BT - Timestamp: {}'.format(timeStamp1))
-        data['current_time'] = timeStamp1
-
-        message_buffer.put({
-            'type': 'json',
-            'topic': topic,
-            'data': data
-        })
-        print('\n')
-        print('=======================================================================')        
-        print('BT - message_buffer length: {}'.format(message_buffer.qsize()))
-        print('=======================================================================')
-        print('\n')
-        
+        decoder = None
+        if is_uplink(topic) and data['data']:
+            if lazy_decode:
+                # Decoded on first access, see MessageRecord.decode().
+                data['data_decoded'] = None
+                decoder = decode_cache.decode
+            else:
+                decoded_bytes = base64.b64decode(data['data'])
+                rb_data_decoded = decode_cache.decode(decoded_bytes)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("RadioBridge payload %s decoded: %s", decoded_bytes.hex(), rb_data_decoded)
+
+                # BT - Adding rb_data_decoded to data
+                data['data_decoded'] = rb_data_decoded
+
+
+        # The receive time is kept as epoch seconds and sent as data['current_time'] in the local timezone.
+        entry = MessageRecord('json', topic, receive_ts, data)
+        entry.replayed = replayed
+        if entry.payload is not None:
+            entry.decoder = decoder
+        if message_buffer.policy in (KEEP_LATEST, PRIORITY):
+            # put() needs the event, decode it here in parallel rather than in the ordered section.
+            entry.decode()
+        decoded = time.perf_counter()
+        stored, published = store_message(entry)
+        device_registry.update(entry)
+        if not replayed:
+            campaign_scheduler.uplink(entry)
+
+        ingest_pipeline.record('decode', decoded - started)
+        ingest_pipeline.record('store', stored - decoded + time.perf_counter() - published)
+        ingest_pipeline.record('publish', published - stored)
+        logger.debug("Stored message %s, message_buffer length: %s", entry.seq, len(message_buffer))
+
     except json.JSONDecodeError:
-        print("Error: Message payload is not valid JSON.")
+        logger.info("Message payload on %s is not valid JSON", topic)
         # message_buffer.put({
         #     'type': 'text',
         #     'topic': topic,
         #     'data': message
         # })
     except TypeError as e:
-        print(f"TypeError: {e}")
-        message_buffer.put({
-            'type': 'error',
-            'topic': topic,
-            'data': f"Error processing message: {e}"
-        })
-        
-    # BT - If the queue exceeds 150 messages, remove the oldest one
-    if message_buffer.qsize() > 150:
-        message = message_buffer.get()
-        # print(f'Removed message: {message}')  # Print the message
+        logger.warning("TypeError processing message on %s: %s", topic, e)
+        entry = MessageRecord('error', topic, receive_ts, f"Error processing message: {e}")
+        entry.replayed = replayed
+        store_message(entry)
+
+
+def create_ingest():
+    """
+    Create the ingest pipeline, the downlink publisher and the campaign scheduler from the settings, once.
+    """
+    global downlink_publisher, campaign_scheduler, ingest_pipeline
+
+    if ingest_pipeline is not None:
+        return ingest_pipeline
+    downlink_publisher = DownlinkPublisher(qos=get_setting('downlink', 'qos'),
+                                           keepalive=get_setting('downlink', 'keepalive'),
+                                           connect_timeout=get_setting('downlink', 'timeout'),
+                                           max_inflight=get_setting('downlink', 'max_inflight'),
+                                           max_queued=get_setting('downlink', 'max_queued'))
+
+    campaign_scheduler = CampaignScheduler(downlink_publisher,
+                                           rate=get_setting('campaign', 'rate'),
+                                           concurrency=get_setting('campaign', 'concurrency'),
+                                           device_interval=get_setting('campaign', 'device_interval'),
+                                           ack_timeout=get_setting('campaign', 'ack_timeout'),
+                                           retries=get_setting('campaign', 'retries'),
+                                           keep_finished=get_setting('campaign', 'keep_finished'))
+
+    ingest_pipeline = IngestPipeline(process_message,
+                                     workers=get_setting('ingest', 'workers'),
+                                     queue_size=get_setting('ingest', 'queue_size'))
+    return ingest_pipeline
 
 
 """
-Following function is used to configure a sensor downlink message.
+Following functions are used to keep the message history on disk across restarts.
 """
 
 
-def send_downlink(data, broker_ip):
+def open_history():
+    """
+    Open the on-disk history from the 'history' settings, reload the newest messages into the message
+    buffer and the device registry and continue the sequence numbers where the history stopped.
+    """
+    global message_history
+
+    settings = dict(get_settings()['history'])
+    if not settings.pop('enabled', True):
+        return None
+    reload_messages = settings.pop('reload_messages', 150)
+    settings.pop('record_replays', None)
+    directory = settings.pop('directory', None) or os.path.join(
+        os.environ.get('APP_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')), 'history')
+
+    try:
+        history = HistoryStore(directory, on_read=decode_later, **settings).open()
+    except (OSError, ValueError, TypeError) as e:
+        logger.error("Error opening the message history in %s, history disabled: %s", directory, e)
+        return None
+
+    if history.last_seq:
+        messages = history.read_before(history.last_seq + 1, reload_messages) if reload_messages else []
+        message_buffer.restore(messages, history.last_seq + 1)
+        for message in messages:
+            device_registry.update(message)
+        logger.info("Reloaded %s messages from the history, continuing at seq %s",
+                    len(messages), history.last_seq + 1)
+
+    message_history = history
+    return history
+
+
+def close_history():
+    """
+    Write the queued messages and close the history, before the app exits or restarts.
+    """
+    global message_history
+
+    history, message_history = message_history, None
+    if history is not None:
+        history.close()
+
+
+"""
+Following functions are used to configure a sensor downlink message.
+"""
+
+
+def use_broker(client, broker_ip, port):
+    """
+    Called once the subscriber client is connected: publish the downlinks through it when the 'downlink'
+    settings share the connection, otherwise over the publisher's own connection to the same broker.
+    """
+    if get_setting('downlink', 'share_connection'):
+        downlink_publisher.share(client, broker_ip, port)
+    else:
+        downlink_publisher.configure(broker_ip, port)
+
+
+def send_downlink(data, broker_ip, port=1883):
     
-    print(f"Using broker_ip in send_downlink: {broker_ip}")
+    logger.debug("Using broker_ip in send_downlink: %s", broker_ip)
 
     if not broker_ip:
         return {"error": "Invalid host."}, 500
@@ -126,17 +324,25 @@ def send_downlink(data, broker_ip):
     # Check if required keys are present
     if 'topic' not in data or 'data' not in data:
         return {"error": "Missing required keys: 'topic' or 'data'"}, 400
+
+    qos = data.get('qos', get_setting('downlink', 'qos'))
+    if qos not in QOS_LEVELS:
+        return {"error": f"qos must be one of {QOS_LEVELS}"}, 400
     
     topic = data['topic'] 
     payload = data['data']
     
     # Wrap payload in JSON
-    json_payload = json.dumps({
-        "data": payload,
-        "port": data['port']
-    })
-    
-    publish.single(topic, payload=json_payload, hostname=broker_ip)
+    json_payload = downlink_message(payload, data['port'])
 
-    return {"message": "Downlink message sent successfully"}, 200
+    if (downlink_publisher.host, downlink_publisher.port) != (broker_ip, port):
+        downlink_publisher.configure(broker_ip, port)
 
+    delivery = downlink_publisher.publish(topic, json_payload, qos=qos)
+    if delivery.wait(get_setting('downlink', 'timeout')):
+        return {"message": "Downlink message sent successfully", "mid": delivery.mid,
+                "latency_ms": round(delivery.latency * 1000, 3)}, 200
+    if delivery.failed:
+        return {"error": f"Could not publish the downlink: {mqtt.error_string(delivery.rc)}"}, 500
+    # Still queued by paho, e.g. while the publisher reconnects.
+    return {"message": "Downlink message queued, the broker did not acknowledge it yet", "mid": delivery.mid}, 202
@@ -12,6 +12,8 @@
 # Implements:
 #    test(topic, message_bytes): returns true|false whether this decoder will handle message
 #    decode(topic, message_bytes): returns Python dictionary of original message + decoded_property.
+#    decode_many(payloads): decodes many payloads into columns, grouped by event.
+#    register_handler(event): decorator adding the handler of an event byte to EVENT_HANDLERS.
 #
 
 # This Python update from Javascript original:
@@ -21,12 +23,36 @@
 
 # pip install simplejson
 
-DEBUG = True
+# Debug output goes to the "static.py.radiobridgev3" logger at DEBUG level,
+# enable it with the 'logging' settings or at runtime from /log_level.
 
 import base64
+import logging
 import simplejson as json
 from datetime import datetime
 
+# NumPy is optional, decode_many() decodes the fixed-layout events column-wise with it
+# and falls back to decoding packet by packet without it. It is only imported by the first
+# decode_many() call (see load_numpy()), importing it takes longer than starting the app.
+np = None
+_numpy_loaded = False
+
+logger = logging.getLogger(__name__)
+
+
+def load_numpy():
+    # Import NumPy on first use, returns the module or None when it is not installed.
+    global np, _numpy_loaded
+    if not _numpy_loaded:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = None
+        _numpy_loaded = True
+    return np
+
+
 # General defines used in decode
 RESET_EVENT = 0x00
 SUPERVISORY_EVENT = 0x01
@@ -56,9 +82,136 @@ VIBRATION_LB_EVENT = 0x19
 VIBRATION_HB_EVENT = 0x1A
 DEVICE_INFO_EVENT = 0XFA
 
+# Handlers by event byte, filled by the register_handler decorators on the Decoder methods.
+# A handler is called as handler(decoder, payload_bytes) and returns the decoded dictionary or None.
+EVENT_HANDLERS = {}
+
+def register_handler(event):
+    # Decorator that makes the function the handler of an event byte, e.g. for a new device:
+    #
+    #    @register_handler(0x1B)
+    #    def handle_NEW_SENSOR(decoder, payload_bytes):
+    #        return {"event": "new_sensor", "value": payload_bytes[2]}
+    #
+    def decorator(handler):
+        EVENT_HANDLERS[event] = handler
+        return handler
+    return decorator
+
+# Every byte value mapped to its description, so a decode is a single index whatever the value.
+def byte_table(descriptions, default="undefined"):
+    if not isinstance(descriptions, dict):
+        descriptions = dict(enumerate(descriptions))
+    return tuple(descriptions.get(value, default) for value in range(256))
+
+DEVICE_TYPES = byte_table({
+    0x01: "Door/Window Sensor",
+    0x02: "Door/Window High Security",
+    0x03: "Contact Sensor",
+    0x04: "No-Probe Temperature Sensor",
+    0x05: "External-Probe Temperature Sensor",
+    0x06: "Single Push Button",
+    0x07: "Dual Push Button",
+    0x08: "Acceleration-Based Movement Sensor",
+    0x09: "Tilt Sensor",
+    0x0A: "Water Sensor",
+    0x0B: "Tank Level Float Sensor",
+    0x0C: "Glass Break Sensor",
+    0x0D: "Ambient Light Sensor",
+    0x0E: "Air Temperature and Humidity Sensor",
+    0x0F: "High-Precision Tilt Sensor",
+    0x10: "Ultrasonic Level Sensor",
+    0x11: "4-20mA Current Loop Sensor",
+    0x12: "Ext-Probe Air Temp and Humidity Sensor",
+    0x13: "Thermocouple Temperature Sensor",
+    0x14: "Voltage Sensor",
+    0x15: "Custom Sensor",
+    0x16: "GPS",
+    0x17: "Honeywell 5800 Bridge",
+    0x18: "Magnetometer",
+    0x19: "Vibration Sensor - Low Frequency",
+    0x1A: "Vibration Sensor - High Frequency",
+}, "Device Undefined")
+
+# 01 and 02 used on two button, 03 is single button, 12 when both buttons pressed on two button
+BUTTON_IDS = byte_table({0x01: "button_1", 0x02: "button_2", 0x03: "button_1", 0x12: "button_1&2"})
+BUTTON_STATES = byte_table(("pressed", "released", "held"))
+
+THRESHOLD_EVENTS = ("periodic_report", "above_threshold", "below_threshold", "change_increase", "change_decrease")
+TEMPERATURE_EVENTS = byte_table(THRESHOLD_EVENTS)
+SENSOR420MA_EVENTS = byte_table(THRESHOLD_EVENTS)
+THERMOCOUPLE_EVENTS = byte_table(THRESHOLD_EVENTS, "Undefined")
+VOLTMETER_EVENTS = byte_table(THRESHOLD_EVENTS, "Undefined")
+
+TILT_EVENTS = byte_table(("transition_vertical", "transition_horizontal", "change_vertical", "change_horizontal"))
+
+ATH_EVENTS = byte_table((
+    "periodic_report",
+    "temperature_above_threshold",
+    "temperature_below_threshold",
+    "temperature_change_increase",
+    "temperature_change_decrease",
+    "humidity_above_threshold",
+    "humidity_below_threshold",
+    "humidity_change_increase",
+    "humidity_change_decrease",
+))
+
+TILT_HP_EVENTS = byte_table((
+    "periodic_report",
+    "toward_0_vertical",
+    "away_0_vertical",
+    "change_toward_0_vertical",
+    "change_away_0_vertical",
+))
+
+ULTRASONIC_EVENTS = byte_table((
+    "periodic_report",
+    "distance_above_threshold",
+    "distance_below_threshold",
+    "change_increase",
+    "change_decrease",
+))
+
+HONEYWELL5800_EVENTS = byte_table(("status_code", "error_Code", "sensor_data_payload"))
+
+VIBRATION_LB_EVENTS = byte_table({
+    0: "periodic_report",
+    4: "x_above_threshold",
+    5: "x_above_threshold",
+    6: "y_above_threshold",
+    7: "y_below_threshold",
+    8: "z_above_threshold",
+    9: "z_above_threshold",
+    11: "excess_g_force",
+})
+
+VIBRATION_HB_EVENTS = byte_table({1: "periodic_report", 2: "above_threshold", 3: "below_threshold", 10: "excess_g_force"})
+
+# x.y versions with x in the upper nibble and y in the lower nibble
+NIBBLE_VERSIONS = tuple(str((value >> 4) & 0x0f) + "." + str(value & 0x0f) for value in range(256))
+BATTERY_LEVELS = tuple(float(version) for version in NIBBLE_VERSIONS)
+
+# thermocouple fault bits, from the most significant bit down
+THERMOCOUPLE_FAULT_BITS = (
+    ", Fault: The cold-Junction temperature is outside of the normal operating range",
+    ", Fault: The hot junction temperature is outside of the normal operating range",
+    ", Fault: The cold-Junction temperature is at or above than the cold-junction temperature high threshold",
+    ", Fault: The Cold-Junction temperature is lower than the cold-junction temperature low threshold",
+    ", Fault: The thermocouple temperature is too high",
+    ", Fault: Thermocouple temperature is too low",
+    ", Fault: The input voltage is negative or greater than VDD",
+    ", Fault: An open circuit such as broken thermocouple wires has been detected",
+)
+
+# fault message of every value of the fault byte
+THERMOCOUPLE_FAULTS = tuple(
+    "".join(message for bit, message in enumerate(THERMOCOUPLE_FAULT_BITS) if (faults >> (7 - bit)) & 0x01)
+    for faults in range(256))
+
 class Decoder(object):
     def __init__(self,settings=None):
-        print("    RadioBridge init()")
+        logger.debug("RadioBridge init()")
 
         self.name = "radiobridge"
 
@@ -71,18 +224,15 @@ class Decoder(object):
 
     def test(self, topic, message_bytes):
 
-        if DEBUG:
-            print("RadioBridge test() {} {}".format(topic, message_bytes))
+        logger.debug("RadioBridge test() %s %s", topic, message_bytes)
         #regular topic format:
         #csn-radiobridge/devices/<acp_id>/up
 
         if topic.startswith("v3/") and "/rad-" in topic:  #check if decoder name appears in the topic
-            if DEBUG:
-                print("RadioBridge test() success")
+            logger.debug("RadioBridge test() success")
             return True
 
-        if DEBUG:
-            print("RadioBridge test() fail")
+        logger.debug("RadioBridge test() fail")
         return False
 
 
@@ -90,13 +240,11 @@ class Decoder(object):
         # First lets set a flag for which version of TTN we're dealing with
         ttn_version = 3 if topic.startswith("v3/") else 2
 
-        if DEBUG:
-            print("RadioBridge decode() {}".format(message_bytes))
+        logger.debug("RadioBridge decode() %s", message_bytes)
 
         inc_msg=str(message_bytes,'utf-8')
 
-        if DEBUG:
-            print("RadioBridge decode str {}".format(inc_msg))
+        logger.debug("RadioBridge decode str %s", inc_msg)
 
         msg_dict = json.loads(inc_msg)
 
@@ -112,31 +260,27 @@ class Decoder(object):
         if len(type_array) >= 3:
             msg_dict["acp_type_id"] = type_array[0]+"-"+type_array[1]
 
-        if DEBUG:
-            print("\nRadioBridge decode() DECODED:\n")
+        logger.debug("RadioBridge decode() DECODED")
 
         if ttn_version==2:
             rawb64 = msg_dict["payload_raw"]
         else:
             rawb64 = msg_dict["uplink_message"]["frm_payload"]
 
-        if DEBUG:
-            print("RadioBridge decode() rawb64 {}".format(rawb64))
+        logger.debug("RadioBridge decode() rawb64 %s", rawb64)
 
         try:
             decoded_payload = self.decodePayload(msg_dict, self.b64toBytes(rawb64))
             if decoded_payload is not None:
                 msg_dict[self.decoded_property] = decoded_payload
-            if DEBUG:
-                print("RadioBridge decode() decoded {}".format(decoded_payload))
+            logger.debug("RadioBridge decode() decoded %s", decoded_payload)
         except Exception as e:
             # DecoderManager will add acp_ts using server time
-            print("RadioBridge decodePayload() {} exception {}".format(type(e), e))
+            logger.warning("RadioBridge decodePayload() %s exception %s", type(e), e)
             msg_dict["ERROR"] = "acp_decoder RadioBridge decodePayload exception"
             return msg_dict
 
-        if DEBUG:
-            print("RadioBridge decode() acp_id {}".format(msg_dict["acp_id"]))
+        logger.debug("RadioBridge decode() acp_id %s", msg_dict["acp_id"])
 
         # extract timestamp
         try:
@@ -152,79 +296,65 @@ class Decoder(object):
             msg_dict["acp_ts"] = acp_ts
         except Exception as e:
             # DecoderManager will add acp_ts using server time
-            print("RadioBridge decode() timestamp {} exception {}".format(type(e), e))
+            logger.warning("RadioBridge decode() timestamp %s exception %s", type(e), e)
 
-        if DEBUG:
-            print("\nRadioBridge decode() FINITO: {} {}\n".format(msg_dict["acp_id"], msg_dict["acp_ts"]))
+        logger.debug("RadioBridge decode() FINITO: %s %s", msg_dict["acp_id"], msg_dict.get("acp_ts"))
 
         return msg_dict
 
+    # Decode many payloads at once, e.g. to backfill the history or re-decode a capture.
+    # Returns the decoded values as columns grouped by event name:
+    #    {"supervisory": {"index": [0, 7, ...], "battery_level": [3.0, 2.9, ...], ...}, ...}
+    # where "index" is the position of each packet in payloads. A field missing from a packet is None
+    # in its column, packets that cannot be decoded are left out.
+    # With NumPy the fixed-layout events in COLUMN_DECODERS are decoded column-wise, the result is the
+    # same either way.
+    def decode_many(self, payloads, vectorized=None):
+        if vectorized is not False:
+            vectorized = load_numpy() is not None
+
+        results = {}
+        groups = {}
+        for index, payload_bytes in enumerate(payloads):
+            if vectorized and len(payload_bytes) >= 2 and payload_bytes[1] in COLUMN_DECODERS:
+                size = COLUMN_DECODERS[payload_bytes[1]][1]
+                if len(payload_bytes) >= size:
+                    groups.setdefault(payload_bytes[1], []).append(index)
+                    continue
+            try:
+                decoded = self.decodePayload(None, payload_bytes)
+            except Exception as e:
+                logger.debug("RadioBridge decode_many() packet %s %s exception %s", index, type(e), e)
+                continue
+            if decoded is not None:
+                add_row(results.setdefault(decoded["event"], {"index": []}), index, decoded)
+
+        for event, indexes in groups.items():
+            name, size, decode_columns = COLUMN_DECODERS[event]
+            rows = np.frombuffer(b"".join(bytes(payloads[index][:size]) for index in indexes), dtype=np.uint8)
+            rows = rows.reshape(-1, size).astype(np.int64)
+            columns = decode_columns(rows)
+            columns["packet_count"] = (rows[:, 0] & 0x0f).tolist()
+            columns["protocol_version"] = ((rows[:, 0] >> 4) & 0x0f).tolist()
+            merge_columns(results.setdefault(name, {"index": []}), indexes, columns)
+
+        return results
+
     # Here we decode the original 'payload' from the RadioBridge sensor that was
     # provided in the "payload_raw" property of the message from TTN
     def decodePayload(self, msg_dict, payload_bytes):
 
-        if DEBUG:
-            print("data ",payload_bytes," len ",len(payload_bytes))
+        logger.debug("data %s len %s", payload_bytes, len(payload_bytes))
 
         # the event type is defined in the second byte
-        event = payload_bytes[1]
-
-        if event == RESET_EVENT:
-            decoded = self.handle_RESET(payload_bytes)
-        elif event == SUPERVISORY_EVENT:
-            decoded = self.handle_SUPERVISORY(payload_bytes)
-        elif event == TAMPER_EVENT:
-            decoded = self.handle_TAMPER(payload_bytes)
-        elif event == LINK_QUALITY_EVENT:
-            decoded = self.handle_LINK_QUALITY(payload_bytes)
-        elif event == RATE_LIMIT_EXCEEDED_EVENT:
-            decoded = self.handle_RATE_LIMIT_EXCEEDED(payload_bytes)
-        elif event == TEST_MESSAGE_EVENT:
-            decoded = self.handle_TEST_MESSAGE(payload_bytes)
-        elif event == DOWNLINK_ACK_EVENT:
-            decoded = self.handle_DOWNLINK_ACK(payload_bytes)
-        elif event == DOOR_WINDOW_EVENT:
-            decoded = self.handle_DOOR_WINDOW(payload_bytes)
-        elif event == PUSH_BUTTON_EVENT:
-            decoded = self.handle_PUSH_BUTTON(payload_bytes)
-        elif event == CONTACT_EVENT:
-            decoded = self.handle_CONTACT(payload_bytes)
-        elif event == WATER_EVENT:
-            decoded = self.handle_WATER(payload_bytes)
-        elif event == TEMPERATURE_EVENT:
-            decoded = self.handle_TEMPERATURE(payload_bytes)
-        elif event == TILT_EVENT:
-            decoded = self.handle_TILT(payload_bytes)
-        elif event == ATH_EVENT:
-            decoded = self.handle_ATH(payload_bytes)
-        elif event == ABM_EVENT:
-            decoded = self.handle_ABM(payload_bytes)
-        elif event == TILT_HP_EVENT:
-            decoded = self.handle_TILT_HP(payload_bytes)
-        elif event == ULTRASONIC_EVENT:
-            decoded = self.handle_ULTRASOVIBRATION_HBNIC(payload_bytes)
-        # elif event == SENSOR420MA_EVIBRATION_HBVENT:
-        #     decoded = self.handle_SENSOR420MA(payload_bytes)
-        elif event == THERMOCOUPLE_EVENT:
-            decoded = self.handle_THERMOCOUPLE(payload_bytes)
-        elif event == VOLTMETER_EVENT:
-            decoded = self.handle_VOLTMETER(payload_bytes)
-        elif event == CUSTOM_SENSOR_EVENT:
-            decoded = self.handle_CUSTOM_SENSOR(payload_bytes)
-        elif event == GPS_EVENT:
-            decoded = self.handle_GPS(payload_bytes)
-        elif event == HONEYWELL5800_EVENT:
-            decoded = self.handle_HONEYWELL5800(payload_bytes)
-        elif event == MAGNETOMETER_EVENT:
-            decoded = self.handle_MAGNETOMETER(payload_bytes)
-        elif event == VIBRATION_LB_EVENT:
-            decoded = self.handle_VIBRATION_LB(payload_bytes)
-        elif event == VIBRATION_HB_EVENT:
-            decoded = self.handle_VIBRATION_HB(payload_bytes)
-        elif event == DEVICE_INFO_EVENT:
-            decoded = self.handle_DEVICE_INFO(payload_bytes)
-        else:
+        handler = EVENT_HANDLERS.get(payload_bytes[1])
+        if handler is None:
             return None
+
+        decoded = handler(self, payload_bytes)
+        if decoded is None:
+            return None
+
         # add packet counter and protocol version to the end of the decode
         # The first byte contains the protocol version (upper nibble) and packet counter (lower nibble)
         PacketCounter = payload_bytes[0] & 0x0f
@@ -236,74 +366,22 @@ class Decoder(object):
         return decoded
 
     # ==================    RESET EVENT    ====================
+    @register_handler(RESET_EVENT)
     def handle_RESET(self, payload_bytes):
 
         decoded = {}
         decoded["event"] = "reset"
 
-        # third byte is device type, convert to hex format for case statement
+        # third byte is device type
         DeviceTypeByte = payload_bytes[2]
 
-        # device types are enumerated below
-        if DeviceTypeByte == 0x01 :
-                DeviceType = "Door/Window Sensor"
-        elif DeviceTypeByte == 0x02 :
-                DeviceType = "Door/Window High Security"
-        elif DeviceTypeByte == 0x03 :
-                DeviceType = "Contact Sensor"
-        elif DeviceTypeByte == 0x04 :
-                DeviceType = "No-Probe Temperature Sensor"
-        elif DeviceTypeByte == 0x05 :
-                DeviceType = "External-Probe Temperature Sensor"
-        elif DeviceTypeByte == 0x06 :
-                DeviceType = "Single Push Button"
-        elif DeviceTypeByte == 0x07 :
-                DeviceType = "Dual Push Button"
-        elif DeviceTypeByte == 0x08 :
-                DeviceType = "Acceleration-Based Movement Sensor"
-        elif DeviceTypeByte == 0x09 :
-                DeviceType = "Tilt Sensor"
-        elif DeviceTypeByte == 0x0A :
-                DeviceType = "Water Sensor"
-        elif DeviceTypeByte == 0x0B :
-                DeviceType = "Tank Level Float Sensor"
-        elif DeviceTypeByte == 0x0C :
-                DeviceType = "Glass Break Sensor"
-        elif DeviceTypeByte == 0x0D :
-                DeviceType = "Ambient Light Sensor"
-        elif DeviceTypeByte == 0x0E :
-                DeviceType = "Air Temperature and Humidity Sensor"
-        elif DeviceTypeByte == 0x0F :
-                DeviceType = "High-Precision Tilt Sensor"
-        elif DeviceTypeByte == 0x10 :
-                DeviceType = "Ultrasonic Level Sensor"
-        elif DeviceTypeByte == 0x11 :
-                DeviceType = "4-20mA Current Loop Sensor"
-        elif DeviceTypeByte == 0x12 :
-                DeviceType = "Ext-Probe Air Temp and Humidity Sensor"
-        elif DeviceTypeByte == 0x13 :
-                DeviceType = "Thermocouple Temperature Sensor"
-        elif DeviceTypeByte == 0x14 :
-                DeviceType = "Voltage Sensor"
-        elif DeviceTypeByte == 0x15 :
-                DeviceType = "Custom Sensor"
-        elif DeviceTypeByte == 0x16 :
-                DeviceType = "GPS"
-        elif DeviceTypeByte == 0x17 :
-                DeviceType = "Honeywell 5800 Bridge"
-        elif DeviceTypeByte == 0x18 :
-                DeviceType = "Magnetometer"
-        elif DeviceTypeByte == 0x19 :
-                DeviceType = "Vibration Sensor - Low Frequency"
-        elif DeviceTypeByte == 0x1A :
-                DeviceType = "Vibration Sensor - High Frequency"
-        else:
-                DeviceType = "Device Undefined"
+        # device types are enumerated in DEVICE_TYPES
+        DeviceType = DEVICE_TYPES[DeviceTypeByte]
 
         decoded["device_type"] = DeviceType
 
         # the hardware version has the major version in the upper nibble, and the minor version in the lower nibble
-        HardwareVersion = str((payload_bytes[3] >> 4) & 0x0f) + "." + str(payload_bytes[3] & 0x0f)
+        HardwareVersion = NIBBLE_VERSIONS[payload_bytes[3]]
 
         decoded["hardware_version"] = HardwareVersion
 
@@ -323,6 +401,7 @@ class Decoder(object):
         return decoded
 
     # ================   SUPERVISORY EVENT   ==================
+    @register_handler(SUPERVISORY_EVENT)
     def handle_SUPERVISORY(self, payload_bytes):
         decoded = {}
         decoded["event"] = "supervisory"
@@ -338,9 +417,9 @@ class Decoder(object):
         # 00 04: Event Accoumulation Count
 
         # battery voltage is in the format x.y volts where x is upper nibble and y is lower nibble
-        BatteryLevel = str((payload_bytes[4] >> 4) & 0x0f) + "." + str(payload_bytes[4] & 0x0f)
+        BatteryLevel = BATTERY_LEVELS[payload_bytes[4]]
 
-        decoded["battery_level"]= float(BatteryLevel)
+        decoded["battery_level"]= BatteryLevel
 
         # the accumulation count is a 16-bit value
         AccumulationCount = (payload_bytes[9] * 256) + payload_bytes[10]
@@ -365,6 +444,7 @@ class Decoder(object):
         return decoded
 
     # ==================   TAMPER EVENT    ====================
+    @register_handler(TAMPER_EVENT)
     def handle_TAMPER(self, payload_bytes):
         decoded = {}
         decoded["event"] = "tamper"
@@ -375,11 +455,12 @@ class Decoder(object):
         if (TamperState == 0):
             decoded["tamper_state"] = "open"
         else:
-            decoded["tamper_start"] = "closed"
+            decoded["tamper_state"] = "closed"
 
         return decoded
 
     # ==================   LINK QUALITY EVENT    ====================
+    @register_handler(LINK_QUALITY_EVENT)
     def handle_LINK_QUALITY(self, payload_bytes):
         decoded = {}
         decoded["event"] = "link_quality"
@@ -396,6 +477,7 @@ class Decoder(object):
         return decoded
 
     # ==================   RATE LIMIT EXCEEDED EVENT    ====================
+    @register_handler(RATE_LIMIT_EXCEEDED_EVENT)
     def handle_RATE_LIMIT_EXCEEDED(self, payload_bytes):
         decoded = {}
         # this feature is depreciated so it is not decoded here
@@ -404,6 +486,7 @@ class Decoder(object):
         return decoded
 
     # ==================   TEST MESSAGE EVENT    ====================
+    @register_handler(TEST_MESSAGE_EVENT)
     def handle_TEST_MESSAGE(self, payload_bytes):
         decoded = {}
         # this feature is depreciated so it is not decoded here
@@ -412,6 +495,7 @@ class Decoder(object):
         return decoded
 
     # ================  DOOR/WINDOW EVENT  ====================
+    @register_handler(DOOR_WINDOW_EVENT)
     def handle_DOOR_WINDOW(self, payload_bytes):
         decoded = {}
         decoded["event"] = "door_window"
@@ -427,44 +511,27 @@ class Decoder(object):
         return decoded
 
     # ===============  PUSH BUTTON EVENT   ===================
+    @register_handler(PUSH_BUTTON_EVENT)
     def handle_PUSH_BUTTON(self, payload_bytes):
         decoded = {}
         decoded["event"] = "push_button"
 
         ButtonID = payload_bytes[2]
 
-        # 01 and 02 used on two button
-        if ButtonID ==  0x01:
-            ButtonReference = "button_1"
-        elif ButtonID == 0x02 :
-            ButtonReference = "button_2"
-        # 03 is single button
-        elif ButtonID == 0x03 :
-            ButtonReference = "button_1"
-        # 12 when both buttons pressed on two button
-        elif ButtonID == 0x12 :
-            ButtonReference = "button_1&2"
-        else:
-            ButtonReference = "undefined"
+        ButtonReference = BUTTON_IDS[ButtonID]
 
         decoded["button_id"] = ButtonReference
 
         ButtonState = payload_bytes[3]
 
-        if ButtonState == 0 :
-            SensorStateDescription = "pressed"
-        elif ButtonState == 1:
-            SensorStateDescription = "released"
-        elif ButtonState ==  2:
-            SensorStateDescription = "held"
-        else:
-            SensorStateDescription = "undefined"
+        SensorStateDescription = BUTTON_STATES[ButtonState]
 
         decoded["button_state"] = SensorStateDescription
 
         return decoded
 
     # =================   CONTACT EVENT   =====================
+    @register_handler(CONTACT_EVENT)
     def handle_CONTACT(self, payload_bytes):
         decoded = {}
         decoded["event"] = "contact"
@@ -482,6 +549,7 @@ class Decoder(object):
         return decoded
 
     # ===================  WATER EVENT  =======================
+    @register_handler(WATER_EVENT)
     def handle_WATER(self, payload_bytes):
         decoded = {}
         decoded["event"] = "water"
@@ -500,24 +568,14 @@ class Decoder(object):
         return decoded
 
     # ================== TEMPERATURE EVENT ====================
+    @register_handler(TEMPERATURE_EVENT)
     def handle_TEMPERATURE(self, payload_bytes):
         decoded = {}
         decoded["event"] = "temperature"
 
         TemperatureEvent = payload_bytes[2]
 
-        if TemperatureEvent == 0:
-            TemperatureEventDescription = "periodic_report"
-        elif TemperatureEvent == 1:
-            TemperatureEventDescription = "above_threshold"
-        elif TemperatureEvent == 2:
-            TemperatureEventDescription = "below_threshold"
-        elif TemperatureEvent == 3:
-            TemperatureEventDescription = "change_increase"
-        elif TemperatureEvent == 4:
-            TemperatureEventDescription = "change_decrease"
-        else:
-            TemperatureEventDescription = "undefined"
+        TemperatureEventDescription = TEMPERATURE_EVENTS[TemperatureEvent]
 
         decoded["temperature_event"] = TemperatureEventDescription
 
@@ -532,22 +590,14 @@ class Decoder(object):
         return decoded
 
     # ====================  TILT EVENT  =======================
+    @register_handler(TILT_EVENT)
     def handle_TILT(self, payload_bytes):
         decoded = {}
         decoded["event"] = "tilt"
 
         TiltEvent = payload_bytes[2]
 
-        if TiltEvent == 0:
-            TiltEventDescription = "transition_vertical"
-        elif TiltEvent == 1:
-            TiltEventDescription = "transition_horizontal"
-        elif TiltEvent == 2:
-            TiltEventDescription = "change_vertical"
-        elif TiltEvent == 3:
-            TiltEventDescription = "change_horizontal"
-        else:
-            TiltEventDescription = "undefined"
+        TiltEventDescription = TILT_EVENTS[TiltEvent]
 
         decoded["tilt_event"] = TiltEventDescription
 
@@ -558,32 +608,14 @@ class Decoder(object):
         return decoded
 
     # =============  AIR TEMP & HUMIDITY EVENT  ===============
+    @register_handler(ATH_EVENT)
     def handle_ATH(self, payload_bytes):
         decoded = {}
         decoded["event"] = "air_temperature_humidity"
 
         ATHEvent = payload_bytes[2]
 
-        if ATHEvent == 0:
-            ATHDescription = "periodic_report"
-        elif ATHEvent == 1:
-            ATHDescription = "temperature_above_threshold"
-        elif ATHEvent == 2:
-            ATHDescription = "temperature_below_threshold"
-        elif ATHEvent == 3:
-            ATHDescription = "temperature_change_increase"
-        elif ATHEvent == 4:
-            ATHDescription = "temperature_change_decrease"
-        elif ATHEvent == 5:
-            ATHDescription = "humidity_above_threshold"
-        elif ATHEvent == 6:
-            ATHDescription = "humidity_below_threshold"
-        elif ATHEvent == 7:
-            ATHDescription = "humidity_change_increase"
-        elif ATHEvent == 8:
-            ATHDescription = "humidity_change_decrease"
-        else:
-            ATHDescription = "undefined"
+        ATHDescription = ATH_EVENTS[ATHEvent]
 
         decoded["ath_event"] = ATHDescription
 
@@ -608,6 +640,7 @@ class Decoder(object):
         return decoded
 
     # ============  ACCELERATION MOVEMENT EVENT  ==============
+    @register_handler(ABM_EVENT)
     def handle_ABM(self, payload_bytes):
         decoded = {}
         decoded["event"] = "acceleration"
@@ -624,24 +657,14 @@ class Decoder(object):
         return decoded
 
     # =============  HIGH-PRECISION TILT EVENT  ===============
+    @register_handler(TILT_HP_EVENT)
     def handle_TILT_HP(self, payload_bytes):
         decoded = {}
         decoded["event"] = "hp_tilt"
 
         TiltEvent = payload_bytes[2]
 
-        if TiltEvent == 0:
-            TiltEventDescription = "periodic_report"
-        elif TiltEvent == 1:
-            TiltEventDescription = "toward_0_vertical"
-        elif TiltEvent == 2:
-            TiltEventDescription = "away_0_vertical"
-        elif TiltEvent == 3:
-            TiltEventDescription = "change_toward_0_vertical"
-        elif TiltEvent == 4:
-            TiltEventDescription = "change_away_0_vertical"
-        else:
-            TiltEventDescription = "undefined"
+        TiltEventDescription = TILT_HP_EVENTS[TiltEvent]
 
         decoded["tilt_hp_event"] = TiltEventDescription
 
@@ -655,6 +678,7 @@ class Decoder(object):
         return decoded
 
     # ===============  ULTRASONIC LEVEL EVENT  ================
+    @register_handler(ULTRASONIC_EVENT)
     def handle_ULTRASONIC(self, payload_bytes):
 
         decoded = {}
@@ -662,18 +686,7 @@ class Decoder(object):
 
         UltrasonicEvent = payload_bytes[2]
 
-        if UltrasonicEvent == 0:
-            UltrasonicEventDescription = "periodic_report"
-        elif UltrasonicEvent == 1:
-            UltrasonicEventDescription = "distance_above_threshold"
-        elif UltrasonicEvent == 2:
-            UltrasonicEventDescription = "distance_below_threshold"
-        elif UltrasonicEvent == 3:
-            UltrasonicEventDescription = "change_increase"
-        elif UltrasonicEvent == 4:
-            UltrasonicEventDescription = "change_decrease"
-        else:
-            UltrasonicEventDescription = "undefined"
+        UltrasonicEventDescription = ULTRASONIC_EVENTS[UltrasonicEvent]
 
         decoded["ultrasonic_event"] = UltrasonicEventDescription
 
@@ -684,6 +697,7 @@ class Decoder(object):
         return decoded
 
     # ================  4-20mA ANALOG EVENT  ==================
+    @register_handler(SENSOR420MA_EVENT)
     def handle_SENSOR420MA(self, payload_bytes):
 
         decoded = {}
@@ -691,18 +705,7 @@ class Decoder(object):
 
         Sensor420mAEvent = payload_bytes[2]
 
-        if Sensor420mAEvent == 0:
-            Sensor420mAEventDescription = "periodic_report"
-        elif Sensor420mAEvent == 1:
-            Sensor420mAEventDescription = "above_threshold"
-        elif Sensor420mAEvent == 2:
-            Sensor420mAEventDescription = "below_threshold"
-        elif Sensor420mAEvent == 3:
-            Sensor420mAEventDescription = "change_increase"
-        elif Sensor420mAEvent == 4:
-            Sensor420mAEventDescription = "change_decrease"
-        else:
-            Sensor420mAEventDescription = "undefined"
+        Sensor420mAEventDescription = SENSOR420MA_EVENTS[Sensor420mAEvent]
 
         decoded["sensor420ma_event"] = Sensor420mAEventDescription
 
@@ -714,6 +717,7 @@ class Decoder(object):
         return decoded
 
     # =================  THERMOCOUPLE EVENT  ==================
+    @register_handler(THERMOCOUPLE_EVENT)
     def handle_THERMOCOUPLE(self, payload_bytes):
 
         decoded = {}
@@ -721,70 +725,25 @@ class Decoder(object):
 
         ThermocoupleEvent = payload_bytes[2]
 
-        if ThermocoupleEvent == 0:
-            ThermocoupleEventDescription = "periodic_report"
-        elif ThermocoupleEvent == 1:
-            ThermocoupleEventDescription = "above_threshold"
-        elif ThermocoupleEvent == 2:
-            ThermocoupleEventDescription = "below_threshold"
-        elif ThermocoupleEvent == 3:
-            ThermocoupleEventDescription = "change_increase"
-        elif ThermocoupleEvent == 4:
-            ThermocoupleEventDescription = "change_decrease"
-        else:
-            ThermocoupleEventDescription = "Undefined"
+        ThermocoupleEventDescription = THERMOCOUPLE_EVENTS[ThermocoupleEvent]
 
         decoded["thermocouple_event"] = ThermocoupleEventDescription
 
         # decode is across 16-bits
-        Temperature = parseInt(((payload_bytes[3] * 256) + payload_bytes[4]) / 16)
+        Temperature = int(((payload_bytes[3] * 256) + payload_bytes[4]) / 16)
 
         decoded["temperature"] = Temperature # "°C"
 
         Faults = payload_bytes[5]
 
-        # decode each bit in the fault byte
-        FaultColdOutsideRange = (Faults >> 7) & 0x01
-        FaultHotOutsideRange = (Faults >> 6) & 0x01
-        FaultColdAboveThresh = (Faults >> 5) & 0x01
-        FaultColdBelowThresh = (Faults >> 4) & 0x01
-        FaultTCTooHigh = (Faults >> 3) & 0x01
-        FaultTCTooLow = (Faults >> 2) & 0x01
-        FaultVoltageOutsideRange = (Faults >> 1) & 0x01
-        FaultOpenCircuit = Faults & 0x01
-
-        # Decode faults (return as string)
+        # Decode faults (return as string), every bit of the fault byte adds its message
         if Faults != 0 :
-            Message = ""
-            if (FaultColdOutsideRange):
-                Message += ", Fault: The cold-Junction temperature is outside of the normal operating range"
-
-            if (FaultHotOutsideRange):
-                Message += ", Fault: The hot junction temperature is outside of the normal operating range"
-
-            if (FaultColdAboveThresh):
-                Message += ", Fault: The cold-Junction temperature is at or above than the cold-junction temperature high threshold"
-
-            if (FaultColdBelowThresh):
-                Message += ", Fault: The Cold-Junction temperature is lower than the cold-junction temperature low threshold"
-
-            if (FaultTCTooHigh):
-                Message += ", Fault: The thermocouple temperature is too high"
-
-            if (FaultTCTooLow):
-                Message += ", Fault: Thermocouple temperature is too low"
-
-            if (FaultVoltageOutsideRange):
-                Message += ", Fault: The input voltage is negative or greater than VDD"
-
-            if (FaultOpenCircuit):
-                Message += ", Fault: An open circuit such as broken thermocouple wires has been detected"
-
-            decoded["faults"] = Message
+            decoded["faults"] = THERMOCOUPLE_FAULTS[Faults]
 
         return decoded
 
     # ================  VOLTMETER ANALOG EVENT  ==================
+    @register_handler(VOLTMETER_EVENT)
     def handle_VOLTMETER(self, payload_bytes):
 
         decoded = {}
@@ -792,18 +751,7 @@ class Decoder(object):
 
         VoltmeterEvent = payload_bytes[2]
 
-        if VoltmeterEvent == 0:
-                VoltmeterEventDescription = "periodic_report"
-        elif VoltmeterEvent == 1:
-                VoltmeterEventDescription = "above_threshold"
-        elif VoltmeterEvent == 2:
-                VoltmeterEventDescription = "below_threshold"
-        elif VoltmeterEvent == 3:
-                VoltmeterEventDescription = "change_increase"
-        elif VoltmeterEvent == 4:
-                VoltmeterEventDescription = "change_decrease"
-        else:
-                VoltmeterEventDescription = "Undefined"
+        VoltmeterEventDescription = VOLTMETER_EVENTS[VoltmeterEvent]
 
         decoded["voltmeter_event"] = VoltmeterEventDescription
 
@@ -815,6 +763,7 @@ class Decoder(object):
         return decoded
 
     # ================  CUSTOM SENSOR EVENT  ==================
+    @register_handler(CUSTOM_SENSOR_EVENT)
     def handle_CUSTOM_SENSOR(self, payload_bytes):
 
         decoded = {}
@@ -825,6 +774,7 @@ class Decoder(object):
         return decoded
 
     # ================  GPS EVENT  ==================
+    @register_handler(GPS_EVENT)
     def handle_GPS(self, payload_bytes):
 
         decoded = {}
@@ -843,9 +793,9 @@ class Decoder(object):
 
         decoded["gps_status"] = GPSValidFixDescription
 
-        # latitude and longitude calculated across 32 bits each, show 12 decimal places
-        Latitude = (((payload_bytes[3] * (2 ^ 24)) + (payload_bytes[4] * (2 ^ 16)) + (payload_bytes[5] * (2 ^ 8)) + payload_bytes[6]) / (10 ^ 7))
-        Latitude = (((payload_bytes[7] * (2 ^ 24)) + (payload_bytes[8] * (2 ^ 16)) + (payload_bytes[9] * (2 ^ 8)) + payload_bytes[10]) / (10 ^ 7))
+        # latitude and longitude are signed 32-bit values in units of 10^-7 degrees
+        Latitude = int.from_bytes(bytes(payload_bytes[3:7]), "big", signed=True) / 10 ** 7
+        Longitude = int.from_bytes(bytes(payload_bytes[7:11]), "big", signed=True) / 10 ** 7
 
         decoded["acp_lat"] = Latitude
         decoded["acp_lng"] = Longitude
@@ -854,26 +804,20 @@ class Decoder(object):
 
 
     # ================  HONEYWELL 5800 EVENT  ==================
+    @register_handler(HONEYWELL5800_EVENT)
     def handle_HONEYWELL5800(self, payload_bytes):
 
         decoded = {}
         decoded["event"] = "honeywell5800"
 
         # honeywell sensor ID, 24-bits
-        HWSensorID = (payload_bytes[2] * (2 ^ 16)) + (payload_bytes[3] * (2 ^ 8)) + payload_bytes[4]
+        HWSensorID = (payload_bytes[2] << 16) + (payload_bytes[3] << 8) + payload_bytes[4]
 
         decoded["hw_sensor_id"] = HWSensorID
 
         HWEvent = payload_bytes[5]
 
-        if HWEvent == 0:
-            HWEventDescription = "status_code"
-        elif HWEvent == 1:
-            HWEventDescription = "error_Code"
-        elif HWEvent == 2:
-            HWEventDescription = "sensor_data_payload"
-        else:
-            HWEventDescription = "undefined"
+        HWEventDescription = HONEYWELL5800_EVENTS[HWEvent]
 
         decoded["honeywell5800_event"] = HWEventDescription
 
@@ -885,6 +829,7 @@ class Decoder(object):
         return decoded
 
     # ================  MAGNETOMETER EVENT  ==================
+    @register_handler(MAGNETOMETER_EVENT)
     def handle_MAGNETOMETER(self, payload_bytes):
 
         # TBD
@@ -893,6 +838,7 @@ class Decoder(object):
 
 
     # ================  VIBRATION LOW BANDWIDTH EVENT  ==================
+    @register_handler(VIBRATION_LB_EVENT)
     def handle_VIBRATION_LB(self, payload_bytes):
 
         decoded = {}
@@ -900,24 +846,7 @@ class Decoder(object):
 
         VibeEvent = payload_bytes[2]
 
-        if VibeEvent == 0:
-            VibeEventDescription = "periodic_report"
-        elif VibeEvent == 4:
-            VibeEventDescription = "x_above_threshold"
-        elif VibeEvent == 5:
-            VibeEventDescription = "x_above_threshold"
-        elif VibeEvent == 6:
-            VibeEventDescription = "y_above_threshold"
-        elif VibeEvent == 7:
-            VibeEventDescription = "y_below_threshold"
-        elif VibeEvent == 8:
-            VibeEventDescription = "z_above_threshold"
-        elif VibeEvent == 9:
-            VibeEventDescription = "z_above_threshold"
-        elif VibeEvent == 11:
-            VibeEventDescription = "excess_g_force"
-        else:
-            VibeEventDescription = "undefined"
+        VibeEventDescription = VIBRATION_LB_EVENTS[VibeEvent]
 
         decoded["vibration_lb_event"] = VibeEventDescription
 
@@ -938,6 +867,7 @@ class Decoder(object):
         return decoded
 
     # ================  VIBRATION HIGH BANDWIDTH EVENT  ==================
+    @register_handler(VIBRATION_HB_EVENT)
     def handle_VIBRATION_HB(self, payload_bytes):
 
         decoded = {}
@@ -945,16 +875,7 @@ class Decoder(object):
 
         VibeEvent = payload_bytes[2]
 
-        if VibeEvent == 1:
-            VibeEventDescription = "periodic_report"
-        elif VibeEvent == 2:
-            VibeEventDescription = "above_threshold"
-        elif VibeEvent == 3:
-            VibeEventDescription = "below_threshold"
-        elif VibeEvent == 10:
-            VibeEventDescription = "excess_g_force"
-        else:
-            VibeEventDescription = "undefined"
+        VibeEventDescription = VIBRATION_HB_EVENTS[VibeEvent]
 
         decoded["vibration_hb_event"] = VibeEventDescription
 
@@ -972,6 +893,7 @@ class Decoder(object):
 
 
     # ==================   DOWNLINK EVENT  ====================
+    @register_handler(DOWNLINK_ACK_EVENT)
     def handle_DOWNLINK_ACK(self, payload_bytes):
 
         decoded = {}
@@ -1009,8 +931,7 @@ class Decoder(object):
         return base64.b64decode(b64).hex()
 
     def b64toBytes(self,b64):
-        if DEBUG:
-            print("b64toBytes")
+        logger.debug("b64toBytes")
         return base64.b64decode(b64)
 
     # used for some temperatures as 2's Compliment byte
@@ -1020,6 +941,7 @@ class Decoder(object):
         return number
     
     # ==================   DEVICE INFO EVENT  ====================
+    @register_handler(DEVICE_INFO_EVENT)
     def handle_DEVICE_INFO(self, payload_bytes):
          
         decoded = {}
@@ -1050,3 +972,100 @@ class Decoder(object):
         return decoded
 
 
+# ================  BATCH DECODE  ==================
+# Used by Decoder.decode_many() to build the columns of each event.
+
+def add_row(columns, index, decoded):
+    count = len(columns["index"])
+    columns["index"].append(index)
+    for key, value in decoded.items():
+        if key == "event":
+            continue
+        column = columns.get(key)
+        if column is None:
+            column = columns[key] = [None] * count
+        column.append(value)
+    for column in columns.values():
+        if len(column) == count:
+            column.append(None)
+
+def merge_columns(columns, indexes, new_columns):
+    count = len(columns["index"])
+    columns["index"].extend(indexes)
+    for key, values in new_columns.items():
+        column = columns.get(key)
+        if column is None:
+            column = columns[key] = [None] * count
+        column.extend(values)
+    for column in columns.values():
+        if len(column) == count:
+            column.extend([None] * len(indexes))
+
+def describe(table, column):
+    return [table[value] for value in column.tolist()]
+
+def signed_bytes(column):
+    return np.where(column > 127, column - 256, column)
+
+# The functions below take the payloads of one event as rows of int64 bytes and return the same
+# values as the handler of that event, one list per field (packet_count and protocol_version are
+# added by decode_many).
+
+def supervisory_columns(rows):
+    errors = rows[:, 2]
+    return {
+        "battery_level": np.array(BATTERY_LEVELS)[rows[:, 4]].tolist(),
+        "accumulation_count": (rows[:, 9] * 256 + rows[:, 10]).tolist(),
+        "tamper_reset": ((errors >> 4) & 0x01).tolist(),
+        "tamper_current": ((errors >> 3) & 0x01).tolist(),
+        "downlink_error": ((errors >> 2) & 0x01).tolist(),
+        "battery_low": ((errors >> 1) & 0x01).tolist(),
+        "radio_error": (errors & 0x01).tolist(),
+    }
+
+def link_quality_columns(rows):
+    return {
+        "sub_band": rows[:, 2].tolist(),
+        "rssi": rows[:, 3].tolist(),
+        "snr": rows[:, 4].tolist(),
+    }
+
+def ath_columns(rows):
+    # if msb of digits byte is '1', treat as zero except whole number is negative
+    digits = rows[:, 3]
+    sign = np.where(digits > 127, -1, 1)
+    return {
+        "ath_event": describe(ATH_EVENTS, rows[:, 2]),
+        "temperature": (sign * ((digits & 0x7f) + (rows[:, 4] >> 4) / 10)).tolist(),
+        "humidity": (rows[:, 5] + (rows[:, 6] >> 4) / 10).tolist(),
+    }
+
+def tilt_hp_columns(rows):
+    return {
+        "tilt_hp_event": describe(TILT_HP_EVENTS, rows[:, 2]),
+        "angle": (rows[:, 3] + rows[:, 4] / 10).tolist(),
+        "temperature": signed_bytes(rows[:, 5]).tolist(),
+    }
+
+def thermocouple_columns(rows):
+    return {
+        "thermocouple_event": describe(THERMOCOUPLE_EVENTS, rows[:, 2]),
+        "temperature": ((rows[:, 3] * 256 + rows[:, 4]) >> 4).tolist(),
+        "faults": [THERMOCOUPLE_FAULTS[faults] if faults else None for faults in rows[:, 5].tolist()],
+    }
+
+def voltmeter_columns(rows):
+    return {
+        "voltmeter_event": describe(VOLTMETER_EVENTS, rows[:, 2]),
+        "volts": ((rows[:, 3] * 256 + rows[:, 4]) / 100).tolist(),
+    }
+
+# event byte: (event name, payload length, column decoder)
+COLUMN_DECODERS = {
+    SUPERVISORY_EVENT: ("supervisory", 11, supervisory_columns),
+    LINK_QUALITY_EVENT: ("link_quality", 5, link_quality_columns),
+    ATH_EVENT: ("air_temperature_humidity", 7, ath_columns),
+    TILT_HP_EVENT: ("hp_tilt", 6, tilt_hp_columns),
+    THERMOCOUPLE_EVENT: ("thermocouple", 6, thermocouple_columns),
+    VOLTMETER_EVENT: ("voltmeter", 5, voltmeter_columns),
+}
@@ -0,0 +1,168 @@
+"""
+This file contains the Replay class which plays a message capture back through the live ingest pipeline.
+Every captured uplink is submitted again as the raw MQTT payload the gateway sent, so it is decoded,
+stored and streamed to the pages like a live message. Replayed messages are marked as such: they never
+complete the downlinks of a campaign and are only written to the history with the 'history' record_replays
+setting. The capture is played at
+its recorded pace, N times faster or as fast as the workers go, and a report with the throughput and the
+latency of every pipeline stage is made at the end, which makes it a load test without sensors.
+This file is used by backend.py and can be run on its own:
+
+    python -m static.py.replay capture.json [--speed N | --fast] [--limit N]
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+IDLE = 'idle'
+RUNNING = 'running'
+STOPPED = 'stopped'
+FINISHED = 'finished'
+
+
+def uplink_payload(record):
+    """
+    Return the raw MQTT payload of a captured MessageRecord, without the fields the dashboard added,
+    or None when the record is not a JSON message.
+    """
+    if record.type != 'json':
+        return None
+    data = record.data(decode=False)
+    if not isinstance(data, dict):
+        return None
+    data.pop('data_decoded', None)
+    data.pop('current_time', None)
+    return json.dumps(data).encode()
+
+
+class Replay:
+    """
+    Replay of a list of MessageRecords through an IngestPipeline.
+
+    speed is the replay speed: 1 keeps the recorded time between the messages, N plays N times faster and
+    0 plays as fast as possible. At speed 0 the replay waits for room in the ingest queue, otherwise
+    messages are dropped when the queue is full, like live messages.
+    """
+
+    def __init__(self, messages, pipeline, speed=1.0):
+        self.messages = messages
+        self.pipeline = pipeline
+        self.speed = float(speed)
+        self.state = IDLE
+        self.sent = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.report = None
+        self._started = None
+        self._finished = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Run the replay on a background thread.
+        """
+        self.state = RUNNING
+        self._thread = threading.Thread(target=self.run, name='replay', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """
+        Play the capture, wait until the pipeline processed it and return the report.
+        """
+        self.state = RUNNING
+        self._started = time.monotonic()
+        self.pipeline.reset_latency()
+        before = self.pipeline.stats()
+        first_ts = None
+
+        for record in self.messages:
+            if self._stop.is_set():
+                break
+            payload = uplink_payload(record)
+            if payload is None:
+                self.skipped += 1
+                continue
+
+            if self.speed > 0 and record.ts is not None:
+                if first_ts is None:
+                    first_ts = record.ts
+                delay = self._started + (record.ts - first_ts) / self.speed - time.monotonic()
+                if delay > 0 and self._stop.wait(delay):
+                    break
+
+            if self.pipeline.submit(record.topic, payload, time.time(), block=self.speed <= 0, replayed=True):
+                self.sent += 1
+            else:
+                self.dropped += 1
+
+        self.pipeline.join()
+        self._finished = time.monotonic()
+        elapsed = self._finished - self._started
+        after = self.pipeline.stats()
+        processed = after['processed'] - before['processed']
+
+        self.report = {
+            'messages': len(self.messages),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+            'processed': processed,
+            'errors': after['errors'] - before['errors'],
+            'duration_s': round(elapsed, 3),
+            'throughput_per_s': round(processed / elapsed, 1) if elapsed > 0 else None,
+            'max_queue_depth': after['max_queue_depth'],
+            'latency': after['latency'],
+        }
+        self.state = STOPPED if self._stop.is_set() else FINISHED
+        logger.info("Replay %s: %s", self.state, self.report)
+        return self.report
+
+    def status(self):
+        return {
+            'state': self.state,
+            'speed': self.speed,
+            'messages': len(self.messages),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+            'elapsed_s': round((self._finished or time.monotonic()) - self._started, 3) if self._started else 0,
+            'report': self.report,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a message capture through the ingest pipeline.')
+    parser.add_argument('capture', help='JSON array or NDJSON capture, e.g. from /dump_messages')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed, 1 keeps the recorded pace')
+    parser.add_argument('--fast', action='store_true', help='replay as fast as possible')
+    parser.add_argument('--limit', type=int, default=1000000, help='most messages read from the capture')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    from static.py.capture_import import import_capture
+    from static.py.mqtt_utils import create_ingest
+
+    with open(args.capture, 'rb') as file:
+        capture = import_capture(file, args.capture, capacity=args.limit)
+    messages = list(capture.store.snapshot())
+
+    replay = Replay(messages, create_ingest(), 0 if args.fast else args.speed)
+    print(json.dumps(replay.run(), indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+This file contains the SearchIndex class used by MessageStore to answer the free text /messages?filter= query.
+The tokens of every message are computed once when it is stored and kept in an inverted index, so a query
+only scans the (small) token vocabulary instead of stringifying every field of every buffered message.
+This file is used by message_store.py.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+# Token groups. A filter matches a message when the whole filter is a substring of its topic or type,
+# or when the deveui part of the filter is a substring of its deveui, a decoded value or its hh:mm time.
+TOPIC = 'topic'
+VALUE = 'value'
+
+
+def message_tokens(message):
+    """
+    Return (topic, topic_tokens, value_tokens) for a buffered MessageRecord, all lowercase.
+    topic_tokens are the topic segments and the message type, value_tokens the deveui,
+    the decoded values and the hh:mm receive time.
+    """
+    topic = message.topic.lower()
+    topic_tokens = set(topic.split('/'))
+    topic_tokens.add(message.type.lower())
+
+    value_tokens = set()
+    if message.type == 'json' and message.layout is not None:
+        if isinstance(message.deveui, str):
+            value_tokens.add(message.deveui.lower())
+        if message.decoded_values is not None:
+            value_tokens.update(str(value).lower() for value in message.decoded_values)
+        if message.ts is not None:
+            value_tokens.add(message.hhmm)
+
+    return topic, frozenset(topic_tokens), frozenset(value_tokens)
+
+
+class SearchIndex:
+    """
+    Inverted index token -> sequence numbers, maintained alongside the store eviction.
+    Not thread safe: MessageStore calls it while holding its lock.
+    """
+
+    def __init__(self):
+        self._postings = {TOPIC: {}, VALUE: {}}
+        self._entries = {}
+        # Tokens containing a query, per (group, query). Only valid while the vocabulary is unchanged.
+        self._matches = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, seq, message):
+        topic, topic_tokens, value_tokens = message_tokens(message)
+        self._entries[seq] = (topic, topic_tokens, value_tokens)
+        self._post(TOPIC, topic_tokens, seq)
+        self._post(VALUE, value_tokens, seq)
+
+    def remove(self, seq):
+        entry = self._entries.pop(seq, None)
+        if entry is None:
+            return
+        self._unpost(TOPIC, entry[1], seq)
+        self._unpost(VALUE, entry[2], seq)
+
+    def search(self, filter_type, deveui_filter):
+        """
+        Return the set of sequence numbers matching the lowercase filter, or None when every message matches.
+        """
+        if not filter_type or not deveui_filter:
+            # An empty string is a substring of everything.
+            return None
+
+        result = self._search_topic(filter_type)
+        result.update(self._postings_containing(VALUE, deveui_filter))
+        return result
+
+    def _search_topic(self, query):
+        if '/' not in query:
+            return self._postings_containing(TOPIC, query)
+
+        # The query spans topic segments: look up its longest segment, then check the whole
+        # query against the topic of those candidates only.
+        pieces = [piece for piece in query.split('/') if piece]
+        if pieces:
+            candidates = self._postings_containing(TOPIC, max(pieces, key=len))
+        else:
+            candidates = self._entries
+        return {seq for seq in candidates if query in self._entries[seq][0]}
+
+    def _postings_containing(self, group, query):
+        key = (group, query)
+        tokens = self._matches.get(key)
+        postings = self._postings[group]
+        if tokens is None:
+            if len(self._matches) >= 256:
+                self._matches.clear()
+            tokens = self._matches[key] = tuple(token for token in postings if query in token)
+        result = set()
+        for token in tokens:
+            result.update(postings[token])
+        return result
+
+    def _post(self, group, tokens, seq):
+        postings = self._postings[group]
+        for token in tokens:
+            seqs = postings.get(token)
+            if seqs is None:
+                seqs = postings[token] = set()
+                self._matches.clear()
+            seqs.add(seq)
+
+    def _unpost(self, group, tokens, seq):
+        postings = self._postings[group]
+        for token in tokens:
+            seqs = postings.get(token)
+            if seqs is None:
+                continue
+            seqs.discard(seq)
+            if not seqs:
+                del postings[token]
+                self._matches.clear()
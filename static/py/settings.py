@@ -0,0 +1,148 @@
+"""
+This file loads the application settings.
+Settings are read once from dashboard.cfg.json in the mPower CONFIG_DIR (./config when running locally).
+Every section and key is optional, missing ones use the DEFAULTS below.
+See config/DASHBOARD_CFG_README.md for the description of each setting.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import copy
+import json
+import logging
+import os
+
+CONFIG_DIR = os.environ.get('CONFIG_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'config'))
+CONFIG_FILE = os.path.join(CONFIG_DIR, 'dashboard.cfg.json')
+
+DEFAULTS = {
+    'buffer': {
+        'capacity': 150,
+        'max_bytes': 0,
+        'policy': 'fifo',
+        'device_quota': 0,
+        'priority_events': ['tamper', 'water'],
+    },
+    'ingest': {
+        'workers': 1,
+        'queue_size': 1000,
+        'lazy_decode': False,
+    },
+    'history': {
+        'enabled': True,
+        'directory': None,
+        'segment_bytes': 1048576,
+        'max_bytes': 20971520,
+        'max_age_days': 7,
+        'batch_size': 50,
+        'flush_interval': 2.0,
+        'fsync': 'interval',
+        'fsync_interval': 30.0,
+        'max_pending': 10000,
+        'reload_messages': 150,
+        'record_replays': False,
+    },
+    'decoder_cache': {
+        'capacity': 1024,
+    },
+    'downlink': {
+        'qos': 1,
+        'timeout': 5.0,
+        'share_connection': False,
+        'keepalive': 60,
+        'max_inflight': 20,
+        'max_queued': 1000,
+    },
+    'campaign': {
+        'rate': 1.0,
+        'concurrency': 10,
+        'device_interval': 60,
+        'ack_timeout': 900,
+        'retries': 2,
+        'keep_finished': 20,
+    },
+    'gateway_api': {
+        'host': '127.0.0.1',
+        'port': None,
+        'scheme': 'http',
+        'login_scheme': 'https',
+        'timeout': 10.0,
+        'pool_size': 4,
+    },
+    'auth_cache': {
+        'ttl': 300,
+        'max_entries': 256,
+    },
+    'startup': {
+        'discovery_timeout': 3.0,
+    },
+    'serving': {
+        'ingest_process': False,
+        'workers': 2,
+        'threads': 8,
+        'run_dir': None,
+        'ring_slots': 1024,
+        'slot_size': 4096,
+        'poll_interval': 0.05,
+        'rpc_timeout': 30.0,
+    },
+    'upload': {
+        'capacity': 10000,
+        'max_bytes': 0,
+    },
+    'logging': {
+        'level': 'INFO',
+        'levels': {
+            'werkzeug': 'WARNING',
+        },
+        'console': True,
+        'console_level': 'NOTSET',
+        'memory_records': 500,
+        'rate_limit_per_second': 5,
+        'rate_limit_burst': 20,
+    },
+}
+
+_settings = None
+
+
+def load_settings(path=CONFIG_FILE):
+    """
+    Read the settings file and merge it over the defaults.
+    A missing or invalid file gives the defaults.
+    """
+    settings = copy.deepcopy(DEFAULTS)
+    try:
+        with open(path) as file:
+            user_settings = json.load(file)
+    except FileNotFoundError:
+        return settings
+    except (OSError, ValueError) as e:
+        logging.getLogger(__name__).warning("Error reading %s, using the default settings: %s", path, e)
+        return settings
+
+    for section, values in user_settings.items():
+        if isinstance(values, dict) and isinstance(settings.get(section), dict):
+            settings[section].update(values)
+        else:
+            settings[section] = values
+    return settings
+
+
+def get_settings():
+    """
+    Return the settings, loading them on first use.
+    """
+    global _settings
+    if _settings is None:
+        _settings = load_settings()
+    return _settings
+
+
+def get_setting(section, key, default=None):
+    """
+    Return one setting, e.g. get_setting('ingest', 'workers').
+    """
+    return get_settings().get(section, {}).get(key, default)
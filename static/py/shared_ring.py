@@ -0,0 +1,217 @@
+"""
+This file contains the SharedRing class, a ring of fixed-size records in a memory-mapped file shared between processes.
+In the multi-process serving mode the ingest process writes every stored message into the ring and every web worker
+maps the same file read-only and copies the new records into its own message buffer, so all the workers serve the same
+messages without asking the ingest process. The file should live on a tmpfs (/dev/shm) so the ring never touches the
+flash. Readers take no lock: every slot is guarded by a seqlock-style version counter, so reading never waits for the
+writer and the writer never waits for a reader.
+This file is used by ingest_owner.py (writer) and backend.py (readers).
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import fcntl
+import mmap
+import os
+import random
+import struct
+import zlib
+
+MAGIC = b'MQRING02'
+# magic, slots, slot size, generation (random per writer), head (number of records ever written).
+HEADER = struct.Struct('<8sIIQQ')
+HEADER_SIZE = 64
+HEAD_OFFSET = 24
+# version (odd while the slot is being written), position (1-based, 0 for an empty slot), message seq,
+# record length, CRC-32 of the record.
+SLOT_HEADER = struct.Struct('<QQQII')
+VERSION = struct.Struct('<Q')
+# Reads of a slot retried while the writer is rewriting it, before the slot is taken as overwritten.
+READ_RETRIES = 100
+
+
+class SharedRing:
+    """
+    Ring of 'slots' records of at most slot_size - 32 bytes each.
+
+    The writer appends (seq, bytes) records; the n-th record ever appended has position n and lives in
+    slot n % slots until it is overwritten 'slots' records later. A reader remembers the last position
+    it read and read(position) returns the records after it, or tells how many it missed when it fell
+    more than 'slots' records behind. A new writer starts a new generation, so readers can tell the
+    positions started again.
+
+    The writer makes a slot's version odd, writes the record and makes the version even again, then
+    moves the head. A reader copies the slot and keeps the copy only when the version was even and the
+    same before and after and the CRC matches, otherwise it reads again. Only one writer may use a ring
+    path at a time, it holds an exclusive lock on path.lock for as long as it is open.
+
+    Use SharedRing.create() in the writer process and SharedRing.open() in the readers.
+    """
+
+    def __init__(self, path, fd, writable, lock_fd=None):
+        self.path = path
+        self._fd = fd
+        self._lock_fd = lock_fd
+        self.writable = writable
+        self._inode = os.fstat(fd).st_ino
+        size = os.fstat(fd).st_size
+        self._map = mmap.mmap(fd, size, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        magic, self.slots, self.slot_size, _, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or size != HEADER_SIZE + self.slots * self.slot_size:
+            self.close()
+            raise ValueError(f"{path} is not a shared message ring")
+        self.capacity = self.slot_size - SLOT_HEADER.size
+
+        self.written = 0
+        self.oversized = 0
+        self.retries = 0
+
+    @classmethod
+    def create(cls, path, slots=1024, slot_size=4096):
+        """
+        Create a new, empty ring file (replacing the one of a previous writer) and open it for writing.
+        Raises BlockingIOError when another writer has the ring open.
+        """
+        if slots < 1 or slot_size <= SLOT_HEADER.size:
+            raise ValueError(f"slots must be positive and slot_size larger than {SLOT_HEADER.size}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(lock_fd)
+            raise BlockingIOError(f"Another process writes the ring {path}")
+
+        # A new file, so readers still mapping the old one notice the inode changed instead of reading a
+        # file resized under them.
+        temp = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(temp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, HEADER_SIZE + slots * slot_size)
+            header = HEADER.pack(MAGIC, slots, slot_size, random.getrandbits(63) + 1, 0)
+            os.pwrite(fd, header, 0)
+            os.replace(temp, path)
+        except BaseException:
+            os.close(fd)
+            os.close(lock_fd)
+            raise
+        return cls(path, fd, writable=True, lock_fd=lock_fd)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open the ring of the writer for reading.
+        """
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            return cls(path, fd, writable=False)
+        except BaseException:
+            os.close(fd)
+            raise
+
+    @property
+    def generation(self):
+        return HEADER.unpack_from(self._map, 0)[3]
+
+    @property
+    def head(self):
+        """
+        Position of the newest record, 0 while the ring is empty.
+        """
+        # Read until two reads agree, a 64-bit value may be copied in two halves on a 32-bit CPU.
+        head = struct.unpack_from('<Q', self._map, HEAD_OFFSET)[0]
+        while True:
+            again = struct.unpack_from('<Q', self._map, HEAD_OFFSET)[0]
+            if again == head:
+                return head
+            head = again
+
+    def replaced(self):
+        """
+        True when a new writer created a new ring file at the path, the reader must open it again.
+        """
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return False
+
+    def append(self, seq, data):
+        """
+        Append one record and return its position. Raises ValueError when data does not fit in a slot.
+        Only the writer calls it, from one thread.
+        """
+        if len(data) > self.capacity:
+            self.oversized += 1
+            raise ValueError(f"record of {len(data)} bytes does not fit in a slot of {self.capacity} bytes")
+        position = struct.unpack_from('<Q', self._map, HEAD_OFFSET)[0] + 1
+        offset = self._offset(position)
+        version = VERSION.unpack_from(self._map, offset)[0]
+        VERSION.pack_into(self._map, offset, version + 1)
+        start = offset + SLOT_HEADER.size
+        self._map[start:start + len(data)] = data
+        SLOT_HEADER.pack_into(self._map, offset, version + 2, position, seq, len(data), zlib.crc32(data))
+        struct.pack_into('<Q', self._map, HEAD_OFFSET, position)
+        self.written += 1
+        return position
+
+    def read(self, after=0, limit=None):
+        """
+        Return (records, head, missed): the (position, seq, bytes) records after position 'after', oldest
+        first and at most limit of them, the newest position and the number of records after 'after'
+        already overwritten.
+        """
+        head = self.head
+        first = max(after + 1, head - self.slots + 1, 1)
+        missed = first - after - 1 if after < head else 0
+        last = head if limit is None else min(head, first + limit - 1)
+        records = []
+        for position in range(first, last + 1):
+            record = self._read_slot(position)
+            if record is None:
+                # Overwritten since head was read, the writer lapped this reader.
+                missed += 1
+                continue
+            records.append(record)
+        return records, head, missed
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        for fd in (self._fd, self._lock_fd):
+            if fd is not None:
+                os.close(fd)
+        self._fd = self._lock_fd = None
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'slots': self.slots,
+            'slot_size': self.slot_size,
+            'head': self.head,
+            'written': self.written,
+            'oversized': self.oversized,
+            'retries': self.retries,
+        }
+
+    def _read_slot(self, position):
+        """
+        Return (position, seq, bytes) of the record at position, None when the slot holds another one.
+        """
+        offset = self._offset(position)
+        start = offset + SLOT_HEADER.size
+        for _ in range(READ_RETRIES):
+            version, slot_position, seq, length, crc = SLOT_HEADER.unpack_from(self._map, offset)
+            if not version & 1:
+                data = self._map[start:start + min(length, self.capacity)]
+                if VERSION.unpack_from(self._map, offset)[0] == version and zlib.crc32(data) == crc:
+                    return (position, seq, data) if slot_position == position else None
+            self.retries += 1
+        return None
+
+    def _offset(self, position):
+        return HEADER_SIZE + (position % self.slots) * self.slot_size
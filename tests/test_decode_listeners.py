@@ -0,0 +1,67 @@
+"""
+Regression tests of the decode listeners: only the messages held by the message buffer update the
+device registry when they are decoded lazily, not the ones read back from the history.
+"""
+
+import shutil
+import tempfile
+import time
+import unittest
+
+from static.py import mqtt_utils
+from static.py.history_store import HistoryStore
+from static.py.message_record import MessageRecord
+
+# RadioBridge link quality and device info uplinks.
+LINK_QUALITY = 'HvsCtQc='
+DEVICE_INFO = 'HfoRAZMAAQEAAA=='
+
+
+def uplink(deveui, data, seq, decoder=None):
+    record = MessageRecord('json', f'lora/{deveui}/up', time.time(),
+                           {'deveui': deveui, 'data': data, 'data_decoded': None})
+    record.seq = seq
+    record.decoder = decoder
+    return record
+
+
+class HistoryReadDecodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.history = HistoryStore(self.directory, on_read=mqtt_utils.decode_later).open()
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.directory)
+
+    def test_paging_the_history_leaves_the_device_registry_unchanged(self):
+        deveui = '00-80-00-00-00-00-aa-01'
+        self.history.append(uplink(deveui, LINK_QUALITY, 1))
+        self.history.flush()
+        latest = uplink(deveui, DEVICE_INFO, 2)
+        latest.decode()
+        mqtt_utils.device_registry.update(latest)
+        before = mqtt_utils.device_registry.get(deveui)
+        options = mqtt_utils.device_registry.device_event_options()
+
+        page = self.history.read_before(10)
+        self.assertEqual([message.seq for message in page], [1])
+        self.assertEqual(page[0].to_dict()['data']['data_decoded']['event'], 'link_quality')
+
+        self.assertEqual(mqtt_utils.device_registry.get(deveui), before)
+        self.assertEqual(mqtt_utils.device_registry.device_event_options(), options)
+
+    def test_buffered_message_decoded_later_updates_its_device(self):
+        deveui = '00-80-00-00-00-00-aa-02'
+        message = uplink(deveui, LINK_QUALITY, 0, decoder=mqtt_utils.decode_cache.decode)
+        mqtt_utils.message_buffer.put(message)
+        mqtt_utils.device_registry.update(message)
+        self.assertEqual(mqtt_utils.device_registry.get(deveui)['events'], [])
+
+        message.decode()
+        self.assertEqual(mqtt_utils.device_registry.get(deveui)['events'], ['link_quality'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Tests of the uploaded captures in the multi-process serving mode: a capture uploaded through one web worker
+backend is paged and replayed through another one, and only one replay runs at a time.
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timezone
+
+from static.py.backend import LocalBackend, RemoteBackend, upload_dir
+from static.py.ingest_owner import rpc_handlers
+from static.py.ingest_rpc import RPCServer, rpc_address, write_authkey
+from static.py.settings import get_settings
+
+# RadioBridge link quality uplink.
+LINK_QUALITY = 'HvsCtQc='
+
+
+def capture(count, interval=60):
+    """
+    Return an NDJSON capture of count uplinks received interval seconds apart.
+    """
+    start = time.time() - count * interval
+    lines = []
+    for number in range(count):
+        deveui = f'00-80-00-00-00-00-bb-{number:02x}'
+        current_time = datetime.fromtimestamp(start + number * interval, timezone.utc).isoformat()
+        lines.append(json.dumps({'type': 'json', 'topic': f'lora/{deveui}/up',
+                                 'data': {'deveui': deveui, 'data': LINK_QUALITY, 'current_time': current_time}}))
+    return io.BytesIO('\n'.join(lines).encode())
+
+
+class UploadAcrossWorkersTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # The ingest process (its backend behind the RPC server) runs on a thread of the test process.
+        cls.run_dir = tempfile.mkdtemp()
+        cls.serving = dict(get_settings()['serving'])
+        get_settings()['serving']['run_dir'] = cls.run_dir
+        cls.owner = LocalBackend()
+        server = RPCServer(rpc_address(), write_authkey(), rpc_handlers(cls.owner, None))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        deadline = time.monotonic() + 5
+        while not os.path.exists(rpc_address()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    @classmethod
+    def tearDownClass(cls):
+        # The socket is removed by the listener when the test process exits.
+        for name in os.listdir(cls.run_dir):
+            path = os.path.join(cls.run_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif path != rpc_address():
+                os.remove(path)
+        get_settings()['serving'] = cls.serving
+
+    def setUp(self):
+        self.first = RemoteBackend()
+        self.second = RemoteBackend()
+
+    def tearDown(self):
+        self.owner.uploads.stop_replay()
+        self.first.close()
+        self.second.close()
+
+    def test_capture_uploaded_through_one_worker_is_paged_through_another(self):
+        stats = self.first.uploads.load(capture(5), 'capture.ndjson')
+        self.assertEqual(stats['imported'], 5)
+        self.assertEqual(os.listdir(upload_dir()), [])
+
+        messages, total, capture_stats = self.second.uploads.page(offset=0, limit=2)
+        self.assertEqual(total, 5)
+        self.assertEqual(capture_stats['filename'], 'capture.ndjson')
+        self.assertEqual([m['data']['deveui'] for m in messages],
+                         ['00-80-00-00-00-00-bb-04', '00-80-00-00-00-00-bb-03'])
+
+    def test_invalid_capture_is_rejected_through_the_worker(self):
+        with self.assertRaises(ValueError):
+            self.first.uploads.load(io.BytesIO(b'[{"topic": tru}]'), 'broken.json')
+        self.assertEqual(os.listdir(upload_dir()), [])
+
+    def test_one_replay_at_a_time_across_workers(self):
+        self.first.uploads.load(capture(3), 'capture.ndjson')
+
+        status, code = self.first.uploads.start_replay(1.0)
+        self.assertEqual(code, 200)
+        self.assertEqual(self.second.uploads.replay_status()['state'], 'running')
+        response, code = self.second.uploads.start_replay(1.0)
+        self.assertEqual(code, 409)
+
+        self.second.uploads.stop_replay()
+        deadline = time.monotonic() + 5
+        while self.first.uploads.replay_status()['state'] == 'running' and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.first.uploads.replay_status()['state'], 'stopped')
+
+        status, code = self.second.uploads.start_replay(0)
+        self.assertEqual(code, 200)
+        deadline = time.monotonic() + 5
+        while self.first.uploads.replay_status()['state'] == 'running' and time.monotonic() < deadline:
+            time.sleep(0.01)
+        report = self.first.uploads.replay_status()['report']
+        self.assertEqual((report['sent'], report['processed']), (3, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,20 @@
+"""
+This file is the WSGI entry point of the multi-process serving mode, used by gunicorn (see gunicorn.conf.py):
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Every gunicorn worker imports it and serves the Flask app of server.py with the remote backend: the MQTT ingest runs
+in the ingest process started by gunicorn.conf.py and the worker copies its messages from the shared ring.
+"""
+
+"""
+Importing the required libraries.
+"""
+
+import os
+
+os.environ.setdefault('DASHBOARD_BACKEND', 'remote')
+
+from server import app as application, backend
+
+backend.start()